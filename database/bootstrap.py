@@ -0,0 +1,74 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+from database.init_db import DB_PATH, init_database, insert_initial_data
+from database.migrations import latest_version
+
+# Bases de datos ya preparadas en este proceso
+_ready = set()
+_lock = threading.Lock()
+
+
+def ensure_database(db_path=DB_PATH):
+    """Crea, migra y siembra la base de datos una sola vez por proceso.
+
+    Las ejecuciones siguientes (cada rerun de Streamlit) no hacen nada. Si la
+    base ya está en la última versión del esquema solo cuesta una consulta
+    de lectura; si no, el primer proceso que obtiene el bloqueo de archivo la
+    inicializa y los demás esperan y la encuentran lista.
+    """
+    if db_path in _ready:
+        return
+
+    with _lock:
+        if db_path in _ready:
+            return
+
+        if not is_initialized(db_path):
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+            with _file_lock(db_path + '.lock'):
+                if not is_initialized(db_path):
+                    init_database(db_path)
+                    insert_initial_data(db_path)
+
+        _ready.add(db_path)
+
+
+def is_initialized(db_path=DB_PATH):
+    """Indica si la base existe, está en la última versión del esquema y tiene los datos iniciales"""
+    if not os.path.exists(db_path):
+        return False
+
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            version, configured = conn.execute('''
+                SELECT (SELECT MAX(version) FROM schema_version),
+                       (SELECT COUNT(*) FROM configuracion)
+            ''').fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:  # base vacía o sin las tablas de control
+        return False
+
+    return version == latest_version() and configured > 0
+
+
+@contextmanager
+def _file_lock(path):
+    """Bloqueo exclusivo entre procesos (varios workers arrancando a la vez)"""
+    with open(path, 'a') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
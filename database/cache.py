@@ -0,0 +1,119 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Caché en memoria cuyos valores caducan tras ``ttl`` segundos"""
+
+    def __init__(self, ttl=10):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Devuelve el valor vigente para ``key`` o None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if time.monotonic() >= expires_at:
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        """Guarda un valor con la vigencia configurada"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key=None):
+        """Descarta un valor, o todos si no se indica ``key``"""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+
+class QueryCache:
+    """Caché LRU de resultados de consultas con invalidación por tabla.
+
+    Cada entrada recuerda las tablas de las que depende; al escribir en una
+    tabla se descartan todas las entradas que la leen. El tamaño total se
+    limita por memoria aproximada (``max_bytes``) y cada entrada caduca tras
+    ``ttl`` segundos como red de seguridad frente a escrituras de otros procesos.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()   # clave -> (expira, tablas, tamaño, valor)
+        self._versions = {}             # tabla -> número de escrituras
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def snapshot(self, tables):
+        """Versión actual de las tablas, para detectar escrituras durante una consulta"""
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
+
+    def get(self, key):
+        """Devuelve ``(True, valor)`` si hay una entrada vigente, o ``(False, None)``"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if time.monotonic() >= entry[0]:
+                self._remove(key)
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[3]
+
+    def set(self, key, value, tables, snapshot):
+        """Guarda un resultado salvo que alguna de sus tablas haya cambiado desde ``snapshot``"""
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if tuple(self._versions.get(table, 0) for table in tables) != snapshot:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, frozenset(tables), size, value)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_tables(self, tables):
+        """Descarta las entradas que dependen de cualquiera de las tablas indicadas"""
+        tables = set(tables)
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            stale = [key for key, entry in self._entries.items() if entry[1] & tables]
+            for key in stale:
+                self._remove(key)
+
+    def clear(self):
+        """Vacía la caché"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._size -= entry[2]
+
+
+def estimate_size(value):
+    """Tamaño aproximado en bytes de un resultado de consulta"""
+    if hasattr(value, 'memory_usage'):  # DataFrame de pandas
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from queue import Queue, Empty
+
+from database.storage import connect
+
+# Parámetros por defecto del pool (se pueden ajustar por variables de entorno)
+DEFAULT_POOL_SIZE = int(os.environ.get('CLINICA_DB_POOL_SIZE', '5'))
+DEFAULT_MAX_AGE = float(os.environ.get('CLINICA_DB_POOL_MAX_AGE', '3600'))
+DEFAULT_MAX_USES = int(os.environ.get('CLINICA_DB_POOL_MAX_USES', '1000'))
+DEFAULT_TIMEOUT = float(os.environ.get('CLINICA_DB_POOL_TIMEOUT', '30'))
+
+
+class _PoolEntry:
+    """Conexión del pool junto con sus datos de reciclaje"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.uses = 0
+
+
+class ConnectionPool:
+    """Pool de conexiones SQLite de larga duración compartido por el proceso"""
+
+    def __init__(self, db_path, size=DEFAULT_POOL_SIZE, max_age=DEFAULT_MAX_AGE,
+                 max_uses=DEFAULT_MAX_USES, timeout=DEFAULT_TIMEOUT):
+        self.db_path = db_path
+        self.size = size
+        self.max_age = max_age
+        self.max_uses = max_uses
+        self.timeout = timeout
+
+        self._idle = Queue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._local = threading.local()
+
+    def _connect(self):
+        """Abre una conexión nueva con los PRAGMAs de almacenamiento aplicados"""
+        # Los PRAGMAs se aplican una sola vez por conexión, no en cada préstamo
+        return connect(self.db_path, timeout=self.timeout)
+
+    def _is_healthy(self, entry):
+        """Comprueba que la conexión siga siendo utilizable y no deba reciclarse"""
+        if time.monotonic() - entry.created_at > self.max_age:
+            return False
+        if entry.uses >= self.max_uses:
+            return False
+        try:
+            entry.conn.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, entry):
+        """Cierra una conexión y libera su lugar en el pool"""
+        try:
+            entry.conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def acquire(self):
+        """Obtiene una conexión del pool, creando una nueva si hay capacidad"""
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except Empty:
+                entry = None
+
+            if entry is None:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+
+                if can_create:
+                    try:
+                        entry = _PoolEntry(self._connect())
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                    entry.uses += 1
+                    return entry
+
+                # Pool lleno: esperar a que otro hilo devuelva una conexión
+                remaining = deadline - time.monotonic()
+                try:
+                    entry = self._idle.get(timeout=max(remaining, 0))
+                except Empty:
+                    raise sqlite3.OperationalError("No hay conexiones disponibles en el pool")
+
+            if self._is_healthy(entry):
+                entry.uses += 1
+                return entry
+            self._discard(entry)
+
+    def release(self, entry):
+        """Devuelve una conexión al pool"""
+        try:
+            if entry.conn.in_transaction:
+                entry.conn.rollback()
+        except sqlite3.Error:
+            self._discard(entry)
+            return
+        self._idle.put(entry)
+
+    @contextmanager
+    def connection(self):
+        """Context manager que presta una conexión.
+
+        Es reentrante por hilo: los bloques anidados reutilizan la misma conexión
+        y la transacción se confirma (o revierte) al salir del bloque exterior.
+        """
+        current = getattr(self._local, 'entry', None)
+        if current is not None:
+            self._local.depth += 1
+            try:
+                yield current.conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        entry = self.acquire()
+        self._local.entry = entry
+        self._local.depth = 1
+        try:
+            yield entry.conn
+            if entry.conn.in_transaction:
+                entry.conn.commit()
+        except BaseException:
+            if entry.conn.in_transaction:
+                entry.conn.rollback()
+            raise
+        finally:
+            self._local.entry = None
+            self._local.depth = 0
+            self.release(entry)
+
+    def close_all(self):
+        """Cierra todas las conexiones inactivas del pool"""
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except Empty:
+                break
+            self._discard(entry)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path, size=None):
+    """Devuelve el pool del proceso para una base de datos, creándolo si no existe"""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_path, size=size or DEFAULT_POOL_SIZE)
+            _pools[key] = pool
+        return pool
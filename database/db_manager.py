@@ -1,32 +1,211 @@
+import os
+import re
 import sqlite3
+import functools
+import time as time_module
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
-from datetime import datetime, date, time
+from datetime import datetime, date, timedelta, timezone
 import pandas as pd
+from database.connection_pool import get_pool
+from database.write_queue import get_write_queue
+from database.cache import TTLCache, QueryCache
+from database import sessions, passwords
+
+# Estadísticas del dashboard: se leen de los contadores y se guardan unos segundos
+_stats_cache = TTLCache(ttl=10)
+STATS_TABLES = {'pacientes', 'usuarios', 'citas', 'pagos'}
+
+# Resultados de consultas de lectura, compartidos por todas las sesiones del proceso
+_query_cache = QueryCache(
+    max_bytes=int(os.environ.get('CLINICA_QUERY_CACHE_MB', '64')) * 1024 * 1024,
+    ttl=int(os.environ.get('CLINICA_QUERY_CACHE_TTL', '300'))
+)
+
+# Verificaciones bcrypt fuera del hilo de Streamlit y con concurrencia acotada
+_bcrypt_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('CLINICA_BCRYPT_WORKERS', '2')),
+    thread_name_prefix='bcrypt'
+)
+
+def _check_password(password, stored_hash):
+    """Verifica una contraseña con bcrypt en el pool de hilos"""
+    return _bcrypt_executor.submit(
+        bcrypt.checkpw, password.encode('utf-8'), stored_hash.encode('utf-8')
+    ).result()
+
+def _copy_result(value):
+    """Copia un resultado cacheado para que el llamador pueda modificarlo sin afectar la caché"""
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, tuple):
+        return tuple(_copy_result(item) for item in value)
+    return value
+
+def cached_query(*tables):
+    """Cachea el resultado de un método de lectura según sus argumentos.
+
+    ``tables`` son las tablas que lee la consulta: cualquier escritura en ellas
+    (ver ``invalidates``) descarta el resultado.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            key = (self.db_path, func.__name__, args, tuple(sorted(kwargs.items())))
+            try:
+                hit, value = _query_cache.get(key)
+            except TypeError:  # argumentos no hashables: consultar sin caché
+                return func(self, *args, **kwargs)
+            if hit:
+                return _copy_result(value)
+            
+            snapshot = _query_cache.snapshot(tables)
+            value = func(self, *args, **kwargs)
+            _query_cache.set(key, value, tables, snapshot)
+            return _copy_result(value)
+        return wrapper
+    return decorator
+
+def invalidates(*tables):
+    """Marca un método de escritura: al terminar descarta las lecturas cacheadas de ``tables``"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                _query_cache.invalidate_tables(tables)
+                if STATS_TABLES.intersection(tables):
+                    _stats_cache.invalidate()
+        return wrapper
+    return decorator
+
+def _next_day(value):
+    """Devuelve el día siguiente (ISO) a una fecha dada como date o texto ISO"""
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return (value + timedelta(days=1)).isoformat()
+
+# Edad cumplida a una fecha (dos parámetros: la fecha de referencia); resta un año si aún no es el cumpleaños
+_AGE_SQL = (
+    "(strftime('%Y', ?) - strftime('%Y', fecha_nacimiento)"
+    " - (strftime('%m-%d', ?) < strftime('%m-%d', fecha_nacimiento)))"
+)
+
+# Agrupaciones de ``get_revenue``: nombre -> (expresión sobre ingresos_diarios i / usuarios u, columna)
+_REVENUE_DIMENSIONS = {
+    'dia': ("i.fecha", "fecha"),
+    'mes': ("substr(i.fecha, 1, 7)", "mes"),
+    'medico': ("u.nombre_completo", "medico_nombre"),
+    'metodo': ("i.metodo_pago", "metodo_pago"),
+}
+
+# Caracteres del motivo de consulta que se muestran en el resumen del historial
+TIMELINE_REASON_CHARS = 120
+
+# Períodos de ``get_appointment_trends``: expresión sobre citas_diarias.fecha
+_APPOINTMENT_PERIODS = {
+    'dia': "fecha",
+    'semana': "date(fecha, 'weekday 0', '-6 days')",
+    'mes': "substr(fecha, 1, 7)",
+}
+
+def _day_slots(config):
+    """Horarios de atención de un día según la configuración de la clínica (lista de ``datetime.time``)"""
+    config = config or {}
+    start = datetime.strptime(str(config.get('horario_inicio') or '08:00')[:5], '%H:%M')
+    end = datetime.strptime(str(config.get('horario_fin') or '18:00')[:5], '%H:%M')
+    step = timedelta(minutes=int(config.get('duracion_cita') or 30))
+    
+    slots = []
+    current = start
+    while current + step <= end:
+        slots.append(current.time())
+        current += step
+    return slots
+
+def _fts_query(search_term):
+    """Convierte un texto libre en una consulta FTS5 de prefijos (todas las palabras)"""
+    tokens = re.findall(r'\w+', search_term or '')
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+def _patient_search_condition(search_term, column="id"):
+    """Devuelve la condición SQL (y sus parámetros) que filtra pacientes por el índice FTS.
+
+    ``column`` es la columna con el ID del paciente (p. ej. ``c.paciente_id`` en una consulta de citas).
+    """
+    fts_query = _fts_query(search_term)
+    if fts_query is None:
+        return "0", []
+    return f"{column} IN (SELECT rowid FROM pacientes_fts WHERE pacientes_fts MATCH ?)", [fts_query]
 
 class DatabaseManager:
-    def __init__(self, db_path="database/clinica.db"):
+    def __init__(self, db_path="database/clinica.db", pool_size=None):
         self.db_path = db_path
+        self.pool = get_pool(db_path, size=pool_size)
+        self.writer = get_write_queue(db_path)
+    
+    def connection(self):
+        """Presta una conexión del pool.
+
+        Uso: ``with db.connection() as conn:``. Los bloques anidados en el mismo
+        hilo comparten conexión y transacción, de modo que varias operaciones
+        pueden agruparse sin abrir conexiones adicionales.
+        """
+        return self.pool.connection()
     
-    def get_connection(self):
-        return sqlite3.connect(self.db_path)
+    def iter_query(self, query, params=(), chunk_size=1000):
+        """Recorre el resultado de una consulta por bloques de hasta ``chunk_size`` filas.
+
+        Usa una conexión propia del pool (no la del hilo, que otras consultas
+        podrían confirmar o devolver mientras el generador sigue abierto) y la
+        devuelve, junto con el cursor, al terminar o si el generador se abandona.
+        """
+        entry = self.pool.acquire()
+        cursor = None
+        try:
+            cursor = entry.conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            if cursor is not None:
+                cursor.close()
+            self.pool.release(entry)
+    
+    def write(self, func, *args, **kwargs):
+        """Ejecuta ``func(conn, ...)`` en la cola de escritura serializada.
+
+        No debe llamarse dentro de un bloque ``connection()`` que ya haya
+        escrito: el escritor esperaría al bloqueo que ese bloque mantiene.
+        """
+        return self.writer.submit(func, *args, **kwargs)
     
     # MÉTODOS DE AUTENTICACIÓN
     def authenticate_user(self, username, password):
         """Autentica un usuario y devuelve sus datos si es válido"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, username, email, password_hash, rol, nombre_completo, especialidad, estado
-            FROM usuarios WHERE username = ?
-        ''', (username,))
-        
-        user = cursor.fetchone()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT id, username, email, password_hash, rol, nombre_completo, especialidad, estado,
+                       bcrypt_rounds
+                FROM usuarios WHERE username = ?
+            ''', (username,))
+            
+            user = cursor.fetchone()
         
         if user and user[7] == 'activo':  # Verificar que el usuario esté activo
-            stored_hash = user[3].encode('utf-8')
-            if bcrypt.checkpw(password.encode('utf-8'), stored_hash):
+            if _check_password(password, user[3]):
+                if passwords.needs_rehash(user[8]):
+                    # Actualizar el hash al factor de trabajo actual sin retrasar el inicio de sesión
+                    _bcrypt_executor.submit(self._rehash_password, user[0], password)
                 return {
                     'id': user[0],
                     'username': user[1],
@@ -38,105 +217,383 @@ class DatabaseManager:
                 }
         return None
     
+    @invalidates('usuarios')
+    def _rehash_password(self, usuario_id, password):
+        """Regenera el hash de un usuario con el factor de trabajo actual"""
+        password_hash = passwords.hash_password(password, passwords.BCRYPT_ROUNDS)
+        
+        def update(conn):
+            conn.execute(
+                "UPDATE usuarios SET password_hash = ?, bcrypt_rounds = ? WHERE id = ?",
+                (password_hash, passwords.BCRYPT_ROUNDS, usuario_id)
+            )
+        
+        self.write(update)
+    
+    @invalidates('usuarios')
     def create_user(self, username, email, password, rol, nombre_completo, especialidad=None):
         """Crea un nuevo usuario"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        password_hash = _bcrypt_executor.submit(passwords.hash_password, password).result()
         
-        try:
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        with self.connection() as conn:
+            cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO usuarios (username, email, password_hash, rol, nombre_completo, especialidad)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (username, email, password_hash, rol, nombre_completo, especialidad))
+                INSERT INTO usuarios (username, email, password_hash, rol, nombre_completo, especialidad,
+                                      bcrypt_rounds)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (username, email, password_hash, rol, nombre_completo, especialidad,
+                  passwords.BCRYPT_ROUNDS))
+            
+            return cursor.lastrowid
+    
+    @invalidates('usuarios')
+    def bulk_create_users(self, users, rounds=None, workers=None):
+        """Crea muchos usuarios en una sola transacción.
+
+        ``users`` es una lista de dicts con ``username``, ``email``, ``password``,
+        ``rol``, ``nombre_completo`` y opcionalmente ``especialidad``. Los hashes
+        se calculan en paralelo en un pool de procesos antes de abrir la
+        transacción. Los usuarios cuyo username o email ya existe se rechazan
+        sin abortar el lote. Devuelve ``(insertados, [(indice, username, error), ...])``.
+        """
+        rounds = rounds or passwords.BCRYPT_ROUNDS
+        
+        with self.connection() as conn:
+            taken_usernames = {row[0] for row in conn.execute("SELECT username FROM usuarios")}
+            taken_emails = {row[0] for row in conn.execute("SELECT email FROM usuarios")}
+        
+        accepted = []
+        accepted_indexes = []
+        rejected = []
+        for index, user in enumerate(users):
+            if user['username'] in taken_usernames:
+                rejected.append((index, user['username'], "El nombre de usuario ya existe"))
+            elif user['email'] in taken_emails:
+                rejected.append((index, user['username'], "El email ya está registrado"))
+            else:
+                taken_usernames.add(user['username'])
+                taken_emails.add(user['email'])
+                accepted.append(user)
+                accepted_indexes.append(index)
+        
+        hashes = passwords.hash_passwords([user['password'] for user in accepted], rounds, workers)
+        values = [
+            (user['username'], user['email'], password_hash, user['rol'], user['nombre_completo'],
+             user.get('especialidad'), rounds)
+            for user, password_hash in zip(accepted, hashes)
+        ]
+        
+        def insert(conn):
+            # Volver a comprobar dentro de la transacción por si otro usuario se creó mientras tanto
+            new_values = []
+            for index, row in zip(accepted_indexes, values):
+                exists = conn.execute(
+                    "SELECT 1 FROM usuarios WHERE username = ? OR email = ?", (row[0], row[1])
+                ).fetchone()
+                if exists:
+                    rejected.append((index, row[0], "El nombre de usuario o el email ya existen"))
+                else:
+                    new_values.append(row)
             
-            user_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-            return user_id
-        except sqlite3.IntegrityError as e:
-            conn.close()
-            raise e
+            conn.executemany('''
+                INSERT INTO usuarios (username, email, password_hash, rol, nombre_completo, especialidad,
+                                      bcrypt_rounds)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', new_values)
+            return len(new_values)
+        
+        inserted = self.write(insert)
+        return inserted, sorted(rejected)
     
+    @cached_query('usuarios')
     def get_users(self, rol=None):
         """Obtiene lista de usuarios, opcionalmente filtrada por rol"""
-        conn = self.get_connection()
-        
-        if rol:
-            query = "SELECT * FROM usuarios WHERE rol = ? AND estado = 'activo'"
-            df = pd.read_sql_query(query, conn, params=[rol])
-        else:
+        with self.connection() as conn:
+            if rol:
+                query = "SELECT * FROM usuarios WHERE rol = ? AND estado = 'activo'"
+                return pd.read_sql_query(query, conn, params=[rol])
+            
             query = "SELECT * FROM usuarios WHERE estado = 'activo'"
-            df = pd.read_sql_query(query, conn)
+            return pd.read_sql_query(query, conn)
+    
+    # MÉTODOS DE SESIONES
+    def create_session(self, usuario_id, ttl_hours=sessions.SESSION_TTL_HOURS):
+        """Crea una sesión persistente y devuelve su token firmado"""
+        token, expira = sessions.new_token(ttl_hours)
         
-        conn.close()
-        return df
+        def insert(conn):
+            # Aprovechar para purgar sesiones vencidas
+            conn.execute("DELETE FROM sesiones WHERE expira <= ?", (int(time_module.time()),))
+            conn.execute(
+                "INSERT INTO sesiones (token_hash, usuario_id, expira) VALUES (?, ?, ?)",
+                (sessions.token_hash(token), usuario_id, expira)
+            )
+        
+        self.write(insert)
+        return token
+    
+    def validate_session(self, token):
+        """Devuelve los datos del usuario de una sesión válida, o None.
+
+        La firma y la expiración se comprueban antes de consultar la base de
+        datos, de modo que un token inválido no cuesta ninguna consulta.
+        """
+        if not sessions.verify_token(token):
+            return None
+        
+        with self.connection() as conn:
+            cursor = conn.execute('''
+                SELECT u.id, u.username, u.email, u.rol, u.nombre_completo, u.especialidad, u.estado
+                FROM sesiones s
+                JOIN usuarios u ON s.usuario_id = u.id
+                WHERE s.token_hash = ? AND s.expira > ? AND u.estado = 'activo'
+            ''', (sessions.token_hash(token), int(time_module.time())))
+            user = cursor.fetchone()
+        
+        if user:
+            columns = ['id', 'username', 'email', 'rol', 'nombre_completo', 'especialidad', 'estado']
+            return dict(zip(columns, user))
+        return None
+    
+    def revoke_session(self, token):
+        """Elimina una sesión persistente"""
+        def delete(conn):
+            conn.execute("DELETE FROM sesiones WHERE token_hash = ?", (sessions.token_hash(token),))
+        
+        self.write(delete)
     
     # MÉTODOS DE PACIENTES
-    def create_patient(self, dni, nombre_completo, fecha_nacimiento, sexo, telefono=None, 
-                      direccion=None, email=None, grupo_sanguineo=None, alergias=None, 
+    @invalidates('pacientes')
+    def create_patient(self, dni, nombre_completo, fecha_nacimiento, sexo, telefono=None,
+                      direccion=None, email=None, grupo_sanguineo=None, alergias=None,
                       enfermedades_cronicas=None, usuario_id=None):
         """Crea un nuevo paciente"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        with self.connection() as conn:
+            cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO pacientes 
-                (dni, nombre_completo, fecha_nacimiento, sexo, telefono, direccion, 
+                INSERT INTO pacientes
+                (dni, nombre_completo, fecha_nacimiento, sexo, telefono, direccion,
                 email, grupo_sanguineo, alergias, enfermedades_cronicas, usuario_id)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (dni, nombre_completo, fecha_nacimiento, sexo, telefono, direccion,
                   email, grupo_sanguineo, alergias, enfermedades_cronicas, usuario_id))
             
-            patient_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-            return patient_id
-        except sqlite3.IntegrityError as e:
-            conn.close()
-            raise e
-    
-    def get_patients(self, search_term=None):
-        """Obtiene lista de pacientes con búsqueda opcional"""
-        conn = self.get_connection()
+            return cursor.lastrowid
+    
+    @invalidates('pacientes')
+    def bulk_create_patients(self, rows, import_key=None, last_row=None, invalid_rows=0):
+        """Inserta un lote de pacientes con executemany en una sola transacción.
+
+        ``rows`` es una lista de ``(numero_fila, datos)``. Las filas cuyo DNI ya
+        existe (en la base o antes en el lote) se rechazan sin abortar el lote.
+        Si se indica ``import_key`` se registra en la misma transacción el
+        avance de la importación hasta ``last_row``, de modo que una
+        importación interrumpida pueda reanudarse sin duplicar filas.
+        Devuelve ``(insertados, [(numero_fila, dni, error), ...])``.
+        """
+        columns = ['dni', 'nombre_completo', 'fecha_nacimiento', 'sexo', 'telefono', 'direccion',
+                   'email', 'grupo_sanguineo', 'alergias', 'enfermedades_cronicas']
+        
+        def insert(conn):
+            existing = set()
+            dnis = [data['dni'] for _, data in rows]
+            for i in range(0, len(dnis), 500):
+                chunk = dnis[i:i + 500]
+                placeholders = ', '.join('?' for _ in chunk)
+                existing.update(
+                    dni for (dni,) in conn.execute(f"SELECT dni FROM pacientes WHERE dni IN ({placeholders})", chunk)
+                )
+            
+            values = []
+            rejected = []
+            for row_number, data in rows:
+                if data['dni'] in existing:
+                    rejected.append((row_number, data['dni'], "Ya existe un paciente con este DNI"))
+                    continue
+                existing.add(data['dni'])
+                values.append(tuple(data.get(column) for column in columns))
+            
+            conn.executemany(f'''
+                INSERT INTO pacientes ({', '.join(columns)})
+                VALUES ({', '.join('?' for _ in columns)})
+            ''', values)
+            
+            if import_key:
+                conn.execute('''
+                    UPDATE importaciones
+                    SET filas_procesadas = ?, insertados = insertados + ?, errores = errores + ?,
+                        fecha_actualizacion = CURRENT_TIMESTAMP
+                    WHERE clave = ?
+                ''', (last_row, len(values), len(rejected) + invalid_rows, import_key))
+            
+            return len(values), rejected
+        
+        return self.write(insert)
+    
+    def start_import(self, import_key, archivo):
+        """Registra una importación (o recupera la existente) y devuelve su estado"""
+        def upsert(conn):
+            conn.execute(
+                "INSERT OR IGNORE INTO importaciones (clave, archivo) VALUES (?, ?)",
+                (import_key, archivo)
+            )
+        
+        self.write(upsert)
+        return self.get_import(import_key)
+    
+    def get_import(self, import_key):
+        """Obtiene el estado de una importación"""
+        with self.connection() as conn:
+            cursor = conn.execute('''
+                SELECT clave, archivo, filas_procesadas, insertados, errores, estado
+                FROM importaciones WHERE clave = ?
+            ''', (import_key,))
+            row = cursor.fetchone()
+        
+        if row:
+            columns = ['clave', 'archivo', 'filas_procesadas', 'insertados', 'errores', 'estado']
+            return dict(zip(columns, row))
+        return None
+    
+    def finish_import(self, import_key):
+        """Marca una importación como completada"""
+        def update(conn):
+            conn.execute('''
+                UPDATE importaciones SET estado = 'completada', fecha_actualizacion = CURRENT_TIMESTAMP
+                WHERE clave = ?
+            ''', (import_key,))
+        
+        self.write(update)
+    
+    @cached_query('pacientes')
+    def search_patients(self, search_term, limit=20):
+        """Busca pacientes activos por nombre, DNI, teléfono o email usando el índice FTS5.
+
+        Cada palabra se busca como prefijo y sin distinguir tildes; los
+        resultados se ordenan por relevancia (el nombre y el DNI pesan más).
+        """
+        fts_query = _fts_query(search_term)
+        if fts_query is None:
+            return pd.DataFrame()
+        
+        query = '''
+            SELECT p.*
+            FROM pacientes_fts f
+            JOIN pacientes p ON p.id = f.rowid
+            WHERE pacientes_fts MATCH ? AND p.estado = 'activo'
+            ORDER BY bm25(pacientes_fts, 10.0, 5.0, 1.0, 1.0), p.nombre_completo
+        '''
+        params = [fts_query]
+        
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        with self.connection() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+    
+    @cached_query('pacientes')
+    def get_patients_page(self, search_term=None, after=None, limit=10):
+        """Obtiene una página de pacientes activos ordenada por nombre.
+
+        Usa paginación por clave (keyset): ``after`` es la tupla
+        ``(nombre_completo, id)`` del último paciente de la página anterior,
+        o None para la primera. Devuelve ``(DataFrame de la página, total)``.
+        """
+        conditions = ["estado = 'activo'"]
+        params = []
         
         if search_term:
-            query = '''
-                SELECT * FROM pacientes 
-                WHERE (nombre_completo LIKE ? OR dni LIKE ?) AND estado = 'activo'
-                ORDER BY nombre_completo
-            '''
-            search_pattern = f"%{search_term}%"
-            df = pd.read_sql_query(query, conn, params=[search_pattern, search_pattern])
-        else:
-            query = "SELECT * FROM pacientes WHERE estado = 'activo' ORDER BY nombre_completo"
-            df = pd.read_sql_query(query, conn)
-        
-        conn.close()
-        return df
+            condition, condition_params = _patient_search_condition(search_term)
+            conditions.append(condition)
+            params.extend(condition_params)
+        
+        count_query = f"SELECT COUNT(*) FROM pacientes WHERE {' AND '.join(conditions)}"
+        count_params = list(params)
+        
+        if after:
+            conditions.append("(nombre_completo, id) > (?, ?)")
+            params.extend([after[0], int(after[1])])
+        
+        page_query = f'''
+            SELECT * FROM pacientes
+            WHERE {' AND '.join(conditions)}
+            ORDER BY nombre_completo, id
+            LIMIT ?
+        '''
+        params.append(limit)
+        
+        with self.connection() as conn:
+            total = conn.execute(count_query, count_params).fetchone()[0]
+            df = pd.read_sql_query(page_query, conn, params=params)
+        
+        return df, total
+    
+    def get_patient_summary(self, search_term=None, as_of=None):
+        """Calcula en SQL los totales y la edad promedio de los pacientes activos.
+
+        Las edades se calculan a la fecha ``as_of`` (hoy por defecto), que se
+        resuelve fuera de la caché para que forme parte de su clave.
+        """
+        return self._patient_summary(search_term, str(as_of or date.today()))
+    
+    @cached_query('pacientes')
+    def _patient_summary(self, search_term, as_of):
+        """``get_patient_summary`` para una fecha dada"""
+        query = f'''
+            SELECT COUNT(*) as total,
+                   AVG({_AGE_SQL}) as edad_promedio,
+                   COALESCE(SUM(sexo = 'M'), 0) as masculinos
+            FROM pacientes
+            WHERE estado = 'activo'
+        '''
+        params = [as_of, as_of]
+        
+        if search_term:
+            condition, condition_params = _patient_search_condition(search_term)
+            query += f" AND {condition}"
+            params.extend(condition_params)
+        
+        with self.connection() as conn:
+            total, edad_promedio, masculinos = conn.execute(query, params).fetchone()
+        
+        return {'total': total, 'edad_promedio': edad_promedio, 'masculinos': masculinos}
+    
+    def get_patient_demographics(self, as_of=None):
+        """Cuenta los pacientes activos por edad cumplida (a ``as_of``, hoy por defecto) y sexo"""
+        return self._patient_demographics(str(as_of or date.today()))
+    
+    @cached_query('pacientes')
+    def _patient_demographics(self, as_of):
+        """``get_patient_demographics`` para una fecha dada"""
+        query = f'''
+            SELECT {_AGE_SQL} as edad, sexo, COUNT(*) as total
+            FROM pacientes
+            WHERE estado = 'activo'
+            GROUP BY edad, sexo
+        '''
+        
+        with self.connection() as conn:
+            return pd.read_sql_query(query, conn, params=[as_of, as_of])
     
+    @cached_query('pacientes')
     def get_patient_by_id(self, patient_id):
         """Obtiene un paciente por ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM pacientes WHERE id = ?", (patient_id,))
-        patient = cursor.fetchone()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM pacientes WHERE id = ?", (patient_id,))
+            patient = cursor.fetchone()
         
         if patient:
-            columns = ['id', 'dni', 'nombre_completo', 'fecha_nacimiento', 'sexo', 
-                      'telefono', 'direccion', 'email', 'grupo_sanguineo', 'alergias', 
+            columns = ['id', 'dni', 'nombre_completo', 'fecha_nacimiento', 'sexo',
+                      'telefono', 'direccion', 'email', 'grupo_sanguineo', 'alergias',
                       'enfermedades_cronicas', 'estado', 'fecha_registro', 'usuario_id']
             return dict(zip(columns, patient))
         return None
     
+    @invalidates('pacientes')
     def update_patient(self, patient_id, **kwargs):
         """Actualiza un paciente"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         # Construir query dinámicamente
         fields = []
         values = []
@@ -148,31 +605,140 @@ class DatabaseManager:
         if fields:
             values.append(patient_id)
             query = f"UPDATE pacientes SET {', '.join(fields)} WHERE id = ?"
-            cursor.execute(query, values)
-            conn.commit()
-        
-        conn.close()
+            with self.connection() as conn:
+                conn.execute(query, values)
     
     # MÉTODOS DE CITAS
+    @invalidates('citas')
     def create_appointment(self, paciente_id, medico_id, fecha, hora, motivo=None, observaciones=None):
-        """Crea una nueva cita"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """Reserva una cita de forma atómica.
+
+        Devuelve el ID de la cita, o None si el médico ya tiene una cita activa
+        en ese horario (lo garantiza el índice único idx_citas_horario_unico,
+        también frente a reservas simultáneas).
+        """
+        # Mismo formato que el resto de las citas, para que el índice compare horas iguales
+        if len(hora) == 5:
+            hora += ':00'
+        
+        def insert(conn):
+            try:
+                cursor = conn.execute('''
+                    INSERT INTO citas (paciente_id, medico_id, fecha, hora, motivo, observaciones)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (paciente_id, medico_id, fecha, hora, motivo, observaciones))
+            except sqlite3.IntegrityError as e:
+                if 'citas.medico_id, citas.fecha, citas.hora' in str(e):
+                    return None
+                raise
+            return cursor.lastrowid
         
-        cursor.execute('''
-            INSERT INTO citas (paciente_id, medico_id, fecha, hora, motivo, observaciones)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (paciente_id, medico_id, fecha, hora, motivo, observaciones))
+        return self.write(insert)
+    
+    def get_free_slots(self, medico_id, fecha):
+        """Horarios libres de un médico en un día, según el horario y la duración de cita configurados.
+
+        Devuelve una lista de ``datetime.time``. Si ``fecha`` es hoy no se
+        incluyen los horarios que ya pasaron.
+        """
+        now = datetime.now()
+        slots = self._free_slots(medico_id, str(fecha))
+        if str(fecha) == now.date().isoformat():
+            # Fuera de la caché: la hora actual cambia aunque no cambien las citas
+            slots = [slot for slot in slots if slot > now.time()]
+        return slots
+    
+    @cached_query('citas', 'configuracion')
+    def _free_slots(self, medico_id, fecha):
+        """Todos los horarios libres de un médico en un día, sin descartar los ya pasados"""
+        slot_times = _day_slots(self.get_clinic_config())
+        
+        with self.connection() as conn:
+            cursor = conn.execute('''
+                SELECT hora FROM citas
+                WHERE medico_id = ? AND fecha = ? AND estado != 'cancelada'
+            ''', (medico_id, str(fecha)))
+            taken = {hora[:5] for (hora,) in cursor.fetchall()}
         
-        appointment_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return appointment_id
+        return [slot for slot in slot_times if slot.strftime('%H:%M') not in taken]
     
-    def get_appointments(self, date_filter=None, medico_id=None, estado=None):
-        """Obtiene lista de citas con filtros opcionales"""
-        conn = self.get_connection()
+    def find_first_available(self, especialidad=None, start_date=None, days=60, limit=10):
+        """Primeros ``limit`` horarios libres entre todos los médicos de una especialidad.
+
+        Recorre la ventana por tramos de una semana: cada tramo se lee con una
+        sola consulta por rango y la agenda de cada médico y día se representa
+        como un entero donde el bit ``i`` indica que el horario ``i`` está
+        ocupado. Se detiene en cuanto reúne ``limit`` horarios. Devuelve una
+        lista de dicts (``fecha``, ``hora``, ``medico_id``, ``medico_nombre``)
+        ordenada por fecha y hora.
+        """
+        # La hora actual (al minuto) forma parte de la clave de caché para no
+        # ofrecer horarios de hoy que ya pasaron
+        now = datetime.now().replace(second=0, microsecond=0)
+        start_date = str(start_date) if start_date else now.date().isoformat()
+        return self._first_available(especialidad, start_date, days, limit, now)
+    
+    @cached_query('citas', 'usuarios', 'configuracion')
+    def _first_available(self, especialidad, start_date, days, limit, now):
+        """Búsqueda de ``find_first_available`` para un instante ``now`` dado"""
+        start_date = date.fromisoformat(start_date)
+        slot_times = _day_slots(self.get_clinic_config())
+        slot_index = {slot.strftime('%H:%M'): i for i, slot in enumerate(slot_times)}
+        results = []
         
+        with self.connection() as conn:
+            query = "SELECT id, nombre_completo FROM usuarios WHERE rol = 'doctor' AND estado = 'activo'"
+            params = []
+            if especialidad:
+                query += " AND especialidad = ?"
+                params.append(especialidad)
+            doctors = conn.execute(query + " ORDER BY nombre_completo, id", params).fetchall()
+            if not doctors:
+                return []
+            doctor_ids = [doctor[0] for doctor in doctors]
+            placeholders = ', '.join('?' for _ in doctors)
+            
+            for window_start in range(0, days, 7):
+                window_days = min(7, days - window_start)
+                first_day = start_date + timedelta(days=window_start)
+                
+                cursor = conn.execute(f'''
+                    SELECT medico_id, fecha, substr(hora, 1, 5) FROM citas
+                    WHERE medico_id IN ({placeholders}) AND fecha >= ? AND fecha < ?
+                      AND estado != 'cancelada'
+                ''', doctor_ids + [first_day.isoformat(), (first_day + timedelta(days=window_days)).isoformat()])
+                
+                taken = {}  # (médico, fecha) -> bits de horarios ocupados
+                for medico_id, fecha, hora in cursor:
+                    i = slot_index.get(hora)
+                    if i is not None:
+                        taken[(medico_id, fecha)] = taken.get((medico_id, fecha), 0) | (1 << i)
+                
+                for offset in range(window_days):
+                    day = first_day + timedelta(days=offset)
+                    fecha = day.isoformat()
+                    
+                    for i, slot in enumerate(slot_times):
+                        # Los horarios de hoy que ya pasaron no se ofrecen
+                        if day == now.date() and slot <= now.time():
+                            continue
+                        bit = 1 << i
+                        for medico_id, medico_nombre in doctors:
+                            if not taken.get((medico_id, fecha), 0) & bit:
+                                results.append({'fecha': fecha, 'hora': slot,
+                                                'medico_id': medico_id, 'medico_nombre': medico_nombre})
+                                if len(results) >= limit:
+                                    return results
+        return results
+    
+    @cached_query('citas', 'pacientes', 'usuarios')
+    def get_appointments(self, date_filter=None, medico_id=None, estado=None,
+                         start_date=None, end_date=None):
+        """Obtiene lista de citas con filtros opcionales.
+
+        ``date_filter`` filtra un día concreto; ``start_date``/``end_date``
+        (inclusive) devuelven todo un rango en una sola consulta.
+        """
         query = '''
             SELECT c.*, p.nombre_completo as paciente_nombre, p.dni,
                    u.nombre_completo as medico_nombre
@@ -187,96 +753,219 @@ class DatabaseManager:
             query += " AND c.fecha = ?"
             params.append(date_filter)
         
+        if start_date:
+            query += " AND c.fecha >= ?"
+            params.append(str(start_date))
+        
+        if end_date:
+            query += " AND c.fecha <= ?"
+            params.append(str(end_date))
+        
         if medico_id:
             query += " AND c.medico_id = ?"
             params.append(medico_id)
-            
+        
         if estado:
             query += " AND c.estado = ?"
             params.append(estado)
         
         query += " ORDER BY c.fecha, c.hora"
         
-        df = pd.read_sql_query(query, conn, params=params)
-        conn.close()
+        with self.connection() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+    
+    @cached_query('citas')
+    def get_appointment_counts_by_day(self, start_date, end_date, medico_id=None):
+        """Cuenta las citas por día y estado en un rango (inclusive) desde ``citas_diarias``.
+
+        Devuelve un DataFrame con columnas fecha, total, pendientes, atendidas y
+        canceladas; solo incluye los días que tienen citas.
+        """
+        df = self.get_appointment_trends(start_date, end_date, 'dia', medico_id)
+        return df.rename(columns={'periodo': 'fecha'})[['fecha', 'total', 'pendientes', 'atendidas', 'canceladas']]
+    
+    def get_appointment_trends(self, start_date, end_date, granularity='dia', medico_id=None, as_of=None):
+        """Citas por período y estado, con las tasas de cancelación e inasistencia.
+
+        ``granularity`` es 'dia', 'semana' (el período es el lunes) o 'mes'. Se
+        lee de ``citas_diarias`` (una fila por día, médico y estado, mantenida
+        por triggers), así que varios años se resuelven sin recorrer las citas.
+        Las citas que siguen pendientes con fecha anterior a ``as_of`` (hoy por
+        defecto) se cuentan como no asistidas.
+        """
+        return self._appointment_trends(str(start_date), str(end_date), granularity, medico_id,
+                                        str(as_of or date.today()))
+    
+    @cached_query('citas')
+    def _appointment_trends(self, start_date, end_date, granularity, medico_id, as_of):
+        """``get_appointment_trends`` para una fecha ``as_of`` dada"""
+        period = _APPOINTMENT_PERIODS[granularity]
+        query = f'''
+            SELECT {period} as periodo,
+                   SUM(citas) as total,
+                   SUM(citas * (estado = 'pendiente')) as pendientes,
+                   SUM(citas * (estado = 'atendida')) as atendidas,
+                   SUM(citas * (estado = 'cancelada')) as canceladas,
+                   SUM(citas * (estado = 'pendiente' AND fecha < ?)) as no_asistidas
+            FROM citas_diarias
+            WHERE fecha >= ? AND fecha <= ?
+        '''
+        params = [as_of, start_date, end_date]
+        
+        if medico_id:
+            query += " AND medico_id = ?"
+            params.append(medico_id)
+        
+        # Los grupos que quedaron en cero (citas movidas o eliminadas) no se muestran
+        query += f" GROUP BY {period} HAVING SUM(citas) != 0 ORDER BY {period}"
+        
+        with self.connection() as conn:
+            df = pd.read_sql_query(query, conn, params=params)
+        
+        df['tasa_cancelacion'] = df['canceladas'] / df['total']
+        df['tasa_inasistencia'] = df['no_asistidas'] / df['total']
         return df
     
-    def update_appointment_status(self, appointment_id, estado, observaciones=None):
-        """Actualiza el estado de una cita"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    @cached_query('citas', 'pagos', 'pacientes', 'usuarios')
+    def get_unpaid_appointments(self, start_date=None, end_date=None, search_term=None, after=None, limit=20):
+        """Citas atendidas que todavía no tienen un pago registrado, de la más reciente a la más antigua.
+
+        ``search_term`` filtra por paciente (índice FTS). Usa paginación por
+        clave: ``after`` es la tupla ``(fecha, id)`` de la última cita de la
+        página anterior. Devuelve un DataFrame con como mucho ``limit`` citas.
+        """
+        conditions = [
+            "c.estado = 'atendida'",
+            "NOT EXISTS (SELECT 1 FROM pagos p WHERE p.cita_id = c.id AND p.estado = 'pagado')",
+        ]
+        params = []
         
-        if observaciones:
-            cursor.execute('''
-                UPDATE citas SET estado = ?, observaciones = ? WHERE id = ?
-            ''', (estado, observaciones, appointment_id))
-        else:
-            cursor.execute('''
-                UPDATE citas SET estado = ? WHERE id = ?
-            ''', (estado, appointment_id))
+        if start_date and end_date:
+            conditions.append("c.fecha BETWEEN ? AND ?")
+            params.extend([str(start_date), str(end_date)])
         
-        conn.commit()
-        conn.close()
+        if search_term:
+            condition, condition_params = _patient_search_condition(search_term, "c.paciente_id")
+            conditions.append(condition)
+            params.extend(condition_params)
+        
+        if after:
+            conditions.append("(c.fecha, c.id) < (?, ?)")
+            params.extend([after[0], int(after[1])])
+        
+        query = f'''
+            SELECT c.id, c.fecha, c.hora, c.paciente_id, c.medico_id,
+                   pac.nombre_completo as paciente_nombre, pac.dni as paciente_dni,
+                   u.nombre_completo as medico_nombre
+            FROM citas c
+            JOIN pacientes pac ON c.paciente_id = pac.id
+            JOIN usuarios u ON c.medico_id = u.id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY c.fecha DESC, c.id DESC
+            LIMIT ?
+        '''
+        params.append(limit)
+        
+        with self.connection() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+    
+    @invalidates('citas')
+    def update_appointment_status(self, appointment_id, estado, observaciones=None):
+        """Actualiza el estado de una cita"""
+        with self.connection() as conn:
+            if observaciones:
+                conn.execute('''
+                    UPDATE citas SET estado = ?, observaciones = ? WHERE id = ?
+                ''', (estado, observaciones, appointment_id))
+            else:
+                conn.execute('''
+                    UPDATE citas SET estado = ? WHERE id = ?
+                ''', (estado, appointment_id))
     
     # MÉTODOS DE HISTORIAL MÉDICO
-    def create_medical_record(self, paciente_id, medico_id, motivo_consulta, diagnostico=None, 
+    @invalidates('historial_medico')
+    def create_medical_record(self, paciente_id, medico_id, motivo_consulta, diagnostico=None,
                             receta=None, examenes_solicitados=None, observaciones=None, cita_id=None):
         """Crea un nuevo registro médico"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO historial_medico 
-            (paciente_id, cita_id, medico_id, motivo_consulta, diagnostico, 
-             receta, examenes_solicitados, observaciones)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (paciente_id, cita_id, medico_id, motivo_consulta, diagnostico, 
-              receta, examenes_solicitados, observaciones))
-        
-        record_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return record_id
-    
-    def get_patient_medical_history(self, paciente_id):
-        """Obtiene el historial médico de un paciente"""
-        conn = self.get_connection()
+        def insert(conn):
+            cursor = conn.execute('''
+                INSERT INTO historial_medico
+                (paciente_id, cita_id, medico_id, motivo_consulta, diagnostico,
+                 receta, examenes_solicitados, observaciones)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (paciente_id, cita_id, medico_id, motivo_consulta, diagnostico,
+                  receta, examenes_solicitados, observaciones))
+            return cursor.lastrowid
         
-        query = '''
-            SELECT h.*, u.nombre_completo as medico_nombre
+        return self.write(insert)
+    
+    @cached_query('historial_medico', 'usuarios')
+    def get_medical_timeline(self, paciente_id, after=None, limit=20):
+        """Resumen de las consultas de un paciente, de la más reciente a la más antigua.
+
+        Solo trae fecha, médico y el inicio del motivo: los textos largos se
+        piden con ``get_medical_record`` al abrir cada consulta. Usa paginación
+        por clave: ``after`` es la tupla ``(fecha, id)`` de la última consulta
+        de la página anterior.
+        """
+        query = f'''
+            SELECT h.id, h.fecha, h.cita_id, u.nombre_completo as medico_nombre,
+                   substr(h.motivo_consulta, 1, {TIMELINE_REASON_CHARS}) as motivo_resumen
             FROM historial_medico h
             JOIN usuarios u ON h.medico_id = u.id
             WHERE h.paciente_id = ?
-            ORDER BY h.fecha DESC
         '''
+        params = [paciente_id]
         
-        df = pd.read_sql_query(query, conn, params=[paciente_id])
-        conn.close()
-        return df
+        if after:
+            query += " AND (h.fecha, h.id) < (?, ?)"
+            params.extend([after[0], int(after[1])])
+        
+        query += " ORDER BY h.fecha DESC, h.id DESC LIMIT ?"
+        params.append(limit)
+        
+        with self.connection() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+    
+    @cached_query('historial_medico', 'usuarios')
+    def get_medical_record(self, record_id):
+        """Registro completo de una consulta (diccionario) o None si no existe"""
+        with self.connection() as conn:
+            cursor = conn.execute('''
+                SELECT h.*, u.nombre_completo as medico_nombre
+                FROM historial_medico h
+                JOIN usuarios u ON h.medico_id = u.id
+                WHERE h.id = ?
+            ''', (record_id,))
+            row = cursor.fetchone()
+            
+            if row:
+                return dict(zip([column[0] for column in cursor.description], row))
+        return None
     
     # MÉTODOS DE PAGOS
+    @invalidates('pagos')
     def create_payment(self, cita_id, monto, metodo_pago, observaciones=None):
-        """Registra un pago"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO pagos (cita_id, monto, metodo_pago, estado, observaciones)
-            VALUES (?, ?, ?, 'pagado', ?)
-        ''', (cita_id, monto, metodo_pago, observaciones))
+        """Registra un pago.
+
+        No crea cargos: lo pagado por encima de lo cargado en la cita queda a
+        favor del paciente (``a_favor`` en los saldos) hasta que se registre el cargo.
+        """
+        def insert(conn):
+            cursor = conn.execute('''
+                INSERT INTO pagos (cita_id, monto, metodo_pago, estado, observaciones)
+                VALUES (?, ?, ?, 'pagado', ?)
+            ''', (cita_id, monto, metodo_pago, observaciones))
+            return cursor.lastrowid
         
-        payment_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return payment_id
+        return self.write(insert)
     
+    @cached_query('pagos', 'citas', 'pacientes', 'usuarios')
     def get_payments(self, start_date=None, end_date=None):
         """Obtiene lista de pagos con filtros opcionales"""
-        conn = self.get_connection()
-        
         query = '''
             SELECT p.*, c.fecha as fecha_cita, pac.nombre_completo as paciente_nombre,
-                   u.nombre_completo as medico_nombre
+                   pac.dni as paciente_dni, u.nombre_completo as medico_nombre
             FROM pagos p
             JOIN citas c ON p.cita_id = c.id
             JOIN pacientes pac ON c.paciente_id = pac.id
@@ -286,99 +975,293 @@ class DatabaseManager:
         params = []
         
         if start_date and end_date:
-            query += " AND DATE(p.fecha_pago) BETWEEN ? AND ?"
-            params.extend([start_date, end_date])
+            # Rango semiabierto sobre la columna (sin DATE()) para poder usar el índice
+            query += " AND p.fecha_pago >= ? AND p.fecha_pago < ?"
+            params.extend([str(start_date), _next_day(end_date)])
         
         query += " ORDER BY p.fecha_pago DESC"
         
-        df = pd.read_sql_query(query, conn, params=params)
-        conn.close()
-        return df
+        with self.connection() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+    
+    def iter_payments(self, start_date=None, end_date=None, chunk_size=1000):
+        """Pagos para exportar, leídos del cursor por bloques.
+
+        Devuelve ``(columnas, bloques)``; ``bloques`` es un generador de listas
+        de hasta ``chunk_size`` filas, de modo que un período largo (o todo el
+        historial) nunca se carga entero en memoria.
+        """
+        columns = ['id', 'fecha_pago', 'paciente_nombre', 'paciente_dni', 'medico_nombre',
+                   'fecha_cita', 'monto', 'metodo_pago', 'estado', 'observaciones']
+        query = '''
+            SELECT p.id, p.fecha_pago, pac.nombre_completo, pac.dni, u.nombre_completo,
+                   c.fecha, p.monto, p.metodo_pago, p.estado, p.observaciones
+            FROM pagos p
+            JOIN citas c ON p.cita_id = c.id
+            JOIN pacientes pac ON c.paciente_id = pac.id
+            JOIN usuarios u ON c.medico_id = u.id
+            WHERE p.estado = 'pagado'
+        '''
+        params = []
+        
+        if start_date and end_date:
+            query += " AND p.fecha_pago >= ? AND p.fecha_pago < ?"
+            params.extend([str(start_date), _next_day(end_date)])
+        
+        query += " ORDER BY p.fecha_pago, p.id"
+        
+        return columns, self.iter_query(query, params, chunk_size)
+    
+    def iter_invoice_data(self, start_date, end_date):
+        """Recorre los pagos de un rango con los datos del paciente para facturarlos.
+
+        Produce tuplas ``(datos_pago, datos_paciente)`` leyendo el cursor por
+        bloques, sin construir un DataFrame con todo el rango.
+        """
+        blocks = self.iter_query('''
+            SELECT p.id, p.fecha_pago, p.monto, p.metodo_pago, pac.nombre_completo, pac.dni
+            FROM pagos p
+            JOIN citas c ON p.cita_id = c.id
+            JOIN pacientes pac ON c.paciente_id = pac.id
+            WHERE p.estado = 'pagado' AND p.fecha_pago >= ? AND p.fecha_pago < ?
+            ORDER BY p.fecha_pago, p.id
+        ''', (str(start_date), _next_day(end_date)), chunk_size=500)
+        
+        try:
+            for rows in blocks:
+                for payment_id, fecha_pago, monto, metodo_pago, nombre_completo, dni in rows:
+                    yield (
+                        {'id': payment_id, 'fecha_pago': fecha_pago, 'monto': monto, 'metodo_pago': metodo_pago},
+                        {'nombre_completo': nombre_completo, 'dni': dni}
+                    )
+        finally:
+            blocks.close()
+    
+    @cached_query('pagos', 'citas', 'usuarios')
+    def get_revenue(self, start_date=None, end_date=None, group_by=()):
+        """Cantidad de pagos e ingresos del período, agrupados por ``group_by``.
+
+        ``group_by`` es una tupla con 'dia', 'mes', 'medico' y/o 'metodo'; vacía
+        da una sola fila con los totales. Se lee de ``ingresos_diarios`` (un
+        registro por día, médico y método, mantenido por triggers), así que un
+        año de ingresos son unos cientos de filas en lugar de cada pago.
+        """
+        dimensions = [_REVENUE_DIMENSIONS[name] for name in group_by]
+        columns = ''.join(f"{expression} as {column}, " for expression, column in dimensions)
+        query = f'''
+            SELECT {columns}COALESCE(SUM(i.pagos), 0) as pagos, COALESCE(SUM(i.total), 0) as total
+            FROM ingresos_diarios i
+        '''
+        params = []
+        
+        if 'medico' in group_by:
+            query += " JOIN usuarios u ON i.medico_id = u.id"
+        if start_date and end_date:
+            query += " WHERE i.fecha >= ? AND i.fecha <= ?"
+            params.extend([str(start_date), str(end_date)])
+        if dimensions:
+            expressions = ', '.join(expression for expression, _ in dimensions)
+            # Los grupos que quedaron en cero (pagos anulados o eliminados) no se muestran
+            query += f" GROUP BY {expressions} HAVING SUM(i.pagos) != 0 ORDER BY {expressions}"
+        
+        with self.connection() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+    
+    # MÉTODOS DE CUENTAS POR COBRAR
+    @cached_query('citas', 'cargos', 'pacientes', 'usuarios')
+    def get_uncharged_appointments(self, limit=50):
+        """Citas atendidas sin ningún cargo activo, de la más reciente a la más antigua"""
+        query = '''
+            SELECT c.id, c.fecha, c.hora, c.paciente_id, c.medico_id,
+                   pac.nombre_completo as paciente_nombre, pac.dni as paciente_dni,
+                   u.nombre_completo as medico_nombre
+            FROM citas c
+            JOIN pacientes pac ON c.paciente_id = pac.id
+            JOIN usuarios u ON c.medico_id = u.id
+            WHERE c.estado = 'atendida'
+              AND NOT EXISTS (SELECT 1 FROM cargos cg WHERE cg.cita_id = c.id AND cg.estado = 'activo')
+            ORDER BY c.fecha DESC, c.id DESC
+            LIMIT ?
+        '''
+        
+        with self.connection() as conn:
+            return pd.read_sql_query(query, conn, params=[limit])
+    
+    @invalidates('cargos')
+    def create_charge(self, cita_id, monto, concepto="Consulta médica"):
+        """Registra un cargo (lo que se debe) por una cita; el saldo se actualiza por trigger"""
+        def insert(conn):
+            cursor = conn.execute('''
+                INSERT INTO cargos (cita_id, paciente_id, monto, concepto, fecha)
+                SELECT id, paciente_id, ?, ?, fecha FROM citas WHERE id = ?
+            ''', (monto, concepto, cita_id))
+            return cursor.lastrowid if cursor.rowcount else None
+        
+        return self.write(insert)
+    
+    @invalidates('cargos')
+    def void_charge(self, charge_id):
+        """Anula un cargo (deja de contar en los saldos)"""
+        def update(conn):
+            conn.execute("UPDATE cargos SET estado = 'anulado' WHERE id = ?", (charge_id,))
+        
+        self.write(update)
+    
+    @cached_query('cargos', 'pagos')
+    def get_appointment_balance(self, cita_id):
+        """Cargado, pagado, saldo pendiente y saldo a favor de una cita"""
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT cargado, pagado FROM saldos_citas WHERE cita_id = ?", (cita_id,)
+            ).fetchone()
+        
+        cargado, pagado = row or (0, 0)
+        return {'cargado': cargado, 'pagado': pagado,
+                'saldo': max(cargado - pagado, 0), 'a_favor': max(pagado - cargado, 0)}
+    
+    @cached_query('cargos', 'pagos')
+    def get_patient_balance(self, paciente_id):
+        """Cargado, pagado, saldo pendiente y saldo a favor de un paciente.
+
+        El saldo es la suma de la deuda de cada cita: lo pagado de más en una
+        cita se informa aparte (``a_favor``) y no la descuenta.
+        """
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT cargado, pagado, pendiente, a_favor FROM saldos_pacientes WHERE paciente_id = ?",
+                (paciente_id,)
+            ).fetchone()
+        
+        cargado, pagado, pendiente, a_favor = row or (0, 0, 0, 0)
+        return {'cargado': cargado, 'pagado': pagado, 'saldo': pendiente, 'a_favor': a_favor}
+    
+    @cached_query('cargos', 'pagos', 'pacientes')
+    def get_outstanding_balances(self, limit=50):
+        """Pacientes con deuda, de mayor a menor saldo pendiente"""
+        with self.connection() as conn:
+            return pd.read_sql_query('''
+                SELECT s.paciente_id, pac.nombre_completo as paciente_nombre, pac.dni as paciente_dni,
+                       s.cargado, s.pagado, s.pendiente as saldo, s.a_favor
+                FROM saldos_pacientes s
+                JOIN pacientes pac ON s.paciente_id = pac.id
+                WHERE s.pendiente > 0
+                ORDER BY s.pendiente DESC
+                LIMIT ?
+            ''', conn, params=[limit])
+    
+    def get_receivables_aging(self, as_of=None):
+        """Deuda pendiente por antigüedad de la cita: 0-30, 31-60, 61-90 y más de 90 días.
+
+        Se calcula sobre las cuentas con deuda de ``saldos_citas`` (índice parcial),
+        sin recorrer cargos ni pagos.
+        """
+        return self._receivables_aging(str(as_of or date.today()))
+    
+    @cached_query('cargos', 'pagos')
+    def _receivables_aging(self, as_of):
+        """``get_receivables_aging`` para una fecha dada"""
+        with self.connection() as conn:
+            row = conn.execute('''
+                SELECT COALESCE(SUM(CASE WHEN dias <= 30 THEN saldo END), 0),
+                       COALESCE(SUM(CASE WHEN dias > 30 AND dias <= 60 THEN saldo END), 0),
+                       COALESCE(SUM(CASE WHEN dias > 60 AND dias <= 90 THEN saldo END), 0),
+                       COALESCE(SUM(CASE WHEN dias > 90 THEN saldo END), 0),
+                       COUNT(*)
+                FROM (
+                    SELECT cargado - pagado as saldo, julianday(?) - julianday(fecha) as dias
+                    FROM saldos_citas
+                    WHERE cargado > pagado
+                )
+            ''', (as_of,)).fetchone()
+        
+        buckets = dict(zip(['0-30', '31-60', '61-90', '90+'], row[:4]))
+        return {'tramos': buckets, 'total': sum(buckets.values()), 'cuentas': row[4]}
     
     # MÉTODOS DE CONFIGURACIÓN
+    @cached_query('configuracion')
     def get_clinic_config(self):
         """Obtiene la configuración de la clínica"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM configuracion LIMIT 1")
-        config = cursor.fetchone()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM configuracion LIMIT 1")
+            config = cursor.fetchone()
         
         if config:
-            columns = ['id', 'nombre_clinica', 'direccion', 'telefono', 'email', 
+            columns = ['id', 'nombre_clinica', 'direccion', 'telefono', 'email',
                       'logo_path', 'horario_inicio', 'horario_fin', 'duracion_cita']
             return dict(zip(columns, config))
         return None
     
+    @invalidates('configuracion')
     def update_clinic_config(self, **kwargs):
         """Actualiza la configuración de la clínica"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Verificar si existe configuración
-        cursor.execute("SELECT COUNT(*) FROM configuracion")
-        exists = cursor.fetchone()[0] > 0
-        
-        if exists:
-            fields = []
-            values = []
-            for key, value in kwargs.items():
-                if value is not None:
-                    fields.append(f"{key} = ?")
-                    values.append(value)
+        with self.connection() as conn:
+            cursor = conn.cursor()
             
-            if fields:
-                query = f"UPDATE configuracion SET {', '.join(fields)}"
-                cursor.execute(query, values)
-        else:
-            # Crear configuración inicial
-            fields = list(kwargs.keys())
-            placeholders = ', '.join(['?' for _ in fields])
-            values = list(kwargs.values())
+            # Verificar si existe configuración
+            cursor.execute("SELECT COUNT(*) FROM configuracion")
+            exists = cursor.fetchone()[0] > 0
             
-            query = f"INSERT INTO configuracion ({', '.join(fields)}) VALUES ({placeholders})"
-            cursor.execute(query, values)
-        
-        conn.commit()
-        conn.close()
+            if exists:
+                fields = []
+                values = []
+                for key, value in kwargs.items():
+                    if value is not None:
+                        fields.append(f"{key} = ?")
+                        values.append(value)
+                
+                if fields:
+                    query = f"UPDATE configuracion SET {', '.join(fields)}"
+                    cursor.execute(query, values)
+            else:
+                # Crear configuración inicial
+                fields = list(kwargs.keys())
+                placeholders = ', '.join(['?' for _ in fields])
+                values = list(kwargs.values())
+                
+                query = f"INSERT INTO configuracion ({', '.join(fields)}) VALUES ({placeholders})"
+                cursor.execute(query, values)
     
     # MÉTODOS DE ESPECIALIDADES
+    @cached_query('especialidades')
     def get_specialties(self):
         """Obtiene lista de especialidades activas"""
-        conn = self.get_connection()
-        df = pd.read_sql_query("SELECT * FROM especialidades WHERE estado = 'activo'", conn)
-        conn.close()
-        return df
+        with self.connection() as conn:
+            return pd.read_sql_query("SELECT * FROM especialidades WHERE estado = 'activo'", conn)
     
     # MÉTODOS DE REPORTES
     def get_stats_dashboard(self, start_date=None, end_date=None):
-        """Obtiene estadísticas para el dashboard"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """Obtiene estadísticas para el dashboard.
+
+        Lee los contadores que mantienen los triggers (tabla ``contadores``)
+        en lugar de agregar las tablas en cada carga del dashboard.
+        """
+        today = date.today().isoformat()
+        # fecha_pago se guarda con CURRENT_TIMESTAMP (UTC)
+        month = datetime.now(timezone.utc).strftime('%Y-%m')
+        cache_key = (self.db_path, today, month)
         
-        stats = {}
+        stats = _stats_cache.get(cache_key)
+        if stats is not None:
+            return dict(stats)
         
-        # Total de pacientes activos
-        cursor.execute("SELECT COUNT(*) FROM pacientes WHERE estado = 'activo'")
-        stats['total_pacientes'] = cursor.fetchone()[0]
+        keys = {
+            'total_pacientes': 'pacientes_activos',
+            'citas_hoy': f'citas:{today}',
+            'total_medicos': 'medicos_activos',
+            'ingresos_mes': f'ingresos:{month}',
+        }
         
-        # Total de citas del día actual
-        today = date.today().isoformat()
-        cursor.execute("SELECT COUNT(*) FROM citas WHERE fecha = ?", (today,))
-        stats['citas_hoy'] = cursor.fetchone()[0]
-        
-        # Total de médicos activos
-        cursor.execute("SELECT COUNT(*) FROM usuarios WHERE rol = 'doctor' AND estado = 'activo'")
-        stats['total_medicos'] = cursor.fetchone()[0]
-        
-        # Ingresos del mes actual
-        cursor.execute('''
-            SELECT COALESCE(SUM(monto), 0) FROM pagos 
-            WHERE strftime('%Y-%m', fecha_pago) = strftime('%Y-%m', 'now')
-            AND estado = 'pagado'
-        ''')
-        stats['ingresos_mes'] = cursor.fetchone()[0]
-        
-        conn.close()
-        return stats
+        with self.connection() as conn:
+            rows = conn.execute(
+                "SELECT clave, valor FROM contadores WHERE clave IN (?, ?, ?, ?)",
+                list(keys.values())
+            ).fetchall()
+        
+        values = dict(rows)
+        stats = {name: values.get(key, 0) for name, key in keys.items()}
+        for name in ('total_pacientes', 'citas_hoy', 'total_medicos'):
+            stats[name] = int(stats[name])
+        
+        _stats_cache.set(cache_key, stats)
+        return dict(stats)
@@ -1,15 +1,23 @@
-import sqlite3
 import os
+import sys
 from datetime import datetime
 
-def init_database():
+# Permitir ejecutar este archivo directamente (python database/init_db.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.storage import connect
+from database.migrations import apply_migrations
+
+DB_PATH = "database/clinica.db"
+
+def init_database(db_path=DB_PATH):
     """Inicializa la base de datos con todas las tablas necesarias"""
-    db_path = "database/clinica.db"
     
     # Crear directorio de base de datos si no existe
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     
-    conn = sqlite3.connect(db_path)
+    # La conexión activa WAL, que queda persistido en el archivo de la base de datos
+    conn = connect(db_path)
     cursor = conn.cursor()
     
     # Tabla de usuarios (administrador, doctor, recepcionista, paciente)
@@ -140,24 +148,30 @@ def init_database():
     ''')
     
     conn.commit()
+    
+    # Índices y cambios posteriores del esquema
+    apply_migrations(conn)
     conn.close()
 
-def insert_initial_data():
+def insert_initial_data(db_path=DB_PATH):
     """Inserta datos iniciales en la base de datos"""
-    import bcrypt
+    from database.passwords import hash_password, BCRYPT_ROUNDS
     
-    conn = sqlite3.connect("database/clinica.db")
+    conn = connect(db_path)
     cursor = conn.cursor()
     
-    # Usuario administrador por defecto
-    admin_password = "admin123"
-    admin_hash = bcrypt.hashpw(admin_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-    
-    cursor.execute('''
-        INSERT OR IGNORE INTO usuarios 
-        (username, email, password_hash, rol, nombre_completo, especialidad)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', ('admin', 'admin@clinica.com', admin_hash, 'administrador', 'Administrador Principal', 'Administración'))
+    # Usuario administrador por defecto (el hash solo se calcula si aún no existe)
+    cursor.execute("SELECT 1 FROM usuarios WHERE username = 'admin'")
+    if cursor.fetchone() is None:
+        admin_password = "admin123"
+        admin_hash = hash_password(admin_password)
+        
+        cursor.execute('''
+            INSERT OR IGNORE INTO usuarios 
+            (username, email, password_hash, rol, nombre_completo, especialidad, bcrypt_rounds)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', ('admin', 'admin@clinica.com', admin_hash, 'administrador', 'Administrador Principal',
+              'Administración', BCRYPT_ROUNDS))
     
     # Especialidades por defecto
     especialidades_default = [
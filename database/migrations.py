@@ -0,0 +1,502 @@
+import os
+import sys
+
+# Permitir ejecutar este archivo directamente (python database/migrations.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.storage import connect
+
+def _bump_counter(key_expr, delta_expr):
+    """Sentencia (para triggers) que suma ``delta_expr`` al contador ``key_expr``"""
+    return (f"INSERT INTO contadores (clave, valor) VALUES ({key_expr}, {delta_expr}) "
+            f"ON CONFLICT (clave) DO UPDATE SET valor = valor + excluded.valor;")
+
+
+def _bump_balance(cita_expr, paciente_expr, fecha_expr, cargado_expr, pagado_expr):
+    """Sentencias (para triggers) que suman a los saldos de una cita y de su paciente"""
+    return (f"INSERT INTO saldos_citas (cita_id, paciente_id, fecha, cargado, pagado) "
+            f"VALUES ({cita_expr}, {paciente_expr}, {fecha_expr}, {cargado_expr}, {pagado_expr}) "
+            f"ON CONFLICT (cita_id) DO UPDATE SET cargado = cargado + excluded.cargado, "
+            f"pagado = pagado + excluded.pagado;\n"
+            f"INSERT INTO saldos_pacientes (paciente_id, cargado, pagado) "
+            f"VALUES ({paciente_expr}, {cargado_expr}, {pagado_expr}) "
+            f"ON CONFLICT (paciente_id) DO UPDATE SET cargado = cargado + excluded.cargado, "
+            f"pagado = pagado + excluded.pagado;")
+
+
+def _bump_payment_balance(row, sign):
+    """``_bump_balance`` para un pago (``row`` es new u old): el paciente y la fecha salen de la cita"""
+    return _bump_balance(
+        f"{row}.cita_id",
+        f"(SELECT paciente_id FROM citas WHERE id = {row}.cita_id)",
+        f"(SELECT fecha FROM citas WHERE id = {row}.cita_id)",
+        "0",
+        f"{sign}({row}.estado = 'pagado') * {row}.monto",
+    )
+
+
+def _bump_patient_debt(row, sign):
+    """Sentencia (para triggers de ``saldos_citas``) que suma la deuda o el saldo a favor de una cita a su paciente"""
+    return (f"INSERT INTO saldos_pacientes (paciente_id, pendiente, a_favor) "
+            f"VALUES ({row}.paciente_id, {sign}MAX({row}.cargado - {row}.pagado, 0), "
+            f"{sign}MAX({row}.pagado - {row}.cargado, 0)) "
+            f"ON CONFLICT (paciente_id) DO UPDATE SET pendiente = pendiente + excluded.pendiente, "
+            f"a_favor = a_favor + excluded.a_favor;")
+
+
+def _bump_revenue(row, sign):
+    """Sentencia (para triggers) que suma un pago (``row`` es new u old) a ``ingresos_diarios``.
+
+    El médico sale de la cita; los pagos que no están en estado 'pagado' suman cero.
+    """
+    return (f"INSERT INTO ingresos_diarios (fecha, medico_id, metodo_pago, pagos, total) "
+            f"SELECT substr({row}.fecha_pago, 1, 10), c.medico_id, {row}.metodo_pago, "
+            f"{sign}({row}.estado = 'pagado'), {sign}({row}.estado = 'pagado') * {row}.monto "
+            f"FROM citas c WHERE c.id = {row}.cita_id "
+            f"ON CONFLICT (fecha, medico_id, metodo_pago) DO UPDATE SET "
+            f"pagos = pagos + excluded.pagos, total = total + excluded.total;")
+
+
+def _move_revenue(old_medico, new_medico):
+    """Sentencias (para triggers de citas) que pasan los pagos de la cita de un médico a otro"""
+    statements = []
+    for medico, sign in ((old_medico, "-"), (new_medico, "")):
+        statements.append(
+            f"INSERT INTO ingresos_diarios (fecha, medico_id, metodo_pago, pagos, total) "
+            f"SELECT substr(p.fecha_pago, 1, 10), {medico}, p.metodo_pago, {sign}COUNT(*), {sign}SUM(p.monto) "
+            f"FROM pagos p WHERE p.cita_id = new.id AND p.estado = 'pagado' "
+            f"GROUP BY substr(p.fecha_pago, 1, 10), p.metodo_pago "
+            f"ON CONFLICT (fecha, medico_id, metodo_pago) DO UPDATE SET "
+            f"pagos = pagos + excluded.pagos, total = total + excluded.total;"
+        )
+    return "\n".join(statements)
+
+
+def _bump_appointments(row, delta):
+    """Sentencia (para triggers) que suma ``delta`` a la cuenta de ``citas_diarias`` de una cita (new u old)"""
+    return (f"INSERT INTO citas_diarias (fecha, medico_id, estado, citas) "
+            f"VALUES ({row}.fecha, {row}.medico_id, {row}.estado, {delta}) "
+            f"ON CONFLICT (fecha, medico_id, estado) DO UPDATE SET citas = citas + excluded.citas;")
+
+
+# Migraciones del esquema, en orden. Cada una es (versión, descripción, sentencias).
+# Nunca modificar una migración ya publicada: agregar una nueva al final.
+MIGRATIONS = [
+    (1, "Índices para las consultas frecuentes de citas, historial y pagos", [
+        "CREATE INDEX IF NOT EXISTS idx_citas_fecha_medico_estado ON citas (fecha, medico_id, estado)",
+        "CREATE INDEX IF NOT EXISTS idx_citas_medico_fecha ON citas (medico_id, fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_historial_paciente_fecha ON historial_medico (paciente_id, fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_pagos_fecha_estado ON pagos (fecha_pago, estado)",
+    ]),
+    (2, "Índice para el listado paginado de pacientes", [
+        "CREATE INDEX IF NOT EXISTS idx_pacientes_estado_nombre ON pacientes (estado, nombre_completo, id)",
+    ]),
+    (3, "Índice de texto completo (FTS5) para la búsqueda de pacientes", [
+        # remove_diacritics 2: 'Pérez' y 'perez' se indexan igual
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS pacientes_fts USING fts5(
+            nombre_completo, dni, telefono, email,
+            content='pacientes', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS pacientes_fts_ai AFTER INSERT ON pacientes BEGIN
+            INSERT INTO pacientes_fts (rowid, nombre_completo, dni, telefono, email)
+            VALUES (new.id, new.nombre_completo, new.dni, new.telefono, new.email);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS pacientes_fts_ad AFTER DELETE ON pacientes BEGIN
+            INSERT INTO pacientes_fts (pacientes_fts, rowid, nombre_completo, dni, telefono, email)
+            VALUES ('delete', old.id, old.nombre_completo, old.dni, old.telefono, old.email);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS pacientes_fts_au
+        AFTER UPDATE OF nombre_completo, dni, telefono, email ON pacientes BEGIN
+            INSERT INTO pacientes_fts (pacientes_fts, rowid, nombre_completo, dni, telefono, email)
+            VALUES ('delete', old.id, old.nombre_completo, old.dni, old.telefono, old.email);
+            INSERT INTO pacientes_fts (rowid, nombre_completo, dni, telefono, email)
+            VALUES (new.id, new.nombre_completo, new.dni, new.telefono, new.email);
+        END''',
+        "INSERT INTO pacientes_fts (pacientes_fts) VALUES ('rebuild')",
+    ]),
+    (4, "Contadores incrementales para el dashboard", [
+        '''CREATE TABLE IF NOT EXISTS contadores (
+            clave TEXT PRIMARY KEY,
+            valor NUMERIC NOT NULL DEFAULT 0
+        )''',
+        # Pacientes activos
+        f'''CREATE TRIGGER IF NOT EXISTS contadores_pacientes_ai AFTER INSERT ON pacientes BEGIN
+            {_bump_counter("'pacientes_activos'", "new.estado = 'activo'")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS contadores_pacientes_ad AFTER DELETE ON pacientes BEGIN
+            {_bump_counter("'pacientes_activos'", "-(old.estado = 'activo')")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS contadores_pacientes_au AFTER UPDATE OF estado ON pacientes BEGIN
+            {_bump_counter("'pacientes_activos'", "(new.estado = 'activo') - (old.estado = 'activo')")}
+        END''',
+        # Médicos activos
+        f'''CREATE TRIGGER IF NOT EXISTS contadores_usuarios_ai AFTER INSERT ON usuarios BEGIN
+            {_bump_counter("'medicos_activos'", "new.rol = 'doctor' AND new.estado = 'activo'")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS contadores_usuarios_ad AFTER DELETE ON usuarios BEGIN
+            {_bump_counter("'medicos_activos'", "-(old.rol = 'doctor' AND old.estado = 'activo')")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS contadores_usuarios_au AFTER UPDATE OF rol, estado ON usuarios BEGIN
+            {_bump_counter("'medicos_activos'",
+                           "(new.rol = 'doctor' AND new.estado = 'activo') - (old.rol = 'doctor' AND old.estado = 'activo')")}
+        END''',
+        # Citas por día ('citas:AAAA-MM-DD')
+        f'''CREATE TRIGGER IF NOT EXISTS contadores_citas_ai AFTER INSERT ON citas BEGIN
+            {_bump_counter("'citas:' || new.fecha", "1")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS contadores_citas_ad AFTER DELETE ON citas BEGIN
+            {_bump_counter("'citas:' || old.fecha", "-1")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS contadores_citas_au AFTER UPDATE OF fecha ON citas BEGIN
+            {_bump_counter("'citas:' || old.fecha", "-1")}
+            {_bump_counter("'citas:' || new.fecha", "1")}
+        END''',
+        # Ingresos pagados por mes ('ingresos:AAAA-MM')
+        f'''CREATE TRIGGER IF NOT EXISTS contadores_pagos_ai AFTER INSERT ON pagos
+        WHEN new.estado = 'pagado' BEGIN
+            {_bump_counter("'ingresos:' || substr(new.fecha_pago, 1, 7)", "new.monto")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS contadores_pagos_ad AFTER DELETE ON pagos
+        WHEN old.estado = 'pagado' BEGIN
+            {_bump_counter("'ingresos:' || substr(old.fecha_pago, 1, 7)", "-old.monto")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS contadores_pagos_au AFTER UPDATE OF monto, estado, fecha_pago ON pagos BEGIN
+            {_bump_counter("'ingresos:' || substr(old.fecha_pago, 1, 7)", "-(old.estado = 'pagado') * old.monto")}
+            {_bump_counter("'ingresos:' || substr(new.fecha_pago, 1, 7)", "(new.estado = 'pagado') * new.monto")}
+        END''',
+        # Valores iniciales a partir de los datos existentes
+        "INSERT OR REPLACE INTO contadores SELECT 'pacientes_activos', COUNT(*) FROM pacientes WHERE estado = 'activo'",
+        "INSERT OR REPLACE INTO contadores SELECT 'medicos_activos', COUNT(*) FROM usuarios WHERE rol = 'doctor' AND estado = 'activo'",
+        "INSERT OR REPLACE INTO contadores SELECT 'citas:' || fecha, COUNT(*) FROM citas GROUP BY fecha",
+        '''INSERT OR REPLACE INTO contadores
+           SELECT 'ingresos:' || substr(fecha_pago, 1, 7), SUM(monto) FROM pagos
+           WHERE estado = 'pagado' GROUP BY substr(fecha_pago, 1, 7)''',
+    ]),
+    (5, "Registro de importaciones masivas de pacientes (para reanudarlas)", [
+        '''CREATE TABLE IF NOT EXISTS importaciones (
+            clave TEXT PRIMARY KEY,
+            archivo TEXT,
+            filas_procesadas INTEGER NOT NULL DEFAULT 0,
+            insertados INTEGER NOT NULL DEFAULT 0,
+            errores INTEGER NOT NULL DEFAULT 0,
+            estado TEXT DEFAULT 'en_curso' CHECK(estado IN ('en_curso', 'completada')),
+            fecha_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+    ]),
+    (6, "Sesiones persistentes (tokens firmados)", [
+        '''CREATE TABLE IF NOT EXISTS sesiones (
+            token_hash TEXT PRIMARY KEY,
+            usuario_id INTEGER NOT NULL,
+            expira INTEGER NOT NULL,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_sesiones_expira ON sesiones (expira)",
+    ]),
+    (7, "Factor de trabajo de bcrypt de cada usuario", [
+        "ALTER TABLE usuarios ADD COLUMN bcrypt_rounds INTEGER",
+        # Los hashes existentes indican su factor: $2b$12$...
+        "UPDATE usuarios SET bcrypt_rounds = CAST(substr(password_hash, 5, 2) AS INTEGER)",
+    ]),
+    (8, "Un médico no puede tener dos citas activas en el mismo horario", [
+        # Las citas duplicadas que ya existieran se cancelan (queda la más antigua) para poder crear el índice
+        '''UPDATE citas
+           SET estado = 'cancelada',
+               observaciones = COALESCE(observaciones || ' | ', '') || 'Cancelada automáticamente: horario duplicado'
+           WHERE estado != 'cancelada'
+             AND id NOT IN (SELECT MIN(id) FROM citas WHERE estado != 'cancelada'
+                            GROUP BY medico_id, fecha, hora)''',
+        """CREATE UNIQUE INDEX IF NOT EXISTS idx_citas_horario_unico
+           ON citas (medico_id, fecha, hora) WHERE estado != 'cancelada'""",
+    ]),
+    (9, "Índices para buscar citas atendidas sin pago", [
+        "CREATE INDEX IF NOT EXISTS idx_pagos_cita_estado ON pagos (cita_id, estado)",
+        "CREATE INDEX IF NOT EXISTS idx_citas_estado_fecha ON citas (estado, fecha, id)",
+    ]),
+    (10, "Cuentas por cobrar: cargos por cita y saldos por cita y paciente", [
+        '''CREATE TABLE IF NOT EXISTS cargos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cita_id INTEGER NOT NULL,
+            paciente_id INTEGER NOT NULL,
+            monto DECIMAL(10,2) NOT NULL,
+            concepto TEXT NOT NULL DEFAULT 'Consulta médica',
+            fecha DATE NOT NULL,
+            estado TEXT DEFAULT 'activo' CHECK(estado IN ('activo', 'anulado')),
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (cita_id) REFERENCES citas (id),
+            FOREIGN KEY (paciente_id) REFERENCES pacientes (id)
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_cargos_cita ON cargos (cita_id)",
+        # Saldos mantenidos por triggers: cargado (cargos activos) y pagado (pagos 'pagado')
+        '''CREATE TABLE IF NOT EXISTS saldos_citas (
+            cita_id INTEGER PRIMARY KEY,
+            paciente_id INTEGER NOT NULL,
+            fecha DATE NOT NULL,
+            cargado NUMERIC NOT NULL DEFAULT 0,
+            pagado NUMERIC NOT NULL DEFAULT 0
+        )''',
+        '''CREATE TABLE IF NOT EXISTS saldos_pacientes (
+            paciente_id INTEGER PRIMARY KEY,
+            cargado NUMERIC NOT NULL DEFAULT 0,
+            pagado NUMERIC NOT NULL DEFAULT 0
+        )''',
+        # Solo las cuentas con deuda, por antigüedad (para los tramos de vencimiento)
+        "CREATE INDEX IF NOT EXISTS idx_saldos_citas_pendientes ON saldos_citas (fecha) WHERE cargado > pagado",
+        "CREATE INDEX IF NOT EXISTS idx_saldos_pacientes_saldo ON saldos_pacientes ((cargado - pagado))",
+        # Los pagos ya registrados se consideran saldados: se les crea un cargo por lo pagado
+        '''INSERT INTO cargos (cita_id, paciente_id, monto, fecha)
+           SELECT c.id, c.paciente_id, SUM(p.monto), c.fecha
+           FROM pagos p JOIN citas c ON p.cita_id = c.id
+           WHERE p.estado = 'pagado'
+           GROUP BY c.id''',
+        '''INSERT INTO saldos_citas (cita_id, paciente_id, fecha, cargado, pagado)
+           SELECT cg.cita_id, cg.paciente_id, cg.fecha, cg.monto,
+                  (SELECT SUM(p.monto) FROM pagos p WHERE p.cita_id = cg.cita_id AND p.estado = 'pagado')
+           FROM cargos cg''',
+        '''INSERT INTO saldos_pacientes (paciente_id, cargado, pagado)
+           SELECT paciente_id, SUM(cargado), SUM(pagado) FROM saldos_citas GROUP BY paciente_id''',
+        f'''CREATE TRIGGER IF NOT EXISTS saldos_cargos_ai AFTER INSERT ON cargos BEGIN
+            {_bump_balance("new.cita_id", "new.paciente_id", "new.fecha", "(new.estado = 'activo') * new.monto", "0")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS saldos_cargos_ad AFTER DELETE ON cargos BEGIN
+            {_bump_balance("old.cita_id", "old.paciente_id", "old.fecha", "-(old.estado = 'activo') * old.monto", "0")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS saldos_cargos_au AFTER UPDATE OF monto, estado ON cargos BEGIN
+            {_bump_balance("old.cita_id", "old.paciente_id", "old.fecha", "-(old.estado = 'activo') * old.monto", "0")}
+            {_bump_balance("new.cita_id", "new.paciente_id", "new.fecha", "(new.estado = 'activo') * new.monto", "0")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS saldos_pagos_ai AFTER INSERT ON pagos BEGIN
+            {_bump_payment_balance("new", "")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS saldos_pagos_ad AFTER DELETE ON pagos BEGIN
+            {_bump_payment_balance("old", "-")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS saldos_pagos_au AFTER UPDATE OF monto, estado ON pagos BEGIN
+            {_bump_payment_balance("old", "-")}
+            {_bump_payment_balance("new", "")}
+        END''',
+    ]),
+    (11, "Ingresos diarios por médico y método de pago (para estadísticas y gráficos)", [
+        '''CREATE TABLE IF NOT EXISTS ingresos_diarios (
+            fecha DATE NOT NULL,
+            medico_id INTEGER NOT NULL,
+            metodo_pago TEXT NOT NULL,
+            pagos INTEGER NOT NULL DEFAULT 0,
+            total NUMERIC NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, medico_id, metodo_pago)
+        ) WITHOUT ROWID''',
+        '''INSERT INTO ingresos_diarios (fecha, medico_id, metodo_pago, pagos, total)
+           SELECT substr(p.fecha_pago, 1, 10), c.medico_id, p.metodo_pago, COUNT(*), SUM(p.monto)
+           FROM pagos p JOIN citas c ON p.cita_id = c.id
+           WHERE p.estado = 'pagado'
+           GROUP BY substr(p.fecha_pago, 1, 10), c.medico_id, p.metodo_pago''',
+        f'''CREATE TRIGGER IF NOT EXISTS ingresos_pagos_ai AFTER INSERT ON pagos
+        WHEN new.estado = 'pagado' BEGIN
+            {_bump_revenue("new", "")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS ingresos_pagos_ad AFTER DELETE ON pagos
+        WHEN old.estado = 'pagado' BEGIN
+            {_bump_revenue("old", "-")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS ingresos_pagos_au
+        AFTER UPDATE OF cita_id, monto, metodo_pago, estado, fecha_pago ON pagos BEGIN
+            {_bump_revenue("old", "-")}
+            {_bump_revenue("new", "")}
+        END''',
+        # Si la cita cambia de médico, sus pagos pasan al nuevo médico
+        f'''CREATE TRIGGER IF NOT EXISTS ingresos_citas_au AFTER UPDATE OF medico_id ON citas
+        WHEN new.medico_id != old.medico_id BEGIN
+            {_move_revenue("old.medico_id", "new.medico_id")}
+        END''',
+    ]),
+    (12, "Citas diarias por médico y estado (para estadísticas y tendencias)", [
+        '''CREATE TABLE IF NOT EXISTS citas_diarias (
+            fecha DATE NOT NULL,
+            medico_id INTEGER NOT NULL,
+            estado TEXT NOT NULL,
+            citas INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, medico_id, estado)
+        ) WITHOUT ROWID''',
+        '''INSERT INTO citas_diarias (fecha, medico_id, estado, citas)
+           SELECT fecha, medico_id, estado, COUNT(*) FROM citas GROUP BY fecha, medico_id, estado''',
+        f'''CREATE TRIGGER IF NOT EXISTS citas_diarias_ai AFTER INSERT ON citas BEGIN
+            {_bump_appointments("new", "1")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS citas_diarias_ad AFTER DELETE ON citas BEGIN
+            {_bump_appointments("old", "-1")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS citas_diarias_au AFTER UPDATE OF fecha, medico_id, estado ON citas BEGIN
+            {_bump_appointments("old", "-1")}
+            {_bump_appointments("new", "1")}
+        END''',
+    ]),
+    (13, "Saldos por paciente: deuda pendiente y pagos a favor por separado", [
+        # Lo pagado de más en una cita (o sin cargo todavía) queda a favor del
+        # paciente y no descuenta la deuda de sus otras citas
+        "ALTER TABLE saldos_pacientes ADD COLUMN pendiente NUMERIC NOT NULL DEFAULT 0",
+        "ALTER TABLE saldos_pacientes ADD COLUMN a_favor NUMERIC NOT NULL DEFAULT 0",
+        '''UPDATE saldos_pacientes SET
+               pendiente = (SELECT COALESCE(SUM(MAX(s.cargado - s.pagado, 0)), 0) FROM saldos_citas s
+                            WHERE s.paciente_id = saldos_pacientes.paciente_id),
+               a_favor = (SELECT COALESCE(SUM(MAX(s.pagado - s.cargado, 0)), 0) FROM saldos_citas s
+                          WHERE s.paciente_id = saldos_pacientes.paciente_id)''',
+        "DROP INDEX IF EXISTS idx_saldos_pacientes_saldo",
+        "CREATE INDEX IF NOT EXISTS idx_saldos_pacientes_pendiente ON saldos_pacientes (pendiente) WHERE pendiente > 0",
+        f'''CREATE TRIGGER IF NOT EXISTS saldos_pendientes_ai AFTER INSERT ON saldos_citas BEGIN
+            {_bump_patient_debt("new", "")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS saldos_pendientes_au AFTER UPDATE OF cargado, pagado ON saldos_citas BEGIN
+            {_bump_patient_debt("old", "-")}
+            {_bump_patient_debt("new", "")}
+        END''',
+        # Si un pago pasa a otra cita, el saldo también se mueve
+        "DROP TRIGGER IF EXISTS saldos_pagos_au",
+        f'''CREATE TRIGGER saldos_pagos_au AFTER UPDATE OF cita_id, monto, estado ON pagos BEGIN
+            {_bump_payment_balance("old", "-")}
+            {_bump_payment_balance("new", "")}
+        END''',
+    ]),
+]
+
+
+def get_schema_version(conn):
+    """Devuelve la versión actual del esquema (0 si no se aplicó ninguna migración)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            descripcion TEXT,
+            fecha_aplicacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()
+    return row[0]
+
+
+def latest_version():
+    """Versión a la que llevan todas las migraciones definidas"""
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def apply_migrations(conn):
+    """Aplica, en orden y cada una en su propia transacción, las migraciones pendientes"""
+    current = get_schema_version(conn)
+    applied = []
+
+    for version, descripcion, statements in MIGRATIONS:
+        if version <= current:
+            continue
+
+        conn.execute("BEGIN")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_version (version, descripcion) VALUES (?, ?)",
+                (version, descripcion)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        applied.append(version)
+
+    return applied
+
+
+# Consultas críticas y el índice que cada una debe usar
+INDEXED_QUERIES = [
+    ("citas por fecha",
+     "SELECT * FROM citas WHERE fecha = ? AND medico_id = ? AND estado = ?",
+     ('2025-01-01', 1, 'pendiente'),
+     'idx_citas_fecha_medico_estado'),
+    ("historial por paciente",
+     "SELECT * FROM historial_medico WHERE paciente_id = ? ORDER BY fecha DESC",
+     (1,),
+     'idx_historial_paciente_fecha'),
+    ("pagos por rango de fechas",
+     "SELECT * FROM pagos WHERE estado = 'pagado' AND fecha_pago >= ? AND fecha_pago < ?",
+     ('2025-01-01', '2025-02-01'),
+     'idx_pagos_fecha_estado'),
+    ("página de pacientes",
+     "SELECT * FROM pacientes WHERE estado = 'activo' AND (nombre_completo, id) > (?, ?) "
+     "ORDER BY nombre_completo, id LIMIT 10",
+     ('A', 0),
+     'idx_pacientes_estado_nombre'),
+    ("horarios ocupados de un médico",
+     "SELECT hora FROM citas WHERE medico_id = ? AND fecha = ? AND estado != 'cancelada'",
+     (1, '2025-01-01'),
+     'idx_citas_horario_unico'),
+    ("pagos de una cita",
+     "SELECT 1 FROM pagos WHERE cita_id = ? AND estado = 'pagado'",
+     (1,),
+     'idx_pagos_cita_estado'),
+    ("citas atendidas sin pago",
+     "SELECT c.id FROM citas c WHERE c.estado = 'atendida' "
+     "AND NOT EXISTS (SELECT 1 FROM pagos p WHERE p.cita_id = c.id AND p.estado = 'pagado') "
+     "ORDER BY c.fecha DESC, c.id DESC LIMIT 20",
+     (),
+     'idx_citas_estado_fecha'),
+    ("citas atendidas sin cargo",
+     "SELECT c.id FROM citas c WHERE c.estado = 'atendida' "
+     "AND NOT EXISTS (SELECT 1 FROM cargos cg WHERE cg.cita_id = c.id AND cg.estado = 'activo') "
+     "ORDER BY c.fecha DESC, c.id DESC LIMIT 50",
+     (),
+     'idx_cargos_cita'),
+    ("pacientes con deuda",
+     "SELECT paciente_id FROM saldos_pacientes WHERE pendiente > 0 ORDER BY pendiente DESC LIMIT 50",
+     (),
+     'idx_saldos_pacientes_pendiente'),
+    ("cuentas con deuda por antigüedad",
+     "SELECT cita_id FROM saldos_citas WHERE cargado > pagado AND fecha < ?",
+     ('2025-01-01',),
+     'idx_saldos_citas_pendientes'),
+    ("ingresos por rango de fechas",
+     "SELECT medico_id, SUM(total) FROM ingresos_diarios WHERE fecha >= ? AND fecha <= ? GROUP BY medico_id",
+     ('2025-01-01', '2025-12-31'),
+     'PRIMARY KEY'),
+    ("página del historial de un paciente",
+     "SELECT id, fecha FROM historial_medico WHERE paciente_id = ? AND (fecha, id) < (?, ?) "
+     "ORDER BY fecha DESC, id DESC LIMIT 20",
+     (1, '2025-01-01', 0),
+     'idx_historial_paciente_fecha'),
+    ("citas por estado en un rango de fechas",
+     "SELECT estado, SUM(citas) FROM citas_diarias WHERE fecha >= ? AND fecha <= ? GROUP BY estado",
+     ('2025-01-01', '2025-12-31'),
+     'PRIMARY KEY'),
+]
+
+
+def explain_query_plan(conn, query, params=()):
+    """Devuelve el detalle de EXPLAIN QUERY PLAN de una consulta"""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def check_index_usage(conn):
+    """Verifica que las consultas críticas usen sus índices.
+
+    Devuelve una lista de (nombre, plan) con las consultas que no lo hacen.
+    """
+    failures = []
+    for name, query, params, index_name in INDEXED_QUERIES:
+        plan = explain_query_plan(conn, query, params)
+        if not any(index_name in detail for detail in plan):
+            failures.append((name, plan))
+    return failures
+
+
+if __name__ == "__main__":
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "database/clinica.db"
+    conn = connect(db_path)
+    applied = apply_migrations(conn)
+    print(f"Versión del esquema: {get_schema_version(conn)} (aplicadas: {applied or 'ninguna'})")
+
+    failures = check_index_usage(conn)
+    conn.close()
+    for name, plan in failures:
+        print(f"La consulta '{name}' no usa su índice: {plan}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,37 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+# Factor de trabajo de bcrypt para contraseñas nuevas; subirlo provoca el rehash al iniciar sesión
+BCRYPT_ROUNDS = int(os.environ.get('CLINICA_BCRYPT_ROUNDS', '12'))
+
+# Por debajo de este número de contraseñas no compensa arrancar procesos
+_PARALLEL_THRESHOLD = 4
+
+
+def hash_password(password, rounds=BCRYPT_ROUNDS):
+    """Genera el hash bcrypt de una contraseña con el factor de trabajo indicado"""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def needs_rehash(rounds):
+    """Indica si un hash con ``rounds`` debe regenerarse con el factor actual"""
+    return rounds is None or rounds < BCRYPT_ROUNDS
+
+
+def hash_passwords(passwords, rounds=BCRYPT_ROUNDS, workers=None):
+    """Genera los hashes de muchas contraseñas repartiéndolos entre procesos.
+
+    Devuelve los hashes en el mismo orden que ``passwords``.
+    """
+    passwords = list(passwords)
+    if len(passwords) < _PARALLEL_THRESHOLD or workers == 1:
+        return [hash_password(password, rounds) for password in passwords]
+
+    workers = workers or os.cpu_count() or 1
+    # spawn: un fork desde el servidor (con hilos y conexiones SQLite abiertas) puede quedar bloqueado
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(executor.map(hash_password, passwords, [rounds] * len(passwords), chunksize=chunksize))
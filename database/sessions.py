@@ -0,0 +1,70 @@
+import hashlib
+import hmac
+import os
+import secrets
+import time
+
+# Duración de una sesión recordada
+SESSION_TTL_HOURS = float(os.environ.get('CLINICA_SESSION_HOURS', '12'))
+SECRET_KEY_PATH = os.environ.get('CLINICA_SECRET_KEY_FILE', 'database/.secret_key')
+
+_secret_key = None
+
+
+def get_secret_key():
+    """Clave para firmar tokens: CLINICA_SECRET_KEY o un archivo generado la primera vez"""
+    global _secret_key
+    if _secret_key is None:
+        env_key = os.environ.get('CLINICA_SECRET_KEY')
+        if env_key:
+            _secret_key = env_key.encode('utf-8')
+        elif os.path.exists(SECRET_KEY_PATH):
+            with open(SECRET_KEY_PATH, 'rb') as f:
+                _secret_key = f.read().strip()
+        else:
+            key = secrets.token_hex(32).encode('utf-8')
+            try:
+                fd = os.open(SECRET_KEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                # Otro proceso la creó al mismo tiempo
+                with open(SECRET_KEY_PATH, 'rb') as f:
+                    key = f.read().strip()
+            else:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(key)
+            _secret_key = key
+    return _secret_key
+
+
+def _sign(payload):
+    return hmac.new(get_secret_key(), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def new_token(ttl_hours=SESSION_TTL_HOURS):
+    """Genera un token firmado ``aleatorio.expiracion.firma`` y su fecha de expiración (epoch)"""
+    expires_at = int(time.time() + ttl_hours * 3600)
+    payload = f"{secrets.token_urlsafe(32)}.{expires_at}"
+    return f"{payload}.{_sign(payload)}", expires_at
+
+
+def verify_token(token):
+    """Comprueba firma y expiración sin consultar la base de datos.
+
+    Devuelve la expiración (epoch) si el token es válido, o None.
+    """
+    try:
+        random_part, expires_at, signature = token.split('.')
+        expires_at = int(expires_at)
+    except (AttributeError, ValueError):
+        return None
+
+    if not hmac.compare_digest(signature, _sign(f"{random_part}.{expires_at}")):
+        return None
+    if expires_at <= time.time():
+        return None
+    return expires_at
+
+
+def token_hash(token):
+    """Hash con el que se guarda el token (el token en claro nunca se almacena)"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
@@ -0,0 +1,26 @@
+import os
+import sqlite3
+
+# Configuración de almacenamiento SQLite aplicada a cada conexión nueva.
+# WAL permite que las lecturas no esperen a las escrituras (y viceversa).
+PRAGMAS = {
+    'journal_mode': os.environ.get('CLINICA_DB_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('CLINICA_DB_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': int(os.environ.get('CLINICA_DB_CACHE_SIZE', '-20000')),     # en KiB si es negativo (~20 MB)
+    'mmap_size': int(os.environ.get('CLINICA_DB_MMAP_SIZE', '268435456')),    # 256 MB
+    'temp_store': os.environ.get('CLINICA_DB_TEMP_STORE', 'MEMORY'),
+    'busy_timeout': int(os.environ.get('CLINICA_DB_BUSY_TIMEOUT', '5000')),   # en milisegundos
+}
+
+
+def configure_connection(conn):
+    """Aplica los PRAGMAs de almacenamiento a una conexión"""
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def connect(db_path, timeout=30.0):
+    """Abre una conexión configurada, utilizable desde cualquier hilo"""
+    conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False)
+    return configure_connection(conn)
@@ -0,0 +1,79 @@
+import os
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from queue import Queue
+
+from database.storage import connect
+
+
+class WriteQueue:
+    """Cola de escritura serializada.
+
+    Un único hilo escritor con su propia conexión ejecuta, en orden de llegada,
+    las operaciones encoladas. Así las escrituras concurrentes de distintas
+    sesiones de Streamlit nunca compiten por el bloqueo de escritura de SQLite,
+    y con WAL los lectores siguen trabajando sin esperar.
+    """
+
+    def __init__(self, db_path, timeout=None):
+        self.db_path = db_path
+        # Espera máxima de ``submit``: si el escritor no responde se lanza un error en vez de bloquear la sesión
+        self.timeout = timeout if timeout is not None else float(os.environ.get('CLINICA_WRITE_TIMEOUT', '60'))
+        self._queue = Queue()
+        self._thread = threading.Thread(target=self._run, name="clinica-db-writer", daemon=True)
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def _run(self):
+        conn = None
+        while True:
+            func, args, kwargs, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                # La conexión se abre con la primera operación (y se reintenta con la siguiente si falla)
+                if conn is None:
+                    conn = connect(self.db_path)
+                result = func(conn, *args, **kwargs)
+                conn.commit()
+            except BaseException as e:
+                if conn is not None:
+                    conn.rollback()
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def submit(self, func, *args, **kwargs):
+        """Encola ``func(conn, *args, **kwargs)`` y espera su resultado.
+
+        La operación se confirma al terminar; si lanza una excepción se revierte
+        y la excepción se propaga al llamador. Si no termina en ``timeout``
+        segundos se lanza ``TimeoutError``.
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("No se puede encolar una escritura desde el hilo escritor")
+        future = Future()
+        self._queue.put((func, args, kwargs, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()  # si todavía no empezó, el escritor la descarta
+            raise TimeoutError(f"La escritura en {self.db_path} no terminó en {self.timeout:g} segundos") from None
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_write_queue(db_path):
+    """Devuelve la cola de escritura del proceso para una base de datos"""
+    key = os.path.abspath(db_path)
+    with _queues_lock:
+        queue = _queues.get(key)
+        # Si el hilo escritor terminó se crea una cola nueva en vez de entregar una que nunca responde
+        if queue is None or not queue.is_alive():
+            queue = WriteQueue(db_path)
+            _queues[key] = queue
+        return queue
@@ -1,6 +1,7 @@
 import streamlit as st
 import sys
 import os
+import importlib
 
 # Agregar el directorio actual al path para importar módulos
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -14,70 +15,39 @@ st.set_page_config(
 )
 
 # Importar módulos después de configurar la página
-from database.init_db import init_database, insert_initial_data
+from database.bootstrap import ensure_database
 from utils.auth import check_authentication, sidebar_navigation, login_page
-from pages.dashboard import show_dashboard
-from pages.patients import show_patient_management
-from pages.appointments import show_appointment_management
-
-# Importar otras páginas
-import importlib
-
-def load_medical_history():
-    """Carga la página de historial médico"""
-    try:
-        from pages.medical_history import show_medical_history
-        return show_medical_history
-    except ImportError:
-        return None
-
-def load_payments():
-    """Carga la página de pagos"""
-    try:
-        from pages.payments import show_payments
-        return show_payments
-    except ImportError:
-        return None
 
-def load_reports():
-    """Carga la página de reportes"""
-    try:
-        from pages.reports import show_reports
-        return show_reports
-    except ImportError:
-        return None
-
-def load_admin():
-    """Carga la página de administración"""
-    try:
-        from pages.admin import show_admin
-        return show_admin
-    except ImportError:
-        return None
+# Páginas de la aplicación: cada módulo se importa la primera vez que se visita
+PAGES = {
+    "📊 Dashboard": ("pages.dashboard", "show_dashboard"),
+    "👥 Gestión de Pacientes": ("pages.patients", "show_patient_management"),
+    "📅 Gestión de Citas": ("pages.appointments", "show_appointment_management"),
+    "📋 Historial Médico": ("pages.medical_history", "show_medical_history"),
+    "💰 Pagos y Facturación": ("pages.payments", "show_payments"),
+    "📈 Reportes": ("pages.reports", "show_reports"),
+    "⚙️ Administración": ("pages.admin", "show_admin"),
+    "👥 Gestión de Usuarios": ("pages.users", "show_user_management"),
+    "🔧 Configuración": ("pages.config", "show_configuration"),
+}
 
-def load_users():
-    """Carga la página de gestión de usuarios"""
+def load_page(selected_page):
+    """Importa (solo la primera vez) y devuelve la función de una página, o None si no existe"""
+    module_name, function_name = PAGES[selected_page]
     try:
-        from pages.users import show_user_management
-        return show_user_management
-    except ImportError:
-        return None
-
-def load_config():
-    """Carga la página de configuración"""
-    try:
-        from pages.config import show_configuration
-        return show_configuration
-    except ImportError:
+        module = importlib.import_module(module_name)
+    except ModuleNotFoundError as e:
+        if e.name != module_name:  # la página existe pero falla una de sus dependencias
+            raise
         return None
+    return getattr(module, function_name)
 
 def main():
     """Función principal de la aplicación"""
     
-    # Inicializar base de datos si no existe
+    # Inicializar base de datos si no existe (solo la primera vez en cada proceso)
     try:
-        init_database()
-        insert_initial_data()
+        ensure_database()
     except Exception as e:
         st.error(f"Error al inicializar la base de datos: {e}")
         st.stop()
@@ -157,57 +127,14 @@ def main():
     
     # Enrutamiento de páginas
     try:
-        if selected_page == "📊 Dashboard":
-            show_dashboard()
-            
-        elif selected_page == "👥 Gestión de Pacientes":
-            show_patient_management()
-            
-        elif selected_page == "📅 Gestión de Citas":
-            show_appointment_management()
-            
-        elif selected_page == "📋 Historial Médico":
-            medical_history_func = load_medical_history()
-            if medical_history_func:
-                medical_history_func()
-            else:
-                st.error("Página de historial médico no disponible")
-                create_placeholder_page("Historial Médico", "📋")
-                
-        elif selected_page == "💰 Pagos y Facturación":
-            payments_func = load_payments()
-            if payments_func:
-                payments_func()
-            else:
-                create_placeholder_page("Pagos y Facturación", "💰")
-                
-        elif selected_page == "📈 Reportes":
-            reports_func = load_reports()
-            if reports_func:
-                reports_func()
-            else:
-                create_placeholder_page("Reportes", "📈")
-                
-        elif selected_page == "⚙️ Administración":
-            admin_func = load_admin()
-            if admin_func:
-                admin_func()
-            else:
-                create_placeholder_page("Administración", "⚙️")
-                
-        elif selected_page == "👥 Gestión de Usuarios":
-            users_func = load_users()
-            if users_func:
-                users_func()
-            else:
-                create_placeholder_page("Gestión de Usuarios", "👥")
-                
-        elif selected_page == "🔧 Configuración":
-            config_func = load_config()
-            if config_func:
-                config_func()
+        if selected_page in PAGES:
+            page_func = load_page(selected_page)
+            if page_func:
+                page_func()
             else:
-                create_placeholder_page("Configuración", "🔧")
+                # El nombre de la página sin el icono
+                icon, page_name = selected_page.split(" ", 1)
+                create_placeholder_page(page_name, icon)
                 
     except Exception as e:
         st.error(f"Error al cargar la página: {e}")
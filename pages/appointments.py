@@ -1,9 +1,9 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, date, time, timedelta
+from datetime import datetime, date, timedelta
 from database.db_manager import DatabaseManager
 from utils.auth import require_auth, get_current_user
-from utils.helpers import show_success_message, show_error_message, format_date
+from utils.helpers import show_success_message, show_error_message, format_date, patient_picker
 import calendar
 
 @require_auth(['administrador', 'doctor', 'recepcionista'])
@@ -134,123 +134,124 @@ def show_new_appointment_form(db, user):
     """Formulario para nueva cita"""
     st.subheader("➕ Agendar Nueva Cita")
     
-    with st.form("new_appointment_form", clear_on_submit=True):
-        # Selección de paciente
-        df_patients = db.get_patients()
+    # Selección de paciente (fuera del formulario para que la búsqueda responda al escribir)
+    paciente_id = patient_picker(db, key="new_appointment_patient", label="Seleccionar Paciente *")
+    
+    if not paciente_id:
+        st.error("Debe seleccionar un paciente. Si no está registrado, regístrelo primero.")
+        return
+    
+    # Médico y fecha fuera del formulario para que los horarios libres se actualicen al cambiarlos
+    if user['rol'] in ['administrador', 'recepcionista']:
+        df_doctors = db.get_users('doctor')
         
-        if df_patients.empty:
-            st.error("No hay pacientes registrados. Debe registrar un paciente primero.")
-            st.form_submit_button("Crear Cita", disabled=True)
+        if df_doctors.empty:
+            st.error("No hay médicos registrados.")
             return
         
-        patient_options = {}
-        for _, patient in df_patients.iterrows():
-            patient_options[f"{patient['nombre_completo']} - {patient['dni']}"] = patient['id']
-        
-        selected_patient_key = st.selectbox("Seleccionar Paciente *", options=list(patient_options.keys()))
-        
-        # Selección de médico
-        if user['rol'] in ['administrador', 'recepcionista']:
-            df_doctors = db.get_users('doctor')
-            
-            if df_doctors.empty:
-                st.error("No hay médicos registrados.")
-                st.form_submit_button("Crear Cita", disabled=True)
-                return
-            
-            doctor_options = {}
-            for _, doctor in df_doctors.iterrows():
-                doctor_options[f"Dr. {doctor['nombre_completo']} - {doctor['especialidad'] or 'Sin especialidad'}"] = doctor['id']
-            
-            selected_doctor_key = st.selectbox("Seleccionar Médico *", options=list(doctor_options.keys()))
-            medico_id = doctor_options[selected_doctor_key]
-        else:
-            medico_id = user['id']
-            st.info(f"Cita asignada a: Dr. {user['nombre_completo']}")
+        doctor_options = {}
+        for _, doctor in df_doctors.iterrows():
+            doctor_options[f"Dr. {doctor['nombre_completo']} - {doctor['especialidad'] or 'Sin especialidad'}"] = doctor['id']
         
-        # Fecha y hora
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            fecha_cita = st.date_input("Fecha de la Cita *", min_value=date.today())
+        show_first_available_search(db, doctor_options)
         
-        with col2:
-            # Generar opciones de hora (de 8:00 a 18:00, cada 30 minutos)
-            time_options = []
-            start_time = time(8, 0)  # 8:00 AM
-            end_time = time(18, 0)   # 6:00 PM
-            
-            current_time = datetime.combine(date.today(), start_time)
-            end_datetime = datetime.combine(date.today(), end_time)
-            
-            while current_time <= end_datetime:
-                time_options.append(current_time.time())
-                current_time += timedelta(minutes=30)
-            
-            hora_cita = st.selectbox("Hora de la Cita *", options=time_options, format_func=lambda x: x.strftime('%H:%M'))
+        selected_doctor_key = st.selectbox("Seleccionar Médico *", options=list(doctor_options.keys()),
+                                           key="new_appointment_doctor")
+        medico_id = doctor_options[selected_doctor_key]
+    else:
+        medico_id = user['id']
+        st.info(f"Cita asignada a: Dr. {user['nombre_completo']}")
+    
+    fecha_cita = st.date_input("Fecha de la Cita *", min_value=date.today(), key="new_appointment_date")
+    
+    # Solo se ofrecen los horarios libres según la configuración de la clínica
+    time_options = db.get_free_slots(medico_id, fecha_cita.isoformat())
+    
+    if not time_options:
+        st.warning("⚠️ El médico no tiene horarios disponibles en esa fecha")
+        return
+    
+    with st.form("new_appointment_form", clear_on_submit=True):
+        hora_cita = st.selectbox("Hora de la Cita *", options=time_options, format_func=lambda x: x.strftime('%H:%M'),
+                                 key="new_appointment_time")
         
         # Información adicional
         motivo = st.text_area("Motivo de la Consulta", max_chars=500)
         observaciones = st.text_area("Observaciones", max_chars=500)
         
-        # Verificar disponibilidad
-        st.write("**Verificar Disponibilidad**")
-        if st.form_submit_button("🔍 Verificar Disponibilidad", use_container_width=True):
-            # Verificar si ya existe una cita en esa fecha y hora para el médico
-            existing_appointments = db.get_appointments(
-                date_filter=fecha_cita.isoformat(),
-                medico_id=medico_id
-            )
-            
-            if not existing_appointments.empty:
-                conflicting_appointments = existing_appointments[
-                    existing_appointments['hora'] == hora_cita.strftime('%H:%M:%S')
-                ]
-                
-                if not conflicting_appointments.empty:
-                    st.error(f"⚠️ Ya existe una cita programada para el Dr. en esa fecha y hora")
-                else:
-                    st.success("✅ Horario disponible")
-            else:
-                st.success("✅ Horario disponible")
-        
         # Botón de creación
         submitted = st.form_submit_button("📅 Crear Cita", use_container_width=True)
         
         if submitted:
-            if selected_patient_key and fecha_cita and hora_cita:
+            if paciente_id and fecha_cita and hora_cita:
                 try:
-                    paciente_id = patient_options[selected_patient_key]
-                    
-                    # Verificar disponibilidad nuevamente
-                    existing_appointments = db.get_appointments(
-                        date_filter=fecha_cita.isoformat(),
-                        medico_id=medico_id
+                    # La reserva es atómica: falla si otro usuario tomó el horario mientras tanto
+                    appointment_id = db.create_appointment(
+                        paciente_id=paciente_id,
+                        medico_id=medico_id,
+                        fecha=fecha_cita.isoformat(),
+                        hora=hora_cita.strftime('%H:%M:%S'),
+                        motivo=motivo if motivo else None,
+                        observaciones=observaciones if observaciones else None
                     )
                     
-                    conflicting_appointments = existing_appointments[
-                        existing_appointments['hora'] == hora_cita.strftime('%H:%M:%S')
-                    ] if not existing_appointments.empty else pd.DataFrame()
-                    
-                    if not conflicting_appointments.empty:
-                        show_error_message("Ya existe una cita programada en esa fecha y hora")
-                    else:
-                        appointment_id = db.create_appointment(
-                            paciente_id=paciente_id,
-                            medico_id=medico_id,
-                            fecha=fecha_cita.isoformat(),
-                            hora=hora_cita.strftime('%H:%M:%S'),
-                            motivo=motivo if motivo else None,
-                            observaciones=observaciones if observaciones else None
-                        )
-                        
+                    if appointment_id:
                         show_success_message(f"Cita creada exitosamente (ID: {appointment_id})")
+                    else:
+                        show_error_message("Ya existe una cita programada en esa fecha y hora")
                 
                 except Exception as e:
                     show_error_message(f"Error al crear cita: {str(e)}")
             else:
                 show_error_message("Por favor complete todos los campos obligatorios")
 
+def show_first_available_search(db, doctor_options):
+    """Busca los primeros horarios libres de una especialidad y permite usar uno en el formulario"""
+    with st.expander("🔎 Buscar primer horario disponible"):
+        df_specialties = db.get_specialties()
+        specialties = ["Todas"] + df_specialties['nombre'].tolist()
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            especialidad = st.selectbox("Especialidad", options=specialties, key="first_available_specialty")
+        with col2:
+            start_date = st.date_input("A partir de", value=date.today(), min_value=date.today(),
+                                       key="first_available_start")
+        with col3:
+            days = st.number_input("Días a buscar", min_value=1, max_value=120, value=60,
+                                   key="first_available_days")
+        
+        # La búsqueda solo se ejecuta al pulsar el botón; el resultado se conserva entre recargas
+        if st.button("Buscar", key="first_available_search"):
+            st.session_state.first_available_slots = db.find_first_available(
+                None if especialidad == "Todas" else especialidad,
+                start_date.isoformat(), int(days), limit=10
+            )
+        
+        slots = st.session_state.get('first_available_slots')
+        if slots is None:
+            return
+        if not slots:
+            st.info("No hay horarios disponibles en ese período")
+            return
+        
+        doctor_labels = {doctor_id: label for label, doctor_id in doctor_options.items()}
+        slot_labels = [
+            f"{datetime.strptime(slot['fecha'], '%Y-%m-%d').strftime('%d/%m/%Y')} {slot['hora'].strftime('%H:%M')}"
+            f" - Dr. {slot['medico_nombre']}"
+            for slot in slots
+        ]
+        choice = st.radio("Horarios disponibles", options=range(len(slots)),
+                          format_func=lambda i: slot_labels[i], key="first_available_choice")
+        
+        if st.button("Usar este horario", key="first_available_use"):
+            slot = slots[choice]
+            st.session_state.new_appointment_doctor = doctor_labels[slot['medico_id']]
+            st.session_state.new_appointment_date = date.fromisoformat(slot['fecha'])
+            st.session_state.new_appointment_time = slot['hora']
+            del st.session_state.first_available_slots
+            st.rerun()
+
 def show_calendar_view(db, user):
     """Vista de calendario de citas"""
     st.subheader("📅 Calendario de Citas")
@@ -291,17 +292,9 @@ def show_calendar_view(db, user):
     # Generar días del mes
     month_calendar = calendar.monthcalendar(selected_year, selected_month)
     
-    # Obtener todas las citas del mes
-    all_appointments = []
-    current_date = start_date
-    while current_date <= end_date:
-        day_appointments = db.get_appointments(
-            date_filter=current_date.isoformat(),
-            medico_id=medico_filter
-        )
-        if not day_appointments.empty:
-            all_appointments.append((current_date, len(day_appointments)))
-        current_date += timedelta(days=1)
+    # Obtener el número de citas de cada día del mes en una sola consulta
+    df_counts = db.get_appointment_counts_by_day(start_date.isoformat(), end_date.isoformat(), medico_filter)
+    counts_by_day = dict(zip(df_counts['fecha'], df_counts['total']))
     
     # Mostrar calendario en formato de tabla
     days_of_week = ['Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom']
@@ -315,7 +308,7 @@ def show_calendar_view(db, user):
                 week_data[days_of_week[i]] = ""
             else:
                 current_day = date(selected_year, selected_month, day)
-                appointment_count = next((count for d, count in all_appointments if d == current_day), 0)
+                appointment_count = counts_by_day.get(current_day.isoformat(), 0)
                 if appointment_count > 0:
                     week_data[days_of_week[i]] = f"{day} ({appointment_count})"
                 else:
@@ -359,59 +352,68 @@ def show_appointment_stats(db, user):
     with col2:
         end_date = st.date_input("Fecha Fin", value=date.today())
     
+    granularity_labels = {'dia': 'Día', 'semana': 'Semana', 'mes': 'Mes'}
+    granularity = st.radio(
+        "Agrupar por", options=list(granularity_labels.keys()),
+        format_func=granularity_labels.get, horizontal=True, key="stats_granularity"
+    )
+    
     # Obtener estadísticas
     medico_filter = user['id'] if user['rol'] == 'doctor' else None
     
-    # Métricas por día en el rango
-    current_date = start_date
-    stats_data = []
+    # Citas por período y estado (desde la tabla de resumen diario, una sola consulta)
+    df_stats = db.get_appointment_trends(start_date.isoformat(), end_date.isoformat(), granularity, medico_filter)
     
-    while current_date <= end_date:
-        day_appointments = db.get_appointments(date_filter=current_date.isoformat(), medico_id=medico_filter)
-        
-        total = len(day_appointments)
-        pendientes = len(day_appointments[day_appointments['estado'] == 'pendiente']) if not day_appointments.empty else 0
-        atendidas = len(day_appointments[day_appointments['estado'] == 'atendida']) if not day_appointments.empty else 0
-        canceladas = len(day_appointments[day_appointments['estado'] == 'cancelada']) if not day_appointments.empty else 0
-        
-        stats_data.append({
-            'fecha': current_date,
-            'total': total,
-            'pendientes': pendientes,
-            'atendidas': atendidas,
-            'canceladas': canceladas
-        })
-        
-        current_date += timedelta(days=1)
-    
-    df_stats = pd.DataFrame(stats_data)
+    if granularity == 'dia':
+        # Completar con ceros los días sin citas
+        all_days = pd.date_range(start_date, end_date, freq='D').strftime('%Y-%m-%d')
+        df_stats = df_stats.set_index('periodo').reindex(all_days, fill_value=0).rename_axis('periodo').reset_index()
     
     if not df_stats.empty and df_stats['total'].sum() > 0:
         # Métricas generales
-        col1, col2, col3, col4 = st.columns(4)
+        total = df_stats['total'].sum()
+        col1, col2, col3, col4, col5 = st.columns(5)
         
         with col1:
-            st.metric("Total Citas", df_stats['total'].sum())
+            st.metric("Total Citas", total)
         with col2:
             st.metric("Atendidas", df_stats['atendidas'].sum())
         with col3:
             st.metric("Pendientes", df_stats['pendientes'].sum())
         with col4:
-            st.metric("Canceladas", df_stats['canceladas'].sum())
+            st.metric("Canceladas", df_stats['canceladas'].sum(),
+                      f"{df_stats['canceladas'].sum() / total:.1%}", delta_color="off")
+        with col5:
+            st.metric("No Asistidas", df_stats['no_asistidas'].sum(),
+                      f"{df_stats['no_asistidas'].sum() / total:.1%}", delta_color="off")
         
-        # Gráfico de citas por día
+        # Gráfico de citas por período
         import plotly.express as px
         
+        period_label = granularity_labels[granularity]
         fig = px.line(
             df_stats,
-            x='fecha',
+            x='periodo',
             y=['total', 'atendidas', 'pendientes', 'canceladas'],
-            title='Citas por Día',
-            labels={'value': 'Número de Citas', 'fecha': 'Fecha'}
+            title=f'Citas por {period_label}',
+            labels={'value': 'Número de Citas', 'periodo': period_label}
         )
         
         st.plotly_chart(fig, use_container_width=True)
         
+        # Tendencia de cancelaciones e inasistencias
+        df_rates = df_stats[df_stats['total'] > 0]
+        fig_rates = px.line(
+            df_rates,
+            x='periodo',
+            y=['tasa_cancelacion', 'tasa_inasistencia'],
+            title='Tasa de Cancelación e Inasistencia',
+            labels={'value': 'Proporción de Citas', 'periodo': period_label}
+        )
+        fig_rates.update_layout(yaxis_tickformat='.0%')
+        
+        st.plotly_chart(fig_rates, use_container_width=True)
+        
         # Distribución por estado
         total_by_status = {
             'Atendidas': df_stats['atendidas'].sum(),
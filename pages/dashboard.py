@@ -4,11 +4,13 @@ from datetime import datetime, date, timedelta
 from database.db_manager import DatabaseManager
 from utils.auth import get_current_user, require_auth
 from utils.helpers import create_chart_appointments_by_day, create_chart_patients_by_age, format_currency
-import plotly.express as px
+from utils.demographics import distributions_from_counts
 
 @require_auth()
 def show_dashboard():
     """Muestra el dashboard principal"""
+    import plotly.express as px
+    
     st.title("📊 Dashboard")
     
     db = DatabaseManager()
@@ -59,13 +61,15 @@ def show_dashboard():
         # Si es doctor, mostrar solo sus citas
         medico_id = user['id'] if user['rol'] == 'doctor' else None
         
+        df_counts = db.get_appointment_counts_by_day(start_date.isoformat(), end_date.isoformat(), medico_id)
+        counts_by_day = dict(zip(df_counts['fecha'], df_counts['total']))
+        
         appointments_week = []
         for i in range(7):
             current_date = start_date + timedelta(days=i)
-            df_day = db.get_appointments(date_filter=current_date.isoformat(), medico_id=medico_id)
             appointments_week.append({
                 'fecha': current_date.strftime('%d/%m'),
-                'citas': len(df_day)
+                'citas': counts_by_day.get(current_date.isoformat(), 0)
             })
         
         df_week = pd.DataFrame(appointments_week)
@@ -89,19 +93,31 @@ def show_dashboard():
         
         # Solo mostrar si tiene permisos para ver todos los pacientes
         if user['rol'] in ['administrador', 'recepcionista']:
-            df_patients = db.get_patients()
+            # Conteos agregados en SQL: no se cargan los pacientes
+            df_counts = db.get_patient_demographics()
             
-            if not df_patients.empty:
-                # Distribución por sexo
-                gender_counts = df_patients['sexo'].value_counts()
+            if not df_counts.empty:
+                age_counts, gender_counts = distributions_from_counts(df_counts)
+                
+                tab_sex, tab_age = st.tabs(["Por sexo", "Por edad"])
                 
-                fig = px.pie(
-                    values=gender_counts.values,
-                    names=['Masculino' if x == 'M' else 'Femenino' if x == 'F' else 'Otro' for x in gender_counts.index],
-                    title='Pacientes por Sexo'
-                )
-                fig.update_layout(height=400)
-                st.plotly_chart(fig, use_container_width=True)
+                with tab_sex:
+                    fig = px.pie(
+                        values=gender_counts.values,
+                        names=gender_counts.index,
+                        title='Pacientes por Sexo'
+                    )
+                    fig.update_layout(height=400)
+                    st.plotly_chart(fig, use_container_width=True)
+                
+                with tab_age:
+                    fig = px.pie(
+                        values=age_counts.values,
+                        names=age_counts.index,
+                        title='Pacientes por Edad'
+                    )
+                    fig.update_layout(height=400)
+                    st.plotly_chart(fig, use_container_width=True)
             else:
                 st.info("No hay datos de pacientes para mostrar")
         else:
@@ -163,17 +179,13 @@ def show_dashboard():
         st.subheader("🔮 Próximas Citas")
         
         # Obtener citas de los próximos 3 días
-        future_appointments = []
-        for i in range(1, 4):  # Próximos 3 días
-            future_date = (date.today() + timedelta(days=i)).isoformat()
-            df_future = db.get_appointments(date_filter=future_date, medico_id=user['id'])
-            if not df_future.empty:
-                future_appointments.append(df_future)
+        df_future_all = db.get_appointments(
+            medico_id=user['id'],
+            start_date=(date.today() + timedelta(days=1)).isoformat(),
+            end_date=(date.today() + timedelta(days=3)).isoformat()
+        )
         
-        if future_appointments:
-            df_future_all = pd.concat(future_appointments, ignore_index=True)
-            df_future_all = df_future_all.sort_values(['fecha', 'hora'])
-            
+        if not df_future_all.empty:
             for index, row in df_future_all.head(5).iterrows():  # Mostrar solo las próximas 5
                 st.write(f"📅 **{row['fecha']}** a las **{row['hora']}** - {row['paciente_nombre']}")
         else:
@@ -187,12 +199,12 @@ def show_dashboard():
     # Verificar citas sin atender del día anterior
     yesterday = (date.today() - timedelta(days=1)).isoformat()
     medico_filter = user['id'] if user['rol'] == 'doctor' else None
-    df_yesterday = db.get_appointments(date_filter=yesterday, medico_id=medico_filter, estado='pendiente')
+    pending_yesterday = db.get_appointment_counts_by_day(yesterday, yesterday, medico_filter)['pendientes'].sum()
     
-    if not df_yesterday.empty:
+    if pending_yesterday:
         notifications.append({
             'type': 'warning',
-            'message': f"Hay {len(df_yesterday)} citas pendientes del día anterior"
+            'message': f"Hay {pending_yesterday} citas pendientes del día anterior"
         })
     
     # Verificar pacientes sin historial médico reciente (para médicos)
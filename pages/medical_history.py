@@ -3,7 +3,8 @@ import pandas as pd
 from datetime import datetime, date
 from database.db_manager import DatabaseManager
 from utils.auth import require_auth, get_current_user, can_access_medical_records
-from utils.helpers import show_success_message, show_error_message, format_datetime, PDFGenerator
+from utils.helpers import (show_success_message, show_error_message, format_datetime, PDFGenerator, patient_picker,
+                           cursor_page, back_if_empty_page, show_cursor_pagination)
 
 @require_auth(['administrador', 'doctor'])
 def show_medical_history():
@@ -30,23 +31,9 @@ def show_patient_history(db, user):
     st.subheader("🔍 Consultar Historial del Paciente")
     
     # Selector de paciente
-    df_patients = db.get_patients()
+    patient_id = patient_picker(db, key="history_patient")
     
-    if df_patients.empty:
-        st.info("No hay pacientes registrados")
-        return
-    
-    patient_options = {}
-    for _, patient in df_patients.iterrows():
-        patient_options[f"{patient['nombre_completo']} - {patient['dni']}"] = patient['id']
-    
-    selected_patient_key = st.selectbox(
-        "Seleccionar Paciente",
-        options=list(patient_options.keys())
-    )
-    
-    if selected_patient_key:
-        patient_id = patient_options[selected_patient_key]
+    if patient_id:
         patient_data = db.get_patient_by_id(patient_id)
         
         # Información del paciente
@@ -72,56 +59,83 @@ def show_patient_history(db, user):
         
         # Historial médico
         st.subheader("📋 Historial de Consultas")
+        show_medical_timeline(db, patient_id)
+
+def show_medical_timeline(db, patient_id):
+    """Historial del paciente por páginas; el detalle de cada consulta se carga al abrirla"""
+    page_size = 20
+    
+    # Los registros abiertos se olvidan cuando cambia el paciente
+    if st.session_state.get('history_records_patient') != patient_id:
+        st.session_state.history_records_patient = patient_id
+        st.session_state.history_records = {}
+    
+    after = cursor_page('history_timeline_cursors', scope=patient_id)
+    df_timeline = db.get_medical_timeline(patient_id, after=after, limit=page_size)
+    
+    if df_timeline.empty:
+        back_if_empty_page('history_timeline_cursors')
+        st.info("El paciente no tiene historial médico registrado")
+        return
+    
+    for summary in df_timeline.itertuples():
+        label = f"📅 {format_datetime(summary.fecha)} - Dr. {summary.medico_nombre} - {summary.motivo_resumen}"
+        if st.toggle(label, key=f"history_open_{summary.id}"):
+            with st.container(border=True):
+                show_medical_record(_load_medical_record(db, summary.id))
+    
+    show_cursor_pagination('history_timeline_cursors', df_timeline, page_size, ('fecha', 'id'),
+                           caption="Página {page} del historial",
+                           labels=("⬅️ Más recientes", "Más antiguas ➡️"))
+
+def _load_medical_record(db, record_id):
+    """Registro completo de una consulta, guardado en la sesión la primera vez que se abre"""
+    records = st.session_state.setdefault('history_records', {})
+    if record_id not in records:
+        records[record_id] = db.get_medical_record(record_id)
+    return records[record_id]
+
+def show_medical_record(record):
+    """Detalle de una consulta"""
+    if not record:
+        st.warning("La consulta ya no existe")
+        return
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.write(f"**Motivo de Consulta:**")
+        st.write(record['motivo_consulta'])
         
-        df_history = db.get_patient_medical_history(patient_id)
+        if record['diagnostico']:
+            st.write(f"**Diagnóstico:**")
+            st.write(record['diagnostico'])
+    
+    with col2:
+        if record['receta']:
+            st.write(f"**Receta:**")
+            st.write(record['receta'])
         
-        if df_history.empty:
-            st.info("El paciente no tiene historial médico registrado")
-        else:
-            for _, record in df_history.iterrows():
-                with st.expander(f"📅 {format_datetime(record['fecha'])} - Dr. {record['medico_nombre']}"):
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.write(f"**Motivo de Consulta:**")
-                        st.write(record['motivo_consulta'])
-                        
-                        if record['diagnostico']:
-                            st.write(f"**Diagnóstico:**")
-                            st.write(record['diagnostico'])
-                    
-                    with col2:
-                        if record['receta']:
-                            st.write(f"**Receta:**")
-                            st.write(record['receta'])
-                        
-                        if record['examenes_solicitados']:
-                            st.write(f"**Exámenes Solicitados:**")
-                            st.write(record['examenes_solicitados'])
-                    
-                    if record['observaciones']:
-                        st.write(f"**Observaciones:**")
-                        st.write(record['observaciones'])
+        if record['examenes_solicitados']:
+            st.write(f"**Exámenes Solicitados:**")
+            st.write(record['examenes_solicitados'])
+    
+    if record['observaciones']:
+        st.write(f"**Observaciones:**")
+        st.write(record['observaciones'])
 
 def show_new_medical_record_form(db, user):
     """Formulario para nuevo registro médico"""
     st.subheader("➕ Registrar Nueva Consulta")
     
+    # Selector de paciente (fuera del formulario para que la búsqueda responda al escribir)
+    patient_id = patient_picker(db, key="new_record_patient", label="Seleccionar Paciente *")
+    
+    if not patient_id:
+        st.error("Debe seleccionar un paciente")
+        return
+    
     with st.form("new_medical_record_form", clear_on_submit=True):
-        # Selector de paciente
-        df_patients = db.get_patients()
-        
-        if df_patients.empty:
-            st.error("No hay pacientes registrados")
-            st.form_submit_button("Registrar Consulta", disabled=True)
-            return
-        
-        patient_options = {}
-        for _, patient in df_patients.iterrows():
-            patient_options[f"{patient['nombre_completo']} - {patient['dni']}"] = patient['id']
-        
-        selected_patient_key = st.selectbox("Seleccionar Paciente *", options=list(patient_options.keys()))
-        
         # Verificar si hay una cita asociada
         st.info("💡 Tip: Si esta consulta está relacionada con una cita específica, la asociación se puede hacer después.")
         
@@ -149,10 +163,8 @@ def show_new_medical_record_form(db, user):
         submitted = st.form_submit_button("📝 Registrar Consulta", use_container_width=True)
         
         if submitted:
-            if selected_patient_key and motivo_consulta:
+            if patient_id and motivo_consulta:
                 try:
-                    patient_id = patient_options[selected_patient_key]
-                    
                     # Crear registro médico
                     record_id = db.create_medical_record(
                         paciente_id=patient_id,
@@ -176,20 +188,9 @@ def show_prescription_generator(db, user):
     st.subheader("📄 Generar Receta Médica")
     
     # Selector de paciente
-    df_patients = db.get_patients()
-    
-    if df_patients.empty:
-        st.info("No hay pacientes registrados")
-        return
-    
-    patient_options = {}
-    for _, patient in df_patients.iterrows():
-        patient_options[f"{patient['nombre_completo']} - {patient['dni']}"] = patient['id']
-    
-    selected_patient_key = st.selectbox("Seleccionar Paciente", options=list(patient_options.keys()), key="prescription_patient")
+    patient_id = patient_picker(db, key="prescription_patient")
     
-    if selected_patient_key:
-        patient_id = patient_options[selected_patient_key]
+    if patient_id:
         patient_data = db.get_patient_by_id(patient_id)
         
         # Mostrar datos del paciente
@@ -238,7 +239,7 @@ def show_prescription_generator(db, user):
                         }
                         
                         pdf_bytes = pdf_generator.generate_prescription(
-                            patient_data, doctor_data, prescription_data
+                            patient_data, doctor_data, prescription_data, db.get_clinic_config()
                         )
                         
                         # Botón de descarga
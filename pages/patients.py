@@ -5,9 +5,11 @@ from database.db_manager import DatabaseManager
 from utils.auth import require_auth, can_manage_patients
 from utils.helpers import (
     show_success_message, show_error_message, validate_email, 
-    validate_phone, validate_dni, get_age_from_birthdate,
-    paginate_dataframe, show_pagination_controls
+    validate_phone, validate_dni,
+    patient_picker, clear_patient_picker_cache, cursor_page, back_if_empty_page, show_cursor_pagination
 )
+from utils.patient_import import import_patients, file_key, DEFAULT_CHUNK_SIZE
+from utils.demographics import compute_ages
 
 @require_auth(['administrador', 'doctor', 'recepcionista'])
 def show_patient_management():
@@ -17,7 +19,9 @@ def show_patient_management():
     db = DatabaseManager()
     
     # Tabs para diferentes funciones
-    tab1, tab2, tab3, tab4 = st.tabs(["📋 Lista de Pacientes", "➕ Nuevo Paciente", "✏️ Editar Paciente", "📄 Documentos"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+        "📋 Lista de Pacientes", "➕ Nuevo Paciente", "✏️ Editar Paciente", "📄 Documentos", "📥 Importar"
+    ])
     
     with tab1:
         show_patients_list(db)
@@ -30,6 +34,9 @@ def show_patient_management():
     
     with tab4:
         show_patient_documents(db)
+    
+    with tab5:
+        show_patient_import(db)
 
 def show_patients_list(db):
     """Muestra la lista de pacientes"""
@@ -50,15 +57,20 @@ def show_patients_list(db):
             st.session_state.patient_search = ""
             st.rerun()
     
-    # Obtener pacientes
-    df_patients = db.get_patients(search_term if search_term else None)
+    search_term = search_term if search_term else None
+    page_size = 10
+    
+    # Obtener solo la página actual (la paginación se reinicia cuando cambia la búsqueda)
+    after = cursor_page('patients_page_cursors', scope=search_term)
+    df_patients, total_patients = db.get_patients_page(search_term, after=after, limit=page_size)
     
     if df_patients.empty:
+        back_if_empty_page('patients_page_cursors')
         st.info("No se encontraron pacientes" if search_term else "No hay pacientes registrados")
         return
     
     # Agregar columna de edad
-    df_patients['edad'] = df_patients['fecha_nacimiento'].apply(get_age_from_birthdate)
+    df_patients['edad'] = compute_ages(df_patients['fecha_nacimiento'])
     
     # Configurar columnas para mostrar
     columns_to_show = ['nombre_completo', 'dni', 'edad', 'sexo', 'telefono', 'email', 'estado']
@@ -67,13 +79,9 @@ def show_patients_list(db):
     # Renombrar columnas para mostrar
     df_display.columns = ['Nombre Completo', 'DNI', 'Edad', 'Sexo', 'Teléfono', 'Email', 'Estado']
     
-    # Paginación
-    page_size = 10
-    df_paginated, current_page, total_pages = paginate_dataframe(df_display, page_size)
-    
     # Mostrar tabla
     st.dataframe(
-        df_paginated,
+        df_display,
         use_container_width=True,
         hide_index=True,
         column_config={
@@ -86,25 +94,27 @@ def show_patients_list(db):
     )
     
     # Controles de paginación
-    show_pagination_controls(current_page, total_pages)
+    show_cursor_pagination('patients_page_cursors', df_patients, page_size,
+                           ('nombre_completo', 'id'), total=total_patients)
+    
+    # Mostrar estadísticas (calculadas en SQL, sin cargar todos los pacientes)
+    summary = db.get_patient_summary(search_term)
     
-    # Mostrar estadísticas
     st.subheader("📊 Estadísticas")
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.metric("Total Pacientes", len(df_patients))
+        st.metric("Total Pacientes", total_patients)
     
     with col2:
-        st.metric("Pacientes Activos", len(df_patients[df_patients['estado'] == 'activo']))
+        st.metric("Pacientes Activos", summary['total'])
     
     with col3:
-        avg_age = df_patients['edad'].mean() if 'edad' in df_patients.columns else 0
+        avg_age = summary['edad_promedio']
         st.metric("Edad Promedio", f"{avg_age:.1f}" if avg_age else "N/A")
     
     with col4:
-        male_count = len(df_patients[df_patients['sexo'] == 'M'])
-        st.metric("Pacientes Masculinos", male_count)
+        st.metric("Pacientes Masculinos", summary['masculinos'])
 
 def show_new_patient_form(db):
     """Formulario para crear nuevo paciente"""
@@ -182,6 +192,7 @@ def show_new_patient_form(db):
                         enfermedades_cronicas=enfermedades_cronicas if enfermedades_cronicas else None
                     )
                     
+                    clear_patient_picker_cache()
                     show_success_message(f"Paciente registrado exitosamente (ID: {patient_id})")
                     
                 except Exception as e:
@@ -195,25 +206,9 @@ def show_edit_patient_form(db):
     st.subheader("✏️ Editar Paciente")
     
     # Selector de paciente
-    df_patients = db.get_patients()
-    
-    if df_patients.empty:
-        st.info("No hay pacientes registrados para editar")
-        return
-    
-    # Crear diccionario para el selectbox
-    patient_options = {}
-    for _, patient in df_patients.iterrows():
-        patient_options[f"{patient['nombre_completo']} - {patient['dni']}"] = patient['id']
-    
-    selected_patient_key = st.selectbox(
-        "Seleccionar Paciente",
-        options=list(patient_options.keys()),
-        key="edit_patient_selector"
-    )
+    patient_id = patient_picker(db, key="edit_patient_selector")
     
-    if selected_patient_key:
-        patient_id = patient_options[selected_patient_key]
+    if patient_id:
         patient_data = db.get_patient_by_id(patient_id)
         
         if patient_data:
@@ -297,6 +292,7 @@ def show_edit_patient_form(db):
                                 estado=estado
                             )
                             
+                            clear_patient_picker_cache()
                             show_success_message("Paciente actualizado exitosamente")
                             
                         except Exception as e:
@@ -310,25 +306,9 @@ def show_patient_documents(db):
     st.subheader("📄 Documentos Médicos")
     
     # Selector de paciente
-    df_patients = db.get_patients()
-    
-    if df_patients.empty:
-        st.info("No hay pacientes registrados")
-        return
-    
-    patient_options = {}
-    for _, patient in df_patients.iterrows():
-        patient_options[f"{patient['nombre_completo']} - {patient['dni']}"] = patient['id']
+    patient_id = patient_picker(db, key="documents_patient_selector")
     
-    selected_patient_key = st.selectbox(
-        "Seleccionar Paciente",
-        options=list(patient_options.keys()),
-        key="documents_patient_selector"
-    )
-    
-    if selected_patient_key:
-        patient_id = patient_options[selected_patient_key]
-        
+    if patient_id:
         # Subir nuevo documento
         st.write("**Subir Nuevo Documento**")
         
@@ -354,5 +334,61 @@ def show_patient_documents(db):
         st.write("**Documentos del Paciente**")
         st.info("Funcionalidad de documentos en desarrollo. Aquí se mostrarían los documentos médicos del paciente.")
 
+def show_patient_import(db):
+    """Importación masiva de pacientes desde CSV o Excel"""
+    st.subheader("📥 Importar Pacientes")
+    
+    st.write(
+        "Columnas obligatorias: `dni`, `nombre_completo`, `fecha_nacimiento`, `sexo`. "
+        "Opcionales: `telefono`, `direccion`, `email`, `grupo_sanguineo`, `alergias`, `enfermedades_cronicas`."
+    )
+    
+    uploaded_file = st.file_uploader("Archivo de pacientes", type=['csv', 'xlsx'], key="patients_import_file")
+    chunk_size = st.number_input("Filas por lote", min_value=100, max_value=10000, value=DEFAULT_CHUNK_SIZE, step=100)
+    
+    if not uploaded_file:
+        return
+    
+    data = uploaded_file.getvalue()
+    previous = db.get_import(file_key(data))
+    if previous and previous['estado'] == 'en_curso' and previous['filas_procesadas'] > 0:
+        st.info(f"Este archivo ya se importó parcialmente. Se reanudará después de la fila {previous['filas_procesadas']}.")
+    elif previous and previous['estado'] == 'completada':
+        st.warning("Este archivo ya fue importado completamente.")
+    
+    if st.button("📥 Importar Pacientes", use_container_width=True):
+        progress = st.progress(0.0, text="Importando...")
+        status = st.empty()
+        errors = []
+        total_inserted = 0
+        
+        try:
+            # Solo para la barra de progreso: número aproximado de filas
+            total_rows = max(data.count(b'\n'), 1) if uploaded_file.name.lower().endswith('.csv') else None
+            
+            for report in import_patients(db, data, uploaded_file.name, int(chunk_size)):
+                total_inserted += report['insertados']
+                errors.extend(report['detalle'])
+                status.write(f"Procesadas hasta la fila {report['fila']}: {total_inserted} insertados, {len(errors)} con errores")
+                if total_rows:
+                    progress.progress(min(report['fila'] / total_rows, 1.0), text="Importando...")
+            
+            progress.progress(1.0, text="Importación finalizada")
+            clear_patient_picker_cache()
+            show_success_message(f"Importación finalizada: {total_inserted} pacientes registrados")
+        except Exception as e:
+            show_error_message(f"Error durante la importación: {str(e)}. Puede reintentar para reanudarla.")
+        
+        if errors:
+            df_errors = pd.DataFrame(errors, columns=['Fila', 'DNI', 'Error'])
+            st.write(f"**Filas con errores ({len(df_errors)})**")
+            st.dataframe(df_errors, use_container_width=True, hide_index=True)
+            st.download_button(
+                "📥 Descargar errores (CSV)",
+                data=df_errors.to_csv(index=False).encode('utf-8'),
+                file_name=f"errores_{uploaded_file.name}.csv",
+                mime="text/csv"
+            )
+
 if __name__ == "__main__":
     show_patient_management()
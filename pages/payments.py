@@ -1,13 +1,15 @@
 import streamlit as st
 import pandas as pd
+import os
 from datetime import datetime, date, timedelta
 from database.db_manager import DatabaseManager
 from utils.auth import require_auth, get_current_user
 from utils.helpers import (
     show_success_message, show_error_message, format_currency, 
     create_chart_payments_by_method, create_chart_monthly_revenue,
-    PDFGenerator
+    PDFGenerator, cursor_page, back_if_empty_page, show_cursor_pagination
 )
+from utils.pdf_engine import render_invoices_zip
 
 @require_auth(['administrador', 'recepcionista'])
 def show_payments():
@@ -18,7 +20,9 @@ def show_payments():
     user = get_current_user()
     
     # Tabs para diferentes funciones
-    tab1, tab2, tab3, tab4 = st.tabs(["💳 Registrar Pago", "📋 Lista de Pagos", "📊 Estadísticas", "🧾 Facturación"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+        "💳 Registrar Pago", "📋 Lista de Pagos", "📊 Estadísticas", "🧾 Facturación", "📒 Cuentas por Cobrar"
+    ])
     
     with tab1:
         show_payment_form(db, user)
@@ -31,29 +35,39 @@ def show_payments():
     
     with tab4:
         show_invoicing(db, user)
+    
+    with tab5:
+        show_receivables(db, user)
 
 def show_payment_form(db, user):
     """Formulario para registrar pagos"""
     st.subheader("💳 Registrar Nuevo Pago")
     
-    # Obtener citas atendidas sin pago
-    today = date.today()
-    start_date = today - timedelta(days=30)  # Últimos 30 días
+    # Citas atendidas sin pago, por páginas y con búsqueda por paciente
+    page_size = 20
+    search_term = st.text_input(
+        "🔍 Buscar paciente (nombre, DNI, teléfono o email)",
+        key="unpaid_appointments_search"
+    ).strip()
     
-    # Aquí se necesitaría una consulta más compleja para obtener citas sin pago
-    # Por simplicidad, obtenemos todas las citas atendidas
-    df_appointments = db.get_appointments(estado='atendida')
+    after = cursor_page('unpaid_appointments_cursors', scope=search_term)
+    df_appointments = db.get_unpaid_appointments(search_term=search_term or None, after=after, limit=page_size)
     
     if df_appointments.empty:
-        st.info("No hay citas atendidas disponibles para registrar pagos")
+        back_if_empty_page('unpaid_appointments_cursors')
+        st.info("No hay citas atendidas pendientes de pago")
         return
     
+    show_cursor_pagination('unpaid_appointments_cursors', df_appointments, page_size, ('fecha', 'id'),
+                           caption="Página {page} de citas pendientes de pago",
+                           labels=("⬅️ Más recientes", "Más antiguas ➡️"))
+    
     with st.form("payment_form", clear_on_submit=True):
         # Selector de cita
-        appointment_options = {}
-        for _, apt in df_appointments.iterrows():
-            date_str = apt['fecha']
-            appointment_options[f"{date_str} - {apt['paciente_nombre']} - Dr. {apt['medico_nombre']}"] = apt['id']
+        appointment_options = {
+            f"{apt.fecha} - {apt.paciente_nombre} ({apt.paciente_dni}) - Dr. {apt.medico_nombre}": int(apt.id)
+            for apt in df_appointments.itertuples()
+        }
         
         selected_appointment_key = st.selectbox(
             "Seleccionar Cita *",
@@ -154,24 +168,41 @@ def show_payments_list(db, user):
         hide_index=True
     )
     
-    # Botón de exportación
-    if st.button("📥 Exportar a Excel"):
-        try:
-            from utils.helpers import export_to_excel
-            
-            excel_data = export_to_excel(
-                {'Pagos': df_payments},
-                f'pagos_{start_date}_{end_date}.xlsx'
-            )
-            
-            st.download_button(
-                label="📥 Descargar Excel",
-                data=excel_data,
-                file_name=f'pagos_{start_date}_{end_date}.xlsx',
-                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        except ImportError:
-            st.error("Funcionalidad de exportación no disponible")
+    # Exportación (se lee de la base por bloques, sin usar el DataFrame de la tabla)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        export_format = st.radio("Formato", ['xlsx', 'csv'], horizontal=True,
+                                 format_func=lambda x: 'Excel' if x == 'xlsx' else 'CSV')
+    with col2:
+        full_history = st.checkbox("Todo el historial")
+    
+    with col3:
+        if st.button("📥 Exportar", use_container_width=True):
+            try:
+                from utils.export import export_rows, export_mime
+                
+                if full_history:
+                    columns, blocks = db.iter_payments()
+                    file_name = f'pagos_historial.{export_format}'
+                else:
+                    columns, blocks = db.iter_payments(start_date.isoformat(), end_date.isoformat())
+                    file_name = f'pagos_{start_date}_{end_date}.{export_format}'
+                
+                with st.spinner("Exportando..."):
+                    path, count = export_rows(columns, blocks, export_format, 'Pagos')
+                
+                try:
+                    with open(path, 'rb') as f:
+                        st.download_button(
+                            label=f"📥 Descargar ({count} pagos)",
+                            data=f,
+                            file_name=file_name,
+                            mime=export_mime(export_format)
+                        )
+                finally:
+                    os.remove(path)
+            except ImportError:
+                st.error("Funcionalidad de exportación no disponible")
 
 def show_payment_statistics(db, user):
     """Estadísticas de pagos"""
@@ -186,10 +217,10 @@ def show_payment_statistics(db, user):
     with col2:
         end_date = st.date_input("Fecha Fin", value=date.today(), key="stats_end")
     
-    # Obtener datos
-    df_payments = db.get_payments(start_date.isoformat(), end_date.isoformat())
+    # Obtener datos (agregados por día, médico y método; no se leen los pagos uno a uno)
+    totals = db.get_revenue(start_date, end_date).iloc[0]
     
-    if df_payments.empty:
+    if not totals['pagos']:
         st.info("No hay datos de pagos para mostrar estadísticas")
         return
     
@@ -197,10 +228,10 @@ def show_payment_statistics(db, user):
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.metric("Total Pagos", len(df_payments))
+        st.metric("Total Pagos", int(totals['pagos']))
     
     with col2:
-        total_ingresos = df_payments['monto'].sum()
+        total_ingresos = totals['total']
         st.metric("Ingresos Totales", format_currency(total_ingresos))
     
     with col3:
@@ -208,7 +239,7 @@ def show_payment_statistics(db, user):
         st.metric("Promedio Diario", format_currency(promedio_diario))
     
     with col4:
-        pago_promedio = df_payments['monto'].mean()
+        pago_promedio = total_ingresos / totals['pagos']
         st.metric("Pago Promedio", format_currency(pago_promedio))
     
     # Gráficos
@@ -216,32 +247,100 @@ def show_payment_statistics(db, user):
     
     with col1:
         st.subheader("Pagos por Método")
-        fig_methods = create_chart_payments_by_method(df_payments)
+        fig_methods = create_chart_payments_by_method(db.get_revenue(start_date, end_date, ('metodo',)))
         if fig_methods:
             st.plotly_chart(fig_methods, use_container_width=True)
     
     with col2:
         st.subheader("Ingresos por Médico")
-        revenue_by_doctor = df_payments.groupby('medico_nombre')['monto'].sum().reset_index()
-        revenue_by_doctor = revenue_by_doctor.sort_values('monto', ascending=False)
+        revenue_by_doctor = db.get_revenue(start_date, end_date, ('medico',))
+        revenue_by_doctor = revenue_by_doctor.sort_values('total', ascending=False)
         
         if not revenue_by_doctor.empty:
             import plotly.express as px
             fig = px.bar(
                 revenue_by_doctor,
                 x='medico_nombre',
-                y='monto',
+                y='total',
                 title='Ingresos por Médico'
             )
-            fig.update_xaxis(tickangle=45)
+            fig.update_xaxes(tickangle=45)
             st.plotly_chart(fig, use_container_width=True)
     
     # Tendencia mensual
     st.subheader("Tendencia de Ingresos")
-    fig_monthly = create_chart_monthly_revenue(df_payments)
+    fig_monthly = create_chart_monthly_revenue(db.get_revenue(start_date, end_date, ('mes',)))
     if fig_monthly:
         st.plotly_chart(fig_monthly, use_container_width=True)
 
+def show_receivables(db, user):
+    """Saldos pendientes por antigüedad y registro de cargos"""
+    st.subheader("📒 Cuentas por Cobrar")
+    
+    # Tramos de antigüedad (desde la tabla de saldos, sin recorrer cargos ni pagos)
+    aging = db.get_receivables_aging()
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        st.metric("Total Pendiente", format_currency(aging['total']))
+    with col2:
+        st.metric("0-30 días", format_currency(aging['tramos']['0-30']))
+    with col3:
+        st.metric("31-60 días", format_currency(aging['tramos']['31-60']))
+    with col4:
+        st.metric("61-90 días", format_currency(aging['tramos']['61-90']))
+    with col5:
+        st.metric("Más de 90 días", format_currency(aging['tramos']['90+']))
+    
+    st.divider()
+    
+    # Pacientes con deuda
+    st.write("**Pacientes con saldo pendiente**")
+    df_balances = db.get_outstanding_balances()
+    
+    if df_balances.empty:
+        st.info("No hay saldos pendientes")
+    else:
+        df_display = df_balances[['paciente_nombre', 'paciente_dni', 'cargado', 'pagado', 'saldo', 'a_favor']].copy()
+        df_display.columns = ['Paciente', 'DNI', 'Cargado', 'Pagado', 'Saldo', 'A favor']
+        for column in ['Cargado', 'Pagado', 'Saldo', 'A favor']:
+            df_display[column] = df_display[column].apply(format_currency)
+        st.dataframe(df_display, use_container_width=True, hide_index=True)
+    
+    st.divider()
+    
+    # Registrar cargo por una cita atendida (las pagadas también, si aún no tienen cargo)
+    st.write("**Registrar cargo**")
+    df_appointments = db.get_uncharged_appointments(limit=50)
+    
+    if df_appointments.empty:
+        st.info("No hay citas atendidas sin cargo")
+        return
+    
+    with st.form("charge_form", clear_on_submit=True):
+        appointment_options = {
+            f"{apt.fecha} - {apt.paciente_nombre} ({apt.paciente_dni}) - Dr. {apt.medico_nombre}": int(apt.id)
+            for apt in df_appointments.itertuples()
+        }
+        selected_appointment_key = st.selectbox("Cita *", options=list(appointment_options.keys()))
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            monto = st.number_input("Monto *", min_value=0.0, step=0.01, format="%.2f")
+        with col2:
+            concepto = st.text_input("Concepto", value="Consulta médica", max_chars=200)
+        
+        if st.form_submit_button("📒 Registrar Cargo", use_container_width=True):
+            if selected_appointment_key and monto > 0:
+                try:
+                    charge_id = db.create_charge(
+                        appointment_options[selected_appointment_key], monto, concepto or "Consulta médica"
+                    )
+                    show_success_message(f"Cargo registrado exitosamente (ID: {charge_id})")
+                except Exception as e:
+                    show_error_message(f"Error al registrar cargo: {str(e)}")
+            else:
+                show_error_message("Por favor complete todos los campos obligatorios")
+
 def show_invoicing(db, user):
     """Generación de facturas"""
     st.subheader("🧾 Generación de Facturas")
@@ -257,13 +356,28 @@ def show_invoicing(db, user):
             'email': 'email@clinica.com'
         }
     
-    # Selector de pago para facturar
-    df_payments = db.get_payments()
+    # Rango de fechas de los pagos a facturar
+    col1, col2 = st.columns(2)
+    with col1:
+        start_date = st.date_input("Desde", value=date.today().replace(day=1), key="invoice_start")
+    with col2:
+        end_date = st.date_input("Hasta", value=date.today(), key="invoice_end")
+    
+    if start_date > end_date:
+        st.error("La fecha inicial debe ser anterior a la final")
+        return
+    
+    df_payments = db.get_payments(start_date.isoformat(), end_date.isoformat())
     
     if df_payments.empty:
-        st.info("No hay pagos registrados para generar facturas")
+        st.info("No hay pagos registrados en este período para generar facturas")
         return
     
+    show_batch_invoicing(db, clinic_config, start_date, end_date, len(df_payments))
+    
+    st.divider()
+    st.write("**Factura individual**")
+    
     payment_options = {}
     for _, payment in df_payments.iterrows():
         payment_info = f"{payment['fecha_pago']} - {payment['paciente_nombre']} - {format_currency(payment['monto'])}"
@@ -298,12 +412,9 @@ def show_invoicing(db, user):
         # Generar factura
         if st.button("📄 Generar Factura PDF", use_container_width=True):
             try:
-                # Obtener datos del paciente
-                # Esto requeriría una consulta adicional para obtener el paciente por nombre
-                # Por simplicidad, simulamos los datos del paciente
                 patient_data = {
                     'nombre_completo': selected_payment['paciente_nombre'],
-                    'dni': '12345678'  # Esto debería obtenerse de la base de datos
+                    'dni': selected_payment['paciente_dni']
                 }
                 
                 # Generar PDF
@@ -328,5 +439,33 @@ def show_invoicing(db, user):
             except Exception as e:
                 show_error_message(f"Error al generar factura: {str(e)}")
 
+def show_batch_invoicing(db, clinic_config, start_date, end_date, total_payments):
+    """Genera las facturas de todos los pagos de un período en un ZIP"""
+    st.write(f"**Facturación por lotes:** {total_payments} pagos entre "
+             f"{start_date.strftime('%d/%m/%Y')} y {end_date.strftime('%d/%m/%Y')}")
+    
+    if st.button("🗂️ Generar todas las facturas (ZIP)", use_container_width=True):
+        try:
+            with st.spinner("Generando facturas..."):
+                invoices = db.iter_invoice_data(start_date.isoformat(), end_date.isoformat())
+                zip_file, count = render_invoices_zip(invoices, clinic_config)
+                # st.download_button guarda el contenido en memoria de todos modos: el ZIP
+                # se arma en disco y solo se lee completo una vez, para entregarlo
+                with zip_file:
+                    zip_bytes = zip_file.read()
+            
+            st.download_button(
+                label=f"📥 Descargar {count} facturas (ZIP)",
+                data=zip_bytes,
+                file_name=f"facturas_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.zip",
+                mime="application/zip",
+                use_container_width=True
+            )
+            
+            show_success_message(f"{count} facturas generadas exitosamente")
+            
+        except Exception as e:
+            show_error_message(f"Error al generar facturas: {str(e)}")
+
 if __name__ == "__main__":
     show_payments()
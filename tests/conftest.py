@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# Permitir importar los paquetes del proyecto (database, utils) al ejecutar pytest desde cualquier carpeta
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import sessions
+from database.db_manager import DatabaseManager
+from database.init_db import init_database
+
+
+@pytest.fixture(autouse=True)
+def secret_key(monkeypatch):
+    """Clave de firma fija: las pruebas no crean database/.secret_key"""
+    monkeypatch.setattr(sessions, '_secret_key', b'clave-de-prueba')
+
+
+@pytest.fixture
+def db(tmp_path):
+    """DatabaseManager sobre una base temporal con todas las migraciones aplicadas"""
+    db_path = str(tmp_path / 'clinica.db')
+    init_database(db_path)
+    return DatabaseManager(db_path)
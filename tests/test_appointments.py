@@ -0,0 +1,129 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time, timedelta
+
+import pytest
+
+from database.storage import connect
+
+FECHA = '2099-01-05'
+
+
+@pytest.fixture
+def ids(db):
+    """Dos médicos de Cardiología, uno de Pediatría y un paciente"""
+    conn = connect(db.db_path)
+    ids = {'medicos': []}
+    for i, (nombre, especialidad) in enumerate([('Dr B', 'Cardiología'), ('Dr A', 'Cardiología'),
+                                                 ('Dr C', 'Pediatría')]):
+        ids['medicos'].append(conn.execute('''
+            INSERT INTO usuarios (username, email, password_hash, rol, nombre_completo, especialidad)
+            VALUES (?, ?, '$2b$04$hash', 'doctor', ?, ?)
+        ''', (f'doc{i}', f'doc{i}@clinica.com', nombre, especialidad)).lastrowid)
+    ids['paciente'] = conn.execute('''
+        INSERT INTO pacientes (dni, nombre_completo, fecha_nacimiento, sexo)
+        VALUES ('12345678', 'Paciente Prueba', '1990-01-01', 'F')
+    ''').lastrowid
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def test_double_booking_returns_none(db, ids):
+    medico = ids['medicos'][0]
+    assert db.create_appointment(ids['paciente'], medico, FECHA, '09:00') is not None
+
+    # La hora se normaliza: '09:00' y '09:00:00' son el mismo horario
+    assert db.create_appointment(ids['paciente'], medico, FECHA, '09:00') is None
+    assert db.create_appointment(ids['paciente'], medico, FECHA, '09:00:00') is None
+    assert time(9, 0) not in db.get_free_slots(medico, FECHA)
+
+    # El mismo horario con otro médico, u otro horario, sí se puede reservar
+    assert db.create_appointment(ids['paciente'], ids['medicos'][1], FECHA, '09:00') is not None
+    assert db.create_appointment(ids['paciente'], medico, FECHA, '09:30') is not None
+
+
+def test_cancelled_slot_can_be_booked_again(db, ids):
+    medico = ids['medicos'][0]
+    cita_id = db.create_appointment(ids['paciente'], medico, FECHA, '09:00')
+    db.update_appointment_status(cita_id, 'cancelada')
+
+    assert db.create_appointment(ids['paciente'], medico, FECHA, '09:00') is not None
+
+
+def test_concurrent_bookings_of_one_slot_get_a_single_appointment(db, ids):
+    medico = ids['medicos'][0]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(
+            lambda _: db.create_appointment(ids['paciente'], medico, FECHA, '10:00'), range(8)
+        ))
+
+    assert len([result for result in results if result is not None]) == 1
+
+
+def _slot(result):
+    return result['fecha'], result['hora'].strftime('%H:%M'), result['medico_nombre']
+
+
+def test_first_available_is_ordered_by_date_time_and_doctor(db, ids):
+    results = db.find_first_available('Cardiología', FECHA, days=7, limit=4)
+
+    assert [_slot(result) for result in results] == [
+        (FECHA, '08:00', 'Dr A'), (FECHA, '08:00', 'Dr B'),
+        (FECHA, '08:30', 'Dr A'), (FECHA, '08:30', 'Dr B'),
+    ]
+
+
+def test_first_available_skips_booked_slots_and_other_specialties(db, ids):
+    db.create_appointment(ids['paciente'], ids['medicos'][1], FECHA, '08:00')  # Dr A
+
+    assert [_slot(result) for result in db.find_first_available('Cardiología', FECHA, limit=2)] == [
+        (FECHA, '08:00', 'Dr B'), (FECHA, '08:30', 'Dr A'),
+    ]
+    assert {result['medico_nombre'] for result in db.find_first_available('Pediatría', FECHA, limit=5)} == {'Dr C'}
+
+
+def test_first_available_crosses_fully_booked_weeks(db, ids):
+    # Los dos cardiólogos sin horarios libres durante 8 días (más de un tramo de una semana)
+    slots = [slot.strftime('%H:%M:%S') for slot in db.get_free_slots(ids['medicos'][0], FECHA)]
+    first_day = date.fromisoformat(FECHA)
+    conn = connect(db.db_path)
+    conn.executemany(
+        "INSERT INTO citas (paciente_id, medico_id, fecha, hora) VALUES (?, ?, ?, ?)",
+        [(ids['paciente'], medico, (first_day + timedelta(days=offset)).isoformat(), hora)
+         for medico in ids['medicos'][:2] for offset in range(8) for hora in slots]
+    )
+    conn.commit()
+    conn.close()
+
+    assert db.find_first_available('Cardiología', FECHA, days=8, limit=3) == []
+    results = db.find_first_available('Cardiología', FECHA, days=10, limit=3)
+    assert [_slot(result) for result in results] == [
+        ((first_day + timedelta(days=8)).isoformat(), '08:00', 'Dr A'),
+        ((first_day + timedelta(days=8)).isoformat(), '08:00', 'Dr B'),
+        ((first_day + timedelta(days=8)).isoformat(), '08:30', 'Dr A'),
+    ]
+
+
+@pytest.mark.parametrize('limit', [1, 7, 25, 200])
+def test_first_available_matches_the_free_slots_of_each_doctor(db, ids, limit):
+    rng = random.Random(limit)
+    first_day = date.fromisoformat(FECHA)
+    slots = db.get_free_slots(ids['medicos'][0], FECHA)
+    for _ in range(60):
+        db.create_appointment(ids['paciente'], rng.choice(ids['medicos']),
+                              (first_day + timedelta(days=rng.randrange(9))).isoformat(),
+                              rng.choice(slots).strftime('%H:%M'))
+
+    # Recorrido directo: cada día, cada horario y cada médico por nombre
+    doctors = sorted((nombre, medico) for medico, nombre in zip(ids['medicos'], ['Dr B', 'Dr A', 'Dr C']))
+    expected = []
+    for offset in range(9):
+        fecha = (first_day + timedelta(days=offset)).isoformat()
+        free = {medico: set(db.get_free_slots(medico, fecha)) for _, medico in doctors}
+        for slot in slots:
+            expected.extend((fecha, slot.strftime('%H:%M'), nombre) for nombre, medico in doctors if slot in free[medico])
+
+    results = db.find_first_available(None, FECHA, days=9, limit=limit)
+    assert len(results) == min(limit, len(expected))
+    assert [_slot(result) for result in results] == expected[:limit]
@@ -0,0 +1,165 @@
+import inspect
+import re
+
+import pytest
+
+import database.db_manager as db_manager
+from database.cache import QueryCache
+from database.storage import connect
+
+FUTURE_DATE = '2099-01-05'
+
+
+@pytest.fixture
+def ids(db):
+    """Un médico, un paciente y una cita con un cargo"""
+    conn = connect(db.db_path)
+    ids = {}
+    ids['medico'] = conn.execute('''
+        INSERT INTO usuarios (username, email, password_hash, rol, nombre_completo)
+        VALUES ('doc', 'doc@clinica.com', '$2b$04$hash', 'doctor', 'Dr Prueba')
+    ''').lastrowid
+    ids['paciente'] = conn.execute('''
+        INSERT INTO pacientes (dni, nombre_completo, fecha_nacimiento, sexo)
+        VALUES ('12345678', 'Paciente Prueba', '1990-01-01', 'F')
+    ''').lastrowid
+    ids['cita'] = conn.execute('''
+        INSERT INTO citas (paciente_id, medico_id, fecha, hora, estado) VALUES (?, ?, ?, '10:00:00', 'pendiente')
+    ''', (ids['paciente'], ids['medico'], FUTURE_DATE)).lastrowid
+    ids['cargo'] = conn.execute('''
+        INSERT INTO cargos (cita_id, paciente_id, monto, fecha) VALUES (?, ?, 100, ?)
+    ''', (ids['cita'], ids['paciente'], FUTURE_DATE)).lastrowid
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def _new_patient(dni):
+    return {'dni': dni, 'nombre_completo': f'Paciente {dni}', 'fecha_nacimiento': '1990-01-01', 'sexo': 'M'}
+
+
+# Método de escritura -> (lectura cacheada que depende de él, escritura)
+WRITES = {
+    'create_patient': (
+        lambda db, ids: db.get_patients_page()[1],
+        lambda db, ids: db.create_patient('20000000', 'Nuevo', '1990-01-01', 'M'),
+    ),
+    'bulk_create_patients': (
+        lambda db, ids: db.get_patients_page()[1],
+        lambda db, ids: db.bulk_create_patients([(1, _new_patient('30000000'))]),
+    ),
+    'update_patient': (
+        lambda db, ids: db.get_patient_by_id(ids['paciente'])['telefono'],
+        lambda db, ids: db.update_patient(ids['paciente'], telefono='999888777'),
+    ),
+    'create_user': (
+        lambda db, ids: len(db.get_users('doctor')),
+        lambda db, ids: db.create_user('doc2', 'doc2@clinica.com', 'clave', 'doctor', 'Dr Dos'),
+    ),
+    'bulk_create_users': (
+        lambda db, ids: len(db.get_users('doctor')),
+        lambda db, ids: db.bulk_create_users([{'username': 'doc3', 'email': 'doc3@clinica.com', 'password': 'clave',
+                                               'rol': 'doctor', 'nombre_completo': 'Dr Tres'}], rounds=4),
+    ),
+    '_rehash_password': (
+        lambda db, ids: db.get_users('doctor')['bcrypt_rounds'].tolist(),
+        lambda db, ids: db._rehash_password(ids['medico'], 'clave'),
+    ),
+    'create_appointment': (
+        lambda db, ids: len(db.get_free_slots(ids['medico'], FUTURE_DATE)),
+        lambda db, ids: db.create_appointment(ids['paciente'], ids['medico'], FUTURE_DATE, '09:00'),
+    ),
+    'update_appointment_status': (
+        lambda db, ids: db.get_appointments(date_filter=FUTURE_DATE)['estado'].tolist(),
+        lambda db, ids: db.update_appointment_status(ids['cita'], 'atendida'),
+    ),
+    'create_medical_record': (
+        lambda db, ids: len(db.get_medical_timeline(ids['paciente'])),
+        lambda db, ids: db.create_medical_record(ids['paciente'], ids['medico'], 'Control'),
+    ),
+    'create_payment': (
+        lambda db, ids: db.get_appointment_balance(ids['cita'])['pagado'],
+        lambda db, ids: db.create_payment(ids['cita'], 40, 'efectivo'),
+    ),
+    'create_charge': (
+        lambda db, ids: db.get_appointment_balance(ids['cita'])['cargado'],
+        lambda db, ids: db.create_charge(ids['cita'], 50),
+    ),
+    'void_charge': (
+        lambda db, ids: db.get_appointment_balance(ids['cita'])['cargado'],
+        lambda db, ids: db.void_charge(ids['cargo']),
+    ),
+    'update_clinic_config': (
+        lambda db, ids: (db.get_clinic_config() or {}).get('nombre_clinica'),
+        lambda db, ids: db.update_clinic_config(nombre_clinica='Clínica Prueba'),
+    ),
+}
+
+
+def test_every_invalidating_write_is_covered():
+    source = inspect.getsource(db_manager.DatabaseManager)
+    assert set(re.findall(r"@invalidates\([^)]*\)\s+def (\w+)", source)) == set(WRITES)
+
+
+@pytest.mark.parametrize('name', sorted(WRITES))
+def test_write_invalidates_cached_reads(db, ids, name):
+    read, write = WRITES[name]
+    before = read(db, ids)
+    assert read(db, ids) == before  # servido desde la caché
+
+    write(db, ids)
+    assert read(db, ids) != before
+
+
+def test_reads_are_served_from_the_cache(db, ids):
+    assert db.get_patient_by_id(ids['paciente'])['telefono'] is None
+
+    # Una escritura que no pasa por DatabaseManager no invalida la caché
+    with db.connection() as conn:
+        conn.execute("UPDATE pacientes SET telefono = '999888777' WHERE id = ?", (ids['paciente'],))
+        conn.commit()
+    assert db.get_patient_by_id(ids['paciente'])['telefono'] is None
+
+
+def test_cached_results_are_copies(db, ids):
+    db.get_patient_by_id(ids['paciente'])['telefono'] = 'modificado'
+    assert db.get_patient_by_id(ids['paciente'])['telefono'] is None
+
+
+def test_set_is_skipped_when_a_table_changed_since_the_snapshot():
+    cache = QueryCache()
+    snapshot = cache.snapshot(['pacientes'])
+    cache.invalidate_tables(['pacientes'])
+    cache.set('clave', 'viejo', ['pacientes'], snapshot)
+    assert cache.get('clave') == (False, None)
+
+    cache.set('clave', 'nuevo', ['pacientes'], cache.snapshot(['pacientes']))
+    assert cache.get('clave') == (True, 'nuevo')
+
+
+def test_invalidation_only_drops_dependent_entries():
+    cache = QueryCache()
+    cache.set('pacientes', 1, ['pacientes'], cache.snapshot(['pacientes']))
+    cache.set('citas', 2, ['citas', 'pacientes'], cache.snapshot(['citas', 'pacientes']))
+    cache.invalidate_tables(['citas'])
+    assert cache.get('pacientes') == (True, 1)
+    assert cache.get('citas') == (False, None)
+
+
+def test_write_during_a_cached_read_does_not_leave_a_stale_result(tmp_path):
+    class Reader:
+        db_path = str(tmp_path / 'clinica.db')
+        calls = 0
+
+        @db_manager.cached_query('pacientes')
+        def read(self):
+            Reader.calls += 1
+            if Reader.calls == 1:
+                # Otra sesión escribe mientras la consulta está en curso
+                db_manager._query_cache.invalidate_tables(['pacientes'])
+            return Reader.calls
+
+    reader = Reader()
+    assert reader.read() == 1
+    assert reader.read() == 2  # el resultado anterior a la escritura no se guardó
+    assert reader.read() == 2
@@ -0,0 +1,204 @@
+import random
+
+import pytest
+
+import database.init_db as init_db
+import database.migrations as migrations
+from database.migrations import apply_migrations, check_index_usage, get_schema_version, latest_version
+from database.storage import connect
+
+METHODS = ['efectivo', 'tarjeta', 'transferencia']
+
+
+def _seed(conn, rng, patients=20, appointments=300, prefix='a'):
+    """Datos de prueba en las tablas base: médicos, pacientes, citas y pagos"""
+    doctors = []
+    for i in range(4):
+        cursor = conn.execute('''
+            INSERT INTO usuarios (username, email, password_hash, rol, nombre_completo, estado)
+            VALUES (?, ?, '$2b$04$hash', 'doctor', ?, ?)
+        ''', (f'{prefix}doc{i}', f'{prefix}doc{i}@clinica.com', f'Dr {prefix}{i}', 'inactivo' if i == 3 else 'activo'))
+        doctors.append(cursor.lastrowid)
+
+    patient_ids = []
+    for i in range(patients):
+        cursor = conn.execute('''
+            INSERT INTO pacientes (dni, nombre_completo, fecha_nacimiento, sexo, estado)
+            VALUES (?, ?, '1990-01-01', 'F', ?)
+        ''', (f'{prefix}{10000000 + i}', f'Paciente {prefix}{i}', 'inactivo' if i % 7 == 0 else 'activo'))
+        patient_ids.append(cursor.lastrowid)
+
+    for i in range(appointments):
+        fecha = f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        cursor = conn.execute('''
+            INSERT INTO citas (paciente_id, medico_id, fecha, hora, estado) VALUES (?, ?, ?, ?, ?)
+        ''', (rng.choice(patient_ids), rng.choice(doctors), fecha, f"{i // 60 % 24:02d}:{i % 60:02d}:00",
+              rng.choice(['pendiente', 'atendida', 'atendida', 'cancelada'])))
+        cita_id = cursor.lastrowid
+
+        if rng.random() < 0.6:
+            conn.execute('''
+                INSERT INTO pagos (cita_id, monto, metodo_pago, estado, fecha_pago) VALUES (?, ?, ?, ?, ?)
+            ''', (cita_id, rng.randint(10, 200), rng.choice(METHODS),
+                  rng.choice(['pagado', 'pagado', 'pendiente']), f"{fecha} 10:00:00"))
+    conn.commit()
+    return doctors
+
+
+def _charge(conn, rng):
+    """Cargos para una parte de las citas (la tabla existe desde la migración 10)"""
+    conn.execute('''
+        INSERT INTO cargos (cita_id, paciente_id, monto, fecha)
+        SELECT id, paciente_id, 50 + id % 100, fecha FROM citas WHERE id % 3 = 0
+    ''')
+    conn.commit()
+
+
+def _mutate(conn, doctors):
+    """Cambios sobre las tablas base que deben propagar los triggers"""
+    conn.execute("UPDATE pacientes SET estado = 'activo' WHERE id % 7 = 0")
+    conn.execute("UPDATE pacientes SET estado = 'inactivo' WHERE id % 5 = 0")
+    conn.execute("UPDATE usuarios SET estado = 'activo' WHERE username = 'adoc3'")
+    conn.execute("UPDATE citas SET estado = 'cancelada' WHERE id % 5 = 0 AND estado = 'pendiente'")
+    conn.execute("UPDATE citas SET fecha = '2026-02-28' WHERE id % 17 = 0")
+    conn.execute("UPDATE citas SET medico_id = ? WHERE id % 13 = 0", (doctors[0],))
+    conn.execute("UPDATE pagos SET estado = 'pagado' WHERE id % 4 = 0")
+    conn.execute("UPDATE pagos SET metodo_pago = 'tarjeta', monto = monto + 1 WHERE id % 6 = 0")
+    conn.execute("UPDATE pagos SET fecha_pago = '2026-01-15 09:00:00' WHERE id % 9 = 0")
+    conn.execute("UPDATE pagos SET cita_id = cita_id + 1 WHERE id % 8 = 0 AND cita_id + 1 IN (SELECT id FROM citas)")
+    conn.execute("UPDATE cargos SET estado = 'anulado' WHERE id % 4 = 0")
+    conn.execute("UPDATE cargos SET monto = monto * 2 WHERE id % 5 = 0")
+    conn.execute("DELETE FROM cargos WHERE id % 11 = 0")
+    conn.execute("DELETE FROM pagos WHERE id % 11 = 0")
+    conn.execute('''
+        DELETE FROM citas WHERE id % 19 = 0
+          AND id NOT IN (SELECT cita_id FROM pagos) AND id NOT IN (SELECT cita_id FROM cargos)
+    ''')
+    conn.commit()
+
+
+def _rows(conn, query):
+    return sorted(tuple(row) for row in conn.execute(query).fetchall())
+
+
+def assert_counters_match(conn):
+    """``contadores`` coincide con lo que se obtiene agregando las tablas base"""
+    expected = {
+        'pacientes_activos': conn.execute("SELECT COUNT(*) FROM pacientes WHERE estado = 'activo'").fetchone()[0],
+        'medicos_activos': conn.execute(
+            "SELECT COUNT(*) FROM usuarios WHERE rol = 'doctor' AND estado = 'activo'").fetchone()[0],
+    }
+    expected.update(conn.execute("SELECT 'citas:' || fecha, COUNT(*) FROM citas GROUP BY fecha").fetchall())
+    expected.update(conn.execute('''
+        SELECT 'ingresos:' || substr(fecha_pago, 1, 7), SUM(monto) FROM pagos
+        WHERE estado = 'pagado' GROUP BY substr(fecha_pago, 1, 7)
+    ''').fetchall())
+
+    actual = {key: value for key, value in conn.execute("SELECT clave, valor FROM contadores") if value}
+    assert actual == {key: value for key, value in expected.items() if value}
+
+
+def assert_balances_match(conn):
+    """``saldos_citas`` y ``saldos_pacientes`` coinciden con los cargos activos y los pagos 'pagado'"""
+    by_appointment = '''
+        SELECT c.id, c.paciente_id,
+               (SELECT COALESCE(SUM(monto), 0) FROM cargos WHERE cita_id = c.id AND estado = 'activo') as cargado,
+               (SELECT COALESCE(SUM(monto), 0) FROM pagos WHERE cita_id = c.id AND estado = 'pagado') as pagado
+        FROM citas c
+    '''
+    assert _rows(conn, f"SELECT id, cargado, pagado FROM ({by_appointment}) WHERE cargado != 0 OR pagado != 0") == \
+        _rows(conn, "SELECT cita_id, cargado, pagado FROM saldos_citas WHERE cargado != 0 OR pagado != 0")
+    # La deuda y el saldo a favor del paciente se suman cita por cita, sin compensarse entre citas
+    assert _rows(conn, f'''
+        SELECT paciente_id, SUM(cargado), SUM(pagado),
+               SUM(MAX(cargado - pagado, 0)), SUM(MAX(pagado - cargado, 0))
+        FROM ({by_appointment})
+        GROUP BY paciente_id HAVING SUM(cargado) != 0 OR SUM(pagado) != 0
+    ''') == _rows(conn, '''
+        SELECT paciente_id, cargado, pagado, pendiente, a_favor FROM saldos_pacientes
+        WHERE cargado != 0 OR pagado != 0
+    ''')
+
+
+def assert_revenue_matches(conn):
+    """``ingresos_diarios`` coincide con los pagos 'pagado' agrupados por día, médico y método"""
+    assert _rows(conn, '''
+        SELECT substr(p.fecha_pago, 1, 10), c.medico_id, p.metodo_pago, COUNT(*), SUM(p.monto)
+        FROM pagos p JOIN citas c ON p.cita_id = c.id
+        WHERE p.estado = 'pagado'
+        GROUP BY 1, 2, 3
+    ''') == _rows(conn, "SELECT * FROM ingresos_diarios WHERE pagos != 0 OR total != 0")
+
+
+def assert_appointment_counts_match(conn):
+    """``citas_diarias`` coincide con las citas agrupadas por día, médico y estado"""
+    assert _rows(conn, "SELECT fecha, medico_id, estado, COUNT(*) FROM citas GROUP BY 1, 2, 3") == \
+        _rows(conn, "SELECT * FROM citas_diarias WHERE citas != 0")
+
+
+def assert_derived_tables_match(conn):
+    assert_counters_match(conn)
+    assert_balances_match(conn)
+    assert_revenue_matches(conn)
+    assert_appointment_counts_match(conn)
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    """Base de datos temporal con las tablas base pero sin migraciones aplicadas"""
+    db_path = str(tmp_path / 'clinica.db')
+    monkeypatch.setattr(init_db, 'apply_migrations', lambda conn: [])
+    init_db.init_database(db_path)
+    conn = connect(db_path)
+    yield conn
+    conn.close()
+
+
+def test_migrations_reach_latest_version(conn):
+    assert apply_migrations(conn) == list(range(1, latest_version() + 1))
+    assert get_schema_version(conn) == latest_version()
+    assert apply_migrations(conn) == []
+
+
+def test_hot_queries_use_their_indexes(conn):
+    apply_migrations(conn)
+    _seed(conn, random.Random(1))
+    conn.execute("ANALYZE")
+    assert check_index_usage(conn) == []
+
+
+def test_backfill_matches_base_tables(conn):
+    _seed(conn, random.Random(2))
+    apply_migrations(conn)
+    assert_derived_tables_match(conn)
+
+
+def test_triggers_keep_derived_tables_in_sync(conn):
+    rng = random.Random(3)
+    doctors = _seed(conn, rng)
+    apply_migrations(conn)
+    _charge(conn, rng)
+    _seed(conn, rng, patients=5, appointments=100, prefix='b')
+    assert_derived_tables_match(conn)
+
+    _mutate(conn, doctors)
+    assert_derived_tables_match(conn)
+
+
+def test_payments_without_charge_are_kept_apart_from_debt(conn, monkeypatch):
+    rng = random.Random(4)
+    _seed(conn, rng)
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS[:12])
+    apply_migrations(conn)
+    _charge(conn, rng)
+    # Pagos sin cargo registrados antes de la migración 13: descontaban la deuda de otras citas
+    conn.execute('''
+        INSERT INTO pagos (cita_id, monto, metodo_pago, estado)
+        SELECT id, 80, 'efectivo', 'pagado' FROM citas WHERE id NOT IN (SELECT cita_id FROM cargos)
+    ''')
+    conn.commit()
+
+    monkeypatch.undo()
+    assert apply_migrations(conn) == list(range(13, latest_version() + 1))
+    assert conn.execute("SELECT SUM(a_favor) FROM saldos_pacientes").fetchone()[0] > 0
+    assert_derived_tables_match(conn)
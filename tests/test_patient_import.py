@@ -0,0 +1,76 @@
+import sqlite3
+
+import pytest
+
+# utils.helpers (validaciones) importa streamlit
+pytest.importorskip('streamlit')
+
+from database.storage import connect
+from utils.patient_import import file_key, import_patients
+
+ROWS = 25
+CHUNK_SIZE = 10
+FAILING_DNI = '10000015'  # en el segundo lote
+
+
+def _csv(rows=ROWS):
+    lines = ['dni,nombre_completo,fecha_nacimiento,sexo']
+    lines += [f'{10000000 + i},Paciente {i},1990-01-01,F' for i in range(rows)]
+    return '\n'.join(lines).encode('utf-8')
+
+
+def _fail_on(db, dni):
+    """Hace fallar (dentro de la transacción del lote) la inserción de un DNI"""
+    conn = connect(db.db_path)
+    conn.execute(f'''
+        CREATE TRIGGER fallo_importacion BEFORE INSERT ON pacientes WHEN new.dni = '{dni}'
+        BEGIN SELECT RAISE(ABORT, 'fallo simulado'); END
+    ''')
+    conn.commit()
+    return conn
+
+
+def _patients(db):
+    with db.connection() as conn:
+        return [row[0] for row in conn.execute("SELECT dni FROM pacientes ORDER BY dni")]
+
+
+def test_import_inserts_every_valid_row_in_batches(db):
+    reports = list(import_patients(db, _csv(), 'pacientes.csv', chunk_size=CHUNK_SIZE))
+
+    assert [report['fila'] for report in reports] == [11, 21, 26]
+    assert sum(report['insertados'] for report in reports) == ROWS
+    assert len(_patients(db)) == ROWS
+
+
+def test_import_resumes_after_a_failed_batch(db):
+    data = _csv()
+    conn = _fail_on(db, FAILING_DNI)
+
+    reports = import_patients(db, data, 'pacientes.csv', chunk_size=CHUNK_SIZE)
+    assert next(reports)['insertados'] == CHUNK_SIZE
+    with pytest.raises(sqlite3.IntegrityError):
+        next(reports)
+
+    # El lote fallido no dejó pacientes ni avance registrado
+    assert len(_patients(db)) == CHUNK_SIZE
+    assert db.get_import(file_key(data))['filas_procesadas'] == CHUNK_SIZE + 1
+
+    conn.execute("DROP TRIGGER fallo_importacion")
+    conn.commit()
+    conn.close()
+
+    resumed = list(import_patients(db, data, 'pacientes.csv', chunk_size=CHUNK_SIZE))
+    assert resumed[0]['fila'] == 21
+    assert sum(report['insertados'] for report in resumed) == ROWS - CHUNK_SIZE
+    assert sum(report['errores'] for report in resumed) == 0
+    assert _patients(db) == [str(10000000 + i) for i in range(ROWS)]
+
+
+def test_finished_import_is_not_repeated(db):
+    data = _csv()
+    list(import_patients(db, data, 'pacientes.csv', chunk_size=CHUNK_SIZE))
+
+    assert list(import_patients(db, data, 'pacientes.csv', chunk_size=CHUNK_SIZE)) == []
+    assert len(_patients(db)) == ROWS
+
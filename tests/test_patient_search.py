@@ -0,0 +1,74 @@
+import pytest
+
+from database.storage import connect
+
+PATIENTS = [
+    ('10000001', 'José Pérez', '987654321', 'jose@correo.com', 'activo'),
+    ('10000002', 'Jose Perez Lima', '912345678', 'jlima@correo.com', 'activo'),
+    ('20000003', 'María Núñez', '955555555', 'maria@correo.com', 'activo'),
+    ('20000004', 'Pedro Peña', '944444444', 'pedro@correo.com', 'inactivo'),
+]
+
+
+@pytest.fixture
+def db(db):
+    conn = connect(db.db_path)
+    conn.executemany('''
+        INSERT INTO pacientes (dni, nombre_completo, fecha_nacimiento, sexo, telefono, email, estado)
+        VALUES (?, ?, '1990-01-01', 'M', ?, ?, ?)
+    ''', PATIENTS)
+    conn.commit()
+    conn.close()
+    return db
+
+
+def _names(df):
+    return sorted(df['nombre_completo']) if not df.empty else []
+
+
+@pytest.mark.parametrize('term', ['Pérez', 'perez', 'PEREZ', 'pérez'])
+def test_search_ignores_accents_in_both_directions(db, term):
+    assert _names(db.search_patients(term)) == ['Jose Perez Lima', 'José Pérez']
+
+
+@pytest.mark.parametrize('term, expected', [
+    ('pe', ['Jose Perez Lima', 'José Pérez']),
+    ('nun', ['María Núñez']),
+    ('Núñ', ['María Núñez']),
+    ('mari nu', ['María Núñez']),
+    ('jose li', ['Jose Perez Lima']),
+    ('2000', ['María Núñez']),
+    ('98765', ['José Pérez']),
+    ('jlima', ['Jose Perez Lima']),
+])
+def test_search_matches_every_word_by_prefix(db, term, expected):
+    assert _names(db.search_patients(term)) == expected
+
+
+def test_search_excludes_inactive_patients(db):
+    assert _names(db.search_patients('peña')) == []
+    assert _names(db.search_patients('pedro')) == []
+
+
+@pytest.mark.parametrize('term', ['', '   ', '"*(-)'])
+def test_search_without_words_returns_nothing(db, term):
+    assert db.search_patients(term).empty
+
+
+def test_name_matches_rank_before_other_columns(db):
+    # 'jose' está en el nombre de dos pacientes y en el email de uno de ellos
+    conn = connect(db.db_path)
+    conn.execute('''
+        INSERT INTO pacientes (dni, nombre_completo, fecha_nacimiento, sexo, email)
+        VALUES ('30000005', 'Ana Torres', '1990-01-01', 'F', 'jose.torres@correo.com')
+    ''')
+    conn.commit()
+    conn.close()
+
+    assert db.search_patients('jose')['nombre_completo'].tolist()[-1] == 'Ana Torres'
+
+
+def test_patients_page_uses_the_same_search(db):
+    df_page, total = db.get_patients_page(search_term='perez')
+    assert total == 2
+    assert _names(df_page) == ['Jose Perez Lima', 'José Pérez']
@@ -0,0 +1,83 @@
+import pytest
+
+from database.storage import connect
+
+
+@pytest.fixture
+def db(db):
+    """Base migrada con un médico, un paciente y dos citas atendidas"""
+    conn = connect(db.db_path)
+    medico_id = conn.execute('''
+        INSERT INTO usuarios (username, email, password_hash, rol, nombre_completo)
+        VALUES ('doc', 'doc@clinica.com', '$2b$04$hash', 'doctor', 'Dr Prueba')
+    ''').lastrowid
+    paciente_id = conn.execute('''
+        INSERT INTO pacientes (dni, nombre_completo, fecha_nacimiento, sexo)
+        VALUES ('12345678', 'Paciente Prueba', '1990-01-01', 'F')
+    ''').lastrowid
+    for hora in ('09:00:00', '10:00:00'):
+        conn.execute('''
+            INSERT INTO citas (paciente_id, medico_id, fecha, hora, estado)
+            VALUES (?, ?, date('now'), ?, 'atendida')
+        ''', (paciente_id, medico_id, hora))
+    conn.commit()
+    conn.close()
+    return db
+
+
+def _appointments(db):
+    with db.connection() as conn:
+        return [row[0] for row in conn.execute("SELECT id FROM citas ORDER BY hora")]
+
+
+def _patient(db, cita_id):
+    with db.connection() as conn:
+        return conn.execute("SELECT paciente_id FROM citas WHERE id = ?", (cita_id,)).fetchone()[0]
+
+
+def test_payment_without_charge_does_not_offset_other_debt(db):
+    cita_a, cita_b = _appointments(db)
+
+    db.create_payment(cita_a, 100, 'efectivo')
+    db.create_charge(cita_b, 150)
+
+    assert db.get_appointment_balance(cita_a) == {'cargado': 0, 'pagado': 100, 'saldo': 0, 'a_favor': 100}
+    assert db.get_patient_balance(_patient(db, cita_a)) == {'cargado': 150, 'pagado': 100, 'saldo': 150, 'a_favor': 100}
+    assert db.get_outstanding_balances()['saldo'].tolist() == [150]
+    assert db.get_receivables_aging()['total'] == 150
+
+
+def test_partial_payment_before_the_charge(db):
+    cita_a, _ = _appointments(db)
+
+    db.create_payment(cita_a, 40, 'efectivo')
+    assert db.get_appointment_balance(cita_a) == {'cargado': 0, 'pagado': 40, 'saldo': 0, 'a_favor': 40}
+    # El pago no registra el cargo: la cita sigue disponible para cargarla
+    assert cita_a in db.get_uncharged_appointments()['id'].tolist()
+
+    db.create_charge(cita_a, 100)
+    assert db.get_appointment_balance(cita_a) == {'cargado': 100, 'pagado': 40, 'saldo': 60, 'a_favor': 0}
+    assert db.get_receivables_aging()['total'] == 60
+
+    db.create_payment(cita_a, 60, 'tarjeta')
+    assert db.get_patient_balance(_patient(db, cita_a)) == {'cargado': 100, 'pagado': 100, 'saldo': 0, 'a_favor': 0}
+    assert db.get_outstanding_balances().empty
+
+
+def test_payment_keeps_existing_charge(db):
+    cita_a, _ = _appointments(db)
+
+    db.create_charge(cita_a, 150)
+    db.create_payment(cita_a, 100, 'efectivo')
+
+    assert db.get_appointment_balance(cita_a) == {'cargado': 150, 'pagado': 100, 'saldo': 50, 'a_favor': 0}
+
+
+def test_charge_picker_lists_paid_appointments_without_charge(db):
+    cita_a, cita_b = _appointments(db)
+    db.create_payment(cita_a, 100, 'efectivo')
+
+    assert sorted(db.get_uncharged_appointments()['id']) == [cita_a, cita_b]
+
+    db.create_charge(cita_b, 150)
+    assert db.get_uncharged_appointments()['id'].tolist() == [cita_a]
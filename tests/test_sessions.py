@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from database import sessions
+from database.storage import connect
+
+
+def _tamper(token, index):
+    """Cambia un carácter de la parte ``index`` (0: aleatoria, 1: expiración, 2: firma)"""
+    parts = token.split('.')
+    part = parts[index]
+    parts[index] = part[:-1] + ('1' if part[-1] != '1' else '2')
+    return '.'.join(parts)
+
+
+def test_new_token_verifies_until_it_expires(monkeypatch):
+    token, expires_at = sessions.new_token(ttl_hours=1)
+    assert sessions.verify_token(token) == expires_at
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 3600 + 1)
+    assert sessions.verify_token(token) is None
+
+
+@pytest.mark.parametrize('index', [0, 1, 2])
+def test_tampered_token_is_rejected(index):
+    token, _ = sessions.new_token()
+    assert sessions.verify_token(_tamper(token, index)) is None
+
+
+@pytest.mark.parametrize('token', [None, '', 'abc', 'a.b.c', 'a.1.b.c'])
+def test_malformed_token_is_rejected(token):
+    assert sessions.verify_token(token) is None
+
+
+def test_token_signed_with_another_key_is_rejected(monkeypatch):
+    token, _ = sessions.new_token()
+    monkeypatch.setattr(sessions, '_secret_key', b'otra-clave')
+    assert sessions.verify_token(token) is None
+
+
+@pytest.fixture
+def user_id(db):
+    conn = connect(db.db_path)
+    user_id = conn.execute('''
+        INSERT INTO usuarios (username, email, password_hash, rol, nombre_completo)
+        VALUES ('recepcion', 'recepcion@clinica.com', '$2b$04$hash', 'recepcionista', 'Recepción')
+    ''').lastrowid
+    conn.commit()
+    conn.close()
+    return user_id
+
+
+def test_session_is_valid_until_revoked(db, user_id):
+    token = db.create_session(user_id)
+    assert db.validate_session(token)['id'] == user_id
+
+    db.revoke_session(token)
+    assert db.validate_session(token) is None
+
+
+def test_expired_session_is_rejected(db, user_id, monkeypatch):
+    token = db.create_session(user_id, ttl_hours=1)
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 3600 + 1)
+    assert db.validate_session(token) is None
+
+
+def test_tampered_session_is_rejected(db, user_id):
+    token = db.create_session(user_id)
+    for index in range(3):
+        assert db.validate_session(_tamper(token, index)) is None
+
+
+def test_signed_token_without_session_row_is_rejected(db, user_id):
+    token, _ = sessions.new_token()
+    assert db.validate_session(token) is None
+
+
+def test_session_of_inactive_user_is_rejected(db, user_id):
+    token = db.create_session(user_id)
+    with db.connection() as conn:
+        conn.execute("UPDATE usuarios SET estado = 'inactivo' WHERE id = ?", (user_id,))
+        conn.commit()
+    assert db.validate_session(token) is None
+
+
+def test_creating_a_session_purges_expired_ones(db, user_id):
+    db.create_session(user_id, ttl_hours=-1)
+    db.create_session(user_id)
+    with db.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sesiones").fetchone()[0] == 1
@@ -0,0 +1,25 @@
+import sqlite3
+import threading
+
+import pytest
+
+from database.write_queue import WriteQueue
+
+
+def test_connection_failure_is_reported_to_each_write(tmp_path):
+    queue = WriteQueue(str(tmp_path / 'no_existe' / 'clinica.db'))
+    for _ in range(2):
+        with pytest.raises(sqlite3.OperationalError):
+            queue.submit(lambda conn: conn.execute("SELECT 1"))
+    assert queue.is_alive()
+
+
+def test_write_that_does_not_finish_raises_timeout(tmp_path):
+    queue = WriteQueue(str(tmp_path / 'clinica.db'), timeout=0.1)
+    release = threading.Event()
+    with pytest.raises(TimeoutError):
+        queue.submit(lambda conn: release.wait(5))
+    release.set()
+
+    queue.timeout = 5
+    assert queue.submit(lambda conn: conn.execute("SELECT 2").fetchone()[0]) == 2
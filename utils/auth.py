@@ -1,10 +1,32 @@
 import streamlit as st
 from database.db_manager import DatabaseManager
-import bcrypt
+from utils.session_cookie import install_endpoint, set_session_cookie, clear_session_cookie, get_session_cookie
 
 def check_authentication():
     """Verifica si el usuario está autenticado"""
-    return 'user' in st.session_state and st.session_state.user is not None
+    if 'user' in st.session_state and st.session_state.user is not None:
+        return True
+    return restore_session()
+
+def _get_session_token():
+    """Obtiene el token de sesión de la cookie HttpOnly (nunca de la URL)"""
+    return get_session_cookie()
+
+def restore_session():
+    """Restaura la sesión desde un token firmado sin volver a verificar la contraseña"""
+    token = _get_session_token()
+    if not token or st.session_state.get('rejected_session_token') == token:
+        return False
+    
+    user = DatabaseManager().validate_session(token)
+    if user:
+        st.session_state.user = user
+        st.session_state.session_token = token
+        return True
+    
+    # No volver a consultar el mismo token inválido en cada rerun
+    st.session_state.rejected_session_token = token
+    return False
 
 def check_permission(required_roles):
     """Verifica si el usuario tiene el rol necesario"""
@@ -22,9 +44,14 @@ def login_page():
     st.title("🏥 Sistema de Gestión Clínica")
     st.subheader("Iniciar Sesión")
     
+    if st.session_state.pop('clear_session_cookie', False):
+        clear_session_cookie()
+    
     with st.form("login_form"):
         username = st.text_input("Usuario")
         password = st.text_input("Contraseña", type="password")
+        # Solo si el servidor puede guardar el token en una cookie HttpOnly
+        remember = install_endpoint() and st.checkbox("Mantener la sesión iniciada")
         login_button = st.form_submit_button("Iniciar Sesión")
         
         if login_button:
@@ -34,6 +61,11 @@ def login_page():
                 
                 if user:
                     st.session_state.user = user
+                    if remember:
+                        token = db.create_session(user['id'])
+                        st.session_state.session_token = token
+                        # La cookie se fija en la siguiente ejecución (st.rerun descartaría el iframe)
+                        st.session_state.pending_session_cookie = token
                     st.success(f"¡Bienvenido, {user['nombre_completo']}!")
                     st.rerun()
                 else:
@@ -54,6 +86,10 @@ def login_page():
 
 def logout():
     """Cerrar sesión"""
+    token = st.session_state.pop('session_token', None)
+    if token:
+        DatabaseManager().revoke_session(token)
+        st.session_state.clear_session_cookie = True
     if 'user' in st.session_state:
         del st.session_state.user
     st.rerun()
@@ -116,6 +152,10 @@ def sidebar_navigation():
     user = get_current_user()
     
     with st.sidebar:
+        token = st.session_state.pop('pending_session_cookie', None)
+        if token:
+            set_session_cookie(token)
+        
         st.title("🏥 Clínica")
         st.write(f"👤 {user['nombre_completo']}")
         st.write(f"🏷️ {user['rol'].title()}")
@@ -0,0 +1,54 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# Rangos de edad de los gráficos y reportes: [0, 18), [18, 30), ...
+AGE_BINS = [0, 18, 30, 50, 65, np.inf]
+AGE_LABELS = ['0-17', '18-29', '30-49', '50-64', '65+']
+SEX_LABELS = {'M': 'Masculino', 'F': 'Femenino', 'Otro': 'Otro'}
+
+
+def compute_ages(birthdates, today=None):
+    """Edad cumplida para una serie de fechas de nacimiento ('YYYY-MM-DD'), sin recorrer fila a fila.
+
+    Resta un año si este año todavía no llegó el cumpleaños. Las fechas
+    inválidas o vacías dan <NA>.
+    """
+    today = today or date.today()
+    births = pd.to_datetime(pd.Series(birthdates), format='%Y-%m-%d', errors='coerce')
+    before_birthday = (births.dt.month * 100 + births.dt.day) > (today.month * 100 + today.day)
+    ages = today.year - births.dt.year - before_birthday.astype(int)
+    return ages.astype('Int64')
+
+
+def age_groups(ages):
+    """Rango de edad (categoría ordenada según AGE_LABELS) de cada edad"""
+    return pd.cut(pd.Series(ages, dtype='float'), bins=AGE_BINS, labels=AGE_LABELS, right=False)
+
+
+def age_distribution(ages, weights=None):
+    """Cantidad de pacientes por rango de edad, en el orden de AGE_LABELS.
+
+    ``weights`` permite partir de conteos ya agregados (una fila por edad).
+    """
+    groups = age_groups(ages)
+    weights = pd.Series(1 if weights is None else weights, index=groups.index)
+    return weights.groupby(groups, observed=False).sum().reindex(AGE_LABELS, fill_value=0)
+
+
+def sex_distribution(sexes, weights=None):
+    """Cantidad de pacientes por sexo, con las etiquetas para mostrar"""
+    sexes = pd.Series(sexes)
+    weights = pd.Series(1 if weights is None else weights, index=sexes.index)
+    counts = weights.groupby(sexes).sum()
+    counts.index = [SEX_LABELS.get(sex, sex) for sex in counts.index]
+    return counts
+
+
+def distributions_from_counts(df_counts):
+    """Distribuciones por edad y sexo a partir de ``get_patient_demographics`` (edad, sexo, total)"""
+    return (
+        age_distribution(df_counts['edad'], df_counts['total'].values),
+        sex_distribution(df_counts['sexo'], df_counts['total'].values),
+    )
@@ -0,0 +1,55 @@
+import csv
+import os
+import tempfile
+
+# Formatos de exportación: extensión y tipo MIME
+EXPORT_FORMATS = {
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('.csv', 'text/csv'),
+}
+
+
+def export_rows(columns, blocks, fmt='xlsx', sheet_name='Datos'):
+    """Escribe filas en un archivo temporal sin tenerlas todas en memoria.
+
+    ``blocks`` es un iterable de listas de filas (por ejemplo, los bloques de
+    ``fetchmany`` de un cursor). El XLSX se escribe con openpyxl en modo
+    ``write_only``, que vuelca cada fila al disco en lugar de construir el
+    libro en memoria. Devuelve ``(ruta, filas)``; quien llama debe borrar el
+    archivo cuando termine de usarlo.
+    """
+    suffix, _ = EXPORT_FORMATS[fmt]
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix='clinica_export_')
+    os.close(fd)
+    count = 0
+
+    try:
+        if fmt == 'csv':
+            # utf-8-sig para que Excel reconozca los acentos
+            with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                for rows in blocks:
+                    writer.writerows(rows)
+                    count += len(rows)
+        else:
+            from openpyxl import Workbook
+
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet(sheet_name)
+            sheet.append(columns)
+            for rows in blocks:
+                for row in rows:
+                    sheet.append(row)
+                count += len(rows)
+            workbook.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+
+    return path, count
+
+
+def export_mime(fmt):
+    """Tipo MIME de un formato de exportación"""
+    return EXPORT_FORMATS[fmt][1]
@@ -1,112 +1,27 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime, date, timedelta
-from fpdf import FPDF
+from datetime import datetime, timedelta
 import io
 import base64
+import time
+from collections import OrderedDict
+from utils.pdf_engine import render_prescription, render_invoice
+from utils.demographics import compute_ages, age_distribution
+
+# Entradas de búsqueda de pacientes que se recuerdan por sesión y su vigencia
+PATIENT_PICKER_CACHE_SIZE = 50
+PATIENT_PICKER_CACHE_TTL = 60  # segundos
 
 class PDFGenerator:
-    """Generador de PDFs para recetas, facturas y reportes"""
-    
-    def __init__(self):
-        self.pdf = FPDF()
-        self.pdf.add_page()
-        self.pdf.set_font('Arial', 'B', 16)
+    """Generador de PDFs para recetas, facturas y reportes (ver utils/pdf_engine.py)"""
     
-    def generate_prescription(self, patient_data, doctor_data, prescription_data):
+    def generate_prescription(self, patient_data, doctor_data, prescription_data, clinic_config=None):
         """Genera una receta médica en PDF"""
-        
-        # Encabezado
-        self.pdf.cell(0, 10, 'RECETA MEDICA', 0, 1, 'C')
-        self.pdf.ln(10)
-        
-        # Información del doctor
-        self.pdf.set_font('Arial', 'B', 12)
-        self.pdf.cell(0, 8, f"Dr. {doctor_data['nombre_completo']}", 0, 1)
-        self.pdf.set_font('Arial', '', 10)
-        self.pdf.cell(0, 6, f"Especialidad: {doctor_data['especialidad']}", 0, 1)
-        self.pdf.ln(5)
-        
-        # Información del paciente
-        self.pdf.set_font('Arial', 'B', 10)
-        self.pdf.cell(40, 6, 'Paciente:', 0, 0)
-        self.pdf.set_font('Arial', '', 10)
-        self.pdf.cell(0, 6, patient_data['nombre_completo'], 0, 1)
-        
-        self.pdf.set_font('Arial', 'B', 10)
-        self.pdf.cell(40, 6, 'DNI:', 0, 0)
-        self.pdf.set_font('Arial', '', 10)
-        self.pdf.cell(0, 6, patient_data['dni'], 0, 1)
-        
-        self.pdf.set_font('Arial', 'B', 10)
-        self.pdf.cell(40, 6, 'Fecha:', 0, 0)
-        self.pdf.set_font('Arial', '', 10)
-        self.pdf.cell(0, 6, datetime.now().strftime('%d/%m/%Y'), 0, 1)
-        self.pdf.ln(10)
-        
-        # Prescripción
-        self.pdf.set_font('Arial', 'B', 12)
-        self.pdf.cell(0, 8, 'PRESCRIPCION:', 0, 1)
-        self.pdf.set_font('Arial', '', 10)
-        
-        # Dividir el texto en líneas
-        prescription_lines = prescription_data['receta'].split('\n')
-        for line in prescription_lines:
-            self.pdf.cell(0, 6, line, 0, 1)
-        
-        return self.pdf.output(dest='S').encode('latin1')
+        return render_prescription(patient_data, doctor_data, prescription_data, clinic_config)
     
     def generate_invoice(self, payment_data, patient_data, clinic_config):
         """Genera una factura en PDF"""
-        
-        # Encabezado
-        self.pdf.cell(0, 10, clinic_config.get('nombre_clinica', 'CLINICA MEDICA'), 0, 1, 'C')
-        self.pdf.set_font('Arial', '', 10)
-        self.pdf.cell(0, 6, clinic_config.get('direccion', ''), 0, 1, 'C')
-        self.pdf.cell(0, 6, f"Tel: {clinic_config.get('telefono', '')}", 0, 1, 'C')
-        self.pdf.ln(10)
-        
-        # Título
-        self.pdf.set_font('Arial', 'B', 14)
-        self.pdf.cell(0, 10, 'FACTURA', 0, 1, 'C')
-        self.pdf.ln(5)
-        
-        # Información del paciente
-        self.pdf.set_font('Arial', 'B', 10)
-        self.pdf.cell(40, 6, 'Cliente:', 0, 0)
-        self.pdf.set_font('Arial', '', 10)
-        self.pdf.cell(0, 6, patient_data['nombre_completo'], 0, 1)
-        
-        self.pdf.set_font('Arial', 'B', 10)
-        self.pdf.cell(40, 6, 'DNI:', 0, 0)
-        self.pdf.set_font('Arial', '', 10)
-        self.pdf.cell(0, 6, patient_data['dni'], 0, 1)
-        
-        self.pdf.set_font('Arial', 'B', 10)
-        self.pdf.cell(40, 6, 'Fecha:', 0, 0)
-        self.pdf.set_font('Arial', '', 10)
-        self.pdf.cell(0, 6, datetime.now().strftime('%d/%m/%Y'), 0, 1)
-        self.pdf.ln(10)
-        
-        # Detalles del pago
-        self.pdf.set_font('Arial', 'B', 10)
-        self.pdf.cell(80, 8, 'Descripcion', 1, 0, 'C')
-        self.pdf.cell(40, 8, 'Metodo Pago', 1, 0, 'C')
-        self.pdf.cell(30, 8, 'Monto', 1, 1, 'C')
-        
-        self.pdf.set_font('Arial', '', 10)
-        self.pdf.cell(80, 8, 'Consulta Medica', 1, 0)
-        self.pdf.cell(40, 8, payment_data['metodo_pago'].title(), 1, 0, 'C')
-        self.pdf.cell(30, 8, f"${payment_data['monto']:.2f}", 1, 1, 'R')
-        
-        # Total
-        self.pdf.set_font('Arial', 'B', 12)
-        self.pdf.cell(120, 10, 'TOTAL:', 1, 0, 'R')
-        self.pdf.cell(30, 10, f"${payment_data['monto']:.2f}", 1, 1, 'R')
-        
-        return self.pdf.output(dest='S').encode('latin1')
+        return render_invoice(payment_data, patient_data, clinic_config)
 
 def create_chart_appointments_by_day(df_appointments):
     """Crea gráfico de citas por día"""
@@ -115,6 +30,8 @@ def create_chart_appointments_by_day(df_appointments):
     
     daily_appointments = df_appointments.groupby('fecha').size().reset_index(name='total_citas')
     
+    import plotly.express as px
+    
     fig = px.bar(
         daily_appointments,
         x='fecha',
@@ -136,27 +53,9 @@ def create_chart_patients_by_age(df_patients):
     if df_patients.empty:
         return None
     
-    # Calcular edades
-    today = datetime.now().date()
-    df_patients['edad'] = df_patients['fecha_nacimiento'].apply(
-        lambda x: today.year - datetime.strptime(x, '%Y-%m-%d').date().year
-    )
-    
-    # Crear rangos de edad
-    def age_group(age):
-        if age < 18:
-            return '0-17'
-        elif age < 30:
-            return '18-29'
-        elif age < 50:
-            return '30-49'
-        elif age < 65:
-            return '50-64'
-        else:
-            return '65+'
+    import plotly.express as px
     
-    df_patients['rango_edad'] = df_patients['edad'].apply(age_group)
-    age_counts = df_patients['rango_edad'].value_counts()
+    age_counts = age_distribution(compute_ages(df_patients['fecha_nacimiento']))
     
     fig = px.pie(
         values=age_counts.values,
@@ -166,36 +65,34 @@ def create_chart_patients_by_age(df_patients):
     
     return fig
 
-def create_chart_payments_by_method(df_payments):
-    """Crea gráfico de pagos por método"""
-    if df_payments.empty:
+def create_chart_payments_by_method(df_by_method):
+    """Crea gráfico de pagos por método (``get_revenue`` agrupado por 'metodo')"""
+    if df_by_method.empty:
         return None
     
-    payment_counts = df_payments['metodo_pago'].value_counts()
+    import plotly.express as px
     
     fig = px.pie(
-        values=payment_counts.values,
-        names=payment_counts.index,
+        values=df_by_method['pagos'],
+        names=df_by_method['metodo_pago'],
         title='Pagos por Método de Pago'
     )
     
     return fig
 
-def create_chart_monthly_revenue(df_payments):
-    """Crea gráfico de ingresos mensuales"""
-    if df_payments.empty:
+def create_chart_monthly_revenue(df_monthly):
+    """Crea gráfico de ingresos mensuales (``get_revenue`` agrupado por 'mes')"""
+    if df_monthly.empty:
         return None
     
-    # Extraer mes de la fecha de pago
-    df_payments['mes'] = pd.to_datetime(df_payments['fecha_pago']).dt.strftime('%Y-%m')
-    monthly_revenue = df_payments.groupby('mes')['monto'].sum().reset_index()
+    import plotly.express as px
     
     fig = px.line(
-        monthly_revenue,
+        df_monthly,
         x='mes',
-        y='monto',
+        y='total',
         title='Ingresos Mensuales',
-        labels={'mes': 'Mes', 'monto': 'Ingresos ($)'},
+        labels={'mes': 'Mes', 'total': 'Ingresos ($)'},
         markers=True
     )
     
@@ -282,49 +179,102 @@ def format_datetime(datetime_str):
     except:
         return datetime_str
 
-def get_age_from_birthdate(birthdate_str):
-    """Calcula la edad a partir de la fecha de nacimiento"""
-    try:
-        birthdate = datetime.strptime(birthdate_str, '%Y-%m-%d').date()
-        today = date.today()
-        age = today.year - birthdate.year - ((today.month, today.day) < (birthdate.month, birthdate.day))
-        return age
-    except:
-        return None
+def cursor_page(key, scope=None):
+    """Cursor de la página actual de un listado paginado por clave.
 
-def paginate_dataframe(df, page_size=10):
-    """Pagina un DataFrame"""
-    if df.empty:
-        return df, 0, 0
-    
-    total_pages = len(df) // page_size + (1 if len(df) % page_size > 0 else 0)
-    
-    if 'current_page' not in st.session_state:
-        st.session_state.current_page = 1
-    
-    start_idx = (st.session_state.current_page - 1) * page_size
-    end_idx = start_idx + page_size
-    
-    return df.iloc[start_idx:end_idx], st.session_state.current_page, total_pages
+    ``st.session_state[key]`` guarda la clave tras la que empieza cada página
+    visitada (``None`` para la primera) y se reinicia cuando cambia ``scope``
+    (la búsqueda, el paciente...). El cursor devuelto se pasa como ``after``
+    a la consulta.
+    """
+    scope_key = f"{key}_scope"
+    if key not in st.session_state or st.session_state.get(scope_key) != scope:
+        st.session_state[scope_key] = scope
+        st.session_state[key] = [None]
+    return st.session_state[key][-1]
+
+def back_if_empty_page(key):
+    """Vuelve a la página anterior si la actual quedó vacía (por ejemplo, tras registrar pagos)"""
+    cursors = st.session_state[key]
+    if len(cursors) > 1:
+        st.session_state[key] = cursors[:-1]
+        st.rerun()
+
+def show_cursor_pagination(key, df_page, page_size, cursor_columns, total=None,
+                           caption=None, labels=("← Anterior", "Siguiente →")):
+    """Controles anterior/siguiente de un listado paginado con ``cursor_page``.
 
-def show_pagination_controls(current_page, total_pages):
-    """Muestra controles de paginación"""
-    if total_pages <= 1:
+    ``cursor_columns`` son las columnas de la última fila que forman la clave
+    de la página siguiente. ``total`` (opcional) es la cantidad de filas de
+    todo el listado: permite mostrar el número de páginas. ``caption`` puede
+    usar ``{page}`` y ``{total_pages}``.
+    """
+    cursors = st.session_state[key]
+    page = len(cursors)
+    total_pages = (total + page_size - 1) // page_size if total is not None else None
+    if total_pages is not None and total_pages <= 1:
         return
+    if caption is None:
+        caption = "Página {page}" if total_pages is None else "Página {page} de {total_pages}"
     
     col1, col2, col3 = st.columns([1, 2, 1])
-    
     with col1:
-        if current_page > 1:
-            if st.button("← Anterior"):
-                st.session_state.current_page -= 1
-                st.rerun()
-    
+        if st.button(labels[0], disabled=page == 1, key=f"{key}_prev"):
+            st.session_state[key] = cursors[:-1]
+            st.rerun()
     with col2:
-        st.write(f"Página {current_page} de {total_pages}")
-    
+        st.caption(caption.format(page=page, total_pages=total_pages))
     with col3:
-        if current_page < total_pages:
-            if st.button("Siguiente →"):
-                st.session_state.current_page += 1
-                st.rerun()
+        has_next = len(df_page) == page_size and (total_pages is None or page < total_pages)
+        if st.button(labels[1], disabled=not has_next, key=f"{key}_next"):
+            last = df_page.iloc[-1]
+            cursor = tuple(value.item() if hasattr(value, 'item') else value for value in last[list(cursor_columns)])
+            st.session_state[key] = cursors + [cursor]
+            st.rerun()
+
+def patient_picker(db, key, label="Seleccionar Paciente", limit=20):
+    """Selector de pacientes con búsqueda incremental.
+    
+    Consulta solo los primeros ``limit`` pacientes que coinciden con el texto
+    escrito (índice FTS) y recuerda las búsquedas recientes de la sesión.
+    Devuelve el ID del paciente seleccionado o None.
+    """
+    search_term = st.text_input(
+        "🔍 Buscar paciente (nombre, DNI, teléfono o email)",
+        key=f"{key}_search"
+    ).strip()
+    
+    cache = st.session_state.setdefault('patient_picker_cache', OrderedDict())
+    cache_key = (search_term.lower(), limit)
+    cached = cache.get(cache_key)
+    
+    if cached and time.monotonic() - cached[0] < PATIENT_PICKER_CACHE_TTL:
+        cache.move_to_end(cache_key)
+        patient_options = cached[1]
+    else:
+        if search_term:
+            df_patients = db.search_patients(search_term, limit=limit)
+        else:
+            df_patients, _ = db.get_patients_page(limit=limit)
+        
+        patient_options = {
+            f"{patient.nombre_completo} - {patient.dni}": int(patient.id)
+            for patient in df_patients.itertuples()
+        }
+        cache[cache_key] = (time.monotonic(), patient_options)
+        while len(cache) > PATIENT_PICKER_CACHE_SIZE:
+            cache.popitem(last=False)
+    
+    if not patient_options:
+        st.info("No se encontraron pacientes" if search_term else "No hay pacientes registrados")
+        return None
+    
+    if len(patient_options) >= limit:
+        st.caption(f"Mostrando los primeros {limit} resultados. Escriba más para acotar la búsqueda.")
+    
+    selected_patient_key = st.selectbox(label, options=list(patient_options.keys()), key=key)
+    return patient_options.get(selected_patient_key)
+
+def clear_patient_picker_cache():
+    """Descarta las búsquedas de pacientes recordadas (tras crear o editar pacientes)"""
+    st.session_state.pop('patient_picker_cache', None)
@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+
+# Permitir ejecutar este archivo directamente (python utils/import_time.py)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+# Tiempo máximo de importación del arranque (hasta mostrar el login), en milisegundos
+STARTUP_BUDGET_MS = float(os.environ.get('CLINICA_IMPORT_BUDGET_MS', '2000'))
+
+# Librerías pesadas que solo deben cargarse en las funciones que las usan
+DEFERRED_MODULES = ('plotly', 'fpdf', 'openpyxl')
+
+# Módulos que se miden: el arranque de main.py y cada página por separado
+TARGETS = [
+    'main',
+    'pages.dashboard',
+    'pages.patients',
+    'pages.appointments',
+    'pages.medical_history',
+    'pages.payments',
+]
+
+
+def measure_imports(module):
+    """Importa ``module`` en un intérprete nuevo con ``-X importtime``.
+
+    Devuelve una lista de ``(modulo, propio_us, acumulado_us, nivel)`` en el
+    orden en que terminó cada importación.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{result.stderr.strip().splitlines()[-1]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        # Cada nivel de anidamiento añade dos espacios antes del nombre
+        level = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), level))
+    return entries
+
+
+def summarize(module, entries, top=10):
+    """Resumen de una medición: tiempo total, módulos más lentos y librerías diferidas cargadas"""
+    total_ms = sum(entry[1] for entry in entries) / 1000
+    top_level = sorted((entry for entry in entries if entry[3] == 0), key=lambda entry: -entry[2])
+    loaded = {entry[0] for entry in entries}
+    deferred = sorted(name for name in DEFERRED_MODULES if name in loaded)
+
+    lines = [f"{module}: {total_ms:.0f} ms, {len(entries)} módulos"]
+    for name, _, cumulative_us, _ in top_level[:top]:
+        lines.append(f"    {cumulative_us / 1000:8.1f} ms  {name}")
+    if deferred:
+        lines.append(f"    librerías pesadas cargadas: {', '.join(deferred)}")
+    return total_ms, deferred, '\n'.join(lines)
+
+
+def check_startup():
+    """Mide el arranque y cada página; devuelve False si el arranque excede el presupuesto
+    o carga alguna librería que debería diferirse"""
+    ok = True
+    for module in TARGETS:
+        try:
+            total_ms, deferred, report = summarize(module, measure_imports(module))
+        except RuntimeError as e:
+            print(e)
+            ok = False
+            continue
+
+        print(report)
+        if module == 'main':
+            if total_ms > STARTUP_BUDGET_MS:
+                print(f"    ✗ supera el presupuesto de {STARTUP_BUDGET_MS:.0f} ms")
+                ok = False
+            if deferred:
+                print("    ✗ el arranque no debe importar librerías pesadas")
+                ok = False
+        print()
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_startup() else 1)
@@ -0,0 +1,200 @@
+import csv
+import hashlib
+import io
+import os
+import sys
+from datetime import datetime
+
+# Permitir ejecutar este archivo directamente (python utils/patient_import.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.helpers import validate_dni, validate_email, validate_phone
+
+REQUIRED_COLUMNS = ['dni', 'nombre_completo', 'fecha_nacimiento', 'sexo']
+OPTIONAL_COLUMNS = ['telefono', 'direccion', 'email', 'grupo_sanguineo', 'alergias', 'enfermedades_cronicas']
+BLOOD_GROUPS = {"A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"}
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y']
+SEX_VALUES = {
+    'm': 'M', 'masculino': 'M', 'h': 'M', 'hombre': 'M',
+    'f': 'F', 'femenino': 'F', 'mujer': 'F',
+    'otro': 'Otro',
+}
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def file_key(data):
+    """Identificador de una importación: hash del contenido del archivo"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def read_rows(data, filename):
+    """Recorre las filas de un archivo CSV o XLSX sin cargarlo entero en estructuras intermedias.
+
+    Devuelve tuplas ``(numero_fila, dict)``; la fila 1 es la cabecera.
+    """
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(value or '').strip().lower() for value in next(rows, [])]
+        for row_number, values in enumerate(rows, start=2):
+            if values and any(value not in (None, '') for value in values):
+                yield row_number, _as_dict(header, values)
+        workbook.close()
+    else:
+        text = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline='')
+        reader = csv.reader(text, delimiter=_sniff_delimiter(data))
+        header = [value.strip().lower() for value in next(reader, [])]
+        for row_number, values in enumerate(reader, start=2):
+            if any(value.strip() for value in values):
+                yield row_number, _as_dict(header, values)
+
+
+def _as_dict(header, values):
+    """Asocia valores a la cabecera (las celdas faltantes quedan en None)"""
+    values = list(values) + [None] * (len(header) - len(values))
+    return dict(zip(header, values))
+
+
+def _sniff_delimiter(data):
+    """Detecta si el CSV usa coma o punto y coma (habitual en Excel en español)"""
+    first_line = data[:4096].split(b'\n', 1)[0]
+    return ';' if first_line.count(b';') > first_line.count(b',') else ','
+
+
+def _clean(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    value = str(value).strip()
+    return value or None
+
+
+def validate_row(raw):
+    """Normaliza y valida una fila. Devuelve ``(datos, errores)``"""
+    data = {column: _clean(raw.get(column)) for column in REQUIRED_COLUMNS + OPTIONAL_COLUMNS}
+    errors = []
+
+    if not data['nombre_completo']:
+        errors.append("El nombre completo es obligatorio")
+
+    if not data['dni']:
+        errors.append("El DNI es obligatorio")
+    else:
+        # Excel suele convertir el DNI en número ('12345678.0')
+        if data['dni'].endswith('.0'):
+            data['dni'] = data['dni'][:-2]
+        if not validate_dni(data['dni']):
+            errors.append("El formato del DNI no es válido")
+
+    if not data['fecha_nacimiento']:
+        errors.append("La fecha de nacimiento es obligatoria")
+    else:
+        for date_format in DATE_FORMATS:
+            try:
+                data['fecha_nacimiento'] = datetime.strptime(data['fecha_nacimiento'][:10], date_format).date().isoformat()
+                break
+            except ValueError:
+                continue
+        else:
+            errors.append("La fecha de nacimiento no es válida")
+
+    sexo = SEX_VALUES.get((data['sexo'] or '').lower())
+    if sexo:
+        data['sexo'] = sexo
+    else:
+        errors.append("El sexo debe ser M, F u Otro")
+
+    if data['email'] and not validate_email(data['email']):
+        errors.append("El formato del email no es válido")
+
+    if data['telefono'] and not validate_phone(data['telefono']):
+        errors.append("El formato del teléfono no es válido")
+
+    if data['grupo_sanguineo'] and data['grupo_sanguineo'].upper() not in BLOOD_GROUPS:
+        errors.append("El grupo sanguíneo no es válido")
+    elif data['grupo_sanguineo']:
+        data['grupo_sanguineo'] = data['grupo_sanguineo'].upper()
+
+    return data, errors
+
+
+def import_patients(db, data, filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Importa pacientes desde un CSV/XLSX en lotes transaccionales.
+
+    Es un generador: tras cada lote produce un dict con el avance
+    (``fila``, ``insertados``, ``errores``) y la lista de errores del lote
+    (``detalle``: tuplas ``(fila, dni, mensaje)``). Las filas inválidas o
+    duplicadas se informan sin detener la importación. Si el mismo archivo
+    ya se importó parcialmente, continúa tras la última fila confirmada.
+    """
+    import_key = file_key(data)
+    progress = db.start_import(import_key, filename)
+    resume_after = progress['filas_procesadas']
+
+    missing = None
+    batch = []
+    invalid = []
+    last_row = resume_after
+
+    def flush():
+        inserted, rejected = db.bulk_create_patients(
+            batch, import_key=import_key, last_row=last_row, invalid_rows=len(invalid)
+        )
+        report = {
+            'fila': last_row,
+            'insertados': inserted,
+            'errores': len(invalid) + len(rejected),
+            'detalle': invalid + rejected,
+        }
+        batch.clear()
+        invalid.clear()
+        return report
+
+    for row_number, raw in read_rows(data, filename):
+        if missing is None:
+            missing = [column for column in REQUIRED_COLUMNS if column not in raw]
+            if missing:
+                raise ValueError(f"Faltan columnas obligatorias: {', '.join(missing)}")
+
+        if row_number <= resume_after:
+            continue
+
+        row, errors = validate_row(raw)
+        if errors:
+            invalid.append((row_number, row['dni'], '; '.join(errors)))
+        else:
+            batch.append((row_number, row))
+        last_row = row_number
+
+        if len(batch) + len(invalid) >= chunk_size:
+            yield flush()
+
+    if batch or invalid:
+        yield flush()
+
+    db.finish_import(import_key)
+
+
+if __name__ == "__main__":
+    from database.db_manager import DatabaseManager
+
+    if len(sys.argv) < 2:
+        print("Uso: python utils/patient_import.py archivo.csv|archivo.xlsx [tamaño_lote]")
+        sys.exit(1)
+
+    path = sys.argv[1]
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_CHUNK_SIZE
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    total_inserted = total_errors = 0
+    for report in import_patients(DatabaseManager(), content, os.path.basename(path), chunk_size):
+        total_inserted += report['insertados']
+        total_errors += report['errores']
+        for row_number, dni, message in report['detalle']:
+            print(f"Fila {row_number} ({dni or 'sin DNI'}): {message}")
+        print(f"... hasta la fila {report['fila']}: {total_inserted} insertados, {total_errors} con errores")
@@ -0,0 +1,237 @@
+import functools
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+
+class Layout:
+    """Secuencia de llamadas de dibujo de FPDF que se prepara una vez y se repite en cada página.
+
+    Cualquier método que se llame sobre el layout (``cell``, ``set_font``,
+    ``ln``...) se graba con sus argumentos ya formateados; ``draw`` los
+    reproduce sobre un documento.
+    """
+
+    def __init__(self):
+        self.ops = []
+
+    def __getattr__(self, method):
+        if method.startswith('__'):
+            raise AttributeError(method)
+
+        def record(*args, **kwargs):
+            self.ops.append((method, args, kwargs))
+        return record
+
+    def draw(self, pdf):
+        for method, args, kwargs in self.ops:
+            getattr(pdf, method)(*args, **kwargs)
+
+
+class DocumentTemplate:
+    """Parte fija de un documento: encabezado de la clínica, título y esqueletos de tablas"""
+
+    def __init__(self, title, clinic_config=None):
+        self.header = Layout()
+        self.sections = {}
+
+        if clinic_config:
+            logo_path = clinic_config.get('logo_path')
+            if logo_path and os.path.exists(logo_path):
+                self.header.image(logo_path, 10, 8, 25)
+            self.header.set_font('Arial', 'B', 16)
+            self.header.cell(0, 10, clinic_config.get('nombre_clinica') or 'CLINICA MEDICA', 0, 1, 'C')
+            self.header.set_font('Arial', '', 10)
+            self.header.cell(0, 6, clinic_config.get('direccion') or '', 0, 1, 'C')
+            self.header.cell(0, 6, f"Tel: {clinic_config.get('telefono') or ''}", 0, 1, 'C')
+            self.header.ln(10)
+            self.header.set_font('Arial', 'B', 14)
+            self.header.cell(0, 10, title, 0, 1, 'C')
+            self.header.ln(5)
+        else:
+            self.header.set_font('Arial', 'B', 16)
+            self.header.cell(0, 10, title, 0, 1, 'C')
+            self.header.ln(10)
+
+    def section(self, name):
+        """Layout con nombre para una parte fija que va en medio del documento"""
+        return self.sections.setdefault(name, Layout())
+
+    def new_page(self, pdf):
+        """Añade una página al documento con la parte fija ya dibujada"""
+        pdf.add_page()
+        self.header.draw(pdf)
+
+
+# Facturas que renderiza cada proceso por tarea en los lotes en paralelo
+BATCH_CHUNK_SIZE = 200
+
+
+def _config_key(clinic_config):
+    """Clave hashable de la configuración, para cachear las plantillas"""
+    if not clinic_config:
+        return None
+    return tuple(sorted((key, value) for key, value in clinic_config.items() if key != 'id'))
+
+
+@functools.lru_cache(maxsize=16)
+def _template(kind, config_key):
+    clinic_config = dict(config_key) if config_key else None
+
+    if kind == 'receta':
+        return DocumentTemplate('RECETA MEDICA', clinic_config)
+
+    template = DocumentTemplate('FACTURA', clinic_config)
+    table = template.section('detalle')
+    table.set_font('Arial', 'B', 10)
+    table.cell(80, 8, 'Descripcion', 1, 0, 'C')
+    table.cell(40, 8, 'Metodo Pago', 1, 0, 'C')
+    table.cell(30, 8, 'Monto', 1, 1, 'C')
+    return template
+
+
+def get_template(kind, clinic_config=None):
+    """Plantilla cacheada (``'receta'`` o ``'factura'``) para una configuración de clínica"""
+    return _template(kind, _config_key(clinic_config))
+
+
+def new_document():
+    """Documento FPDF vacío"""
+    from fpdf import FPDF
+
+    return FPDF()
+
+
+def to_bytes(pdf):
+    """Serializa el documento (compatible con fpdf y fpdf2)"""
+    output = pdf.output(dest='S')
+    return output.encode('latin1') if isinstance(output, str) else bytes(output)
+
+
+def _field(pdf, label, value):
+    pdf.set_font('Arial', 'B', 10)
+    pdf.cell(40, 6, label, 0, 0)
+    pdf.set_font('Arial', '', 10)
+    pdf.cell(0, 6, str(value), 0, 1)
+
+
+def stamp_prescription(pdf, template, patient_data, doctor_data, prescription_data):
+    """Dibuja una receta en una página nueva de ``pdf``"""
+    template.new_page(pdf)
+
+    # Información del doctor
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(0, 8, f"Dr. {doctor_data['nombre_completo']}", 0, 1)
+    pdf.set_font('Arial', '', 10)
+    pdf.cell(0, 6, f"Especialidad: {doctor_data['especialidad']}", 0, 1)
+    pdf.ln(5)
+
+    # Información del paciente
+    _field(pdf, 'Paciente:', patient_data['nombre_completo'])
+    _field(pdf, 'DNI:', patient_data['dni'])
+    _field(pdf, 'Fecha:', datetime.now().strftime('%d/%m/%Y'))
+    pdf.ln(10)
+
+    # Prescripción
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(0, 8, 'PRESCRIPCION:', 0, 1)
+    pdf.set_font('Arial', '', 10)
+    for line in prescription_data['receta'].split('\n'):
+        pdf.cell(0, 6, line, 0, 1)
+
+
+def stamp_invoice(pdf, template, payment_data, patient_data):
+    """Dibuja una factura en una página nueva de ``pdf``"""
+    template.new_page(pdf)
+
+    # Información del paciente
+    _field(pdf, 'Cliente:', patient_data['nombre_completo'])
+    _field(pdf, 'DNI:', patient_data['dni'])
+    _field(pdf, 'Fecha:', datetime.now().strftime('%d/%m/%Y'))
+    pdf.ln(10)
+
+    # Detalles del pago
+    template.section('detalle').draw(pdf)
+    pdf.set_font('Arial', '', 10)
+    pdf.cell(80, 8, 'Consulta Medica', 1, 0)
+    pdf.cell(40, 8, payment_data['metodo_pago'].title(), 1, 0, 'C')
+    pdf.cell(30, 8, f"${payment_data['monto']:.2f}", 1, 1, 'R')
+
+    # Total
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(120, 10, 'TOTAL:', 1, 0, 'R')
+    pdf.cell(30, 10, f"${payment_data['monto']:.2f}", 1, 1, 'R')
+
+
+def render_prescription(patient_data, doctor_data, prescription_data, clinic_config=None):
+    """Genera una receta médica en PDF"""
+    pdf = new_document()
+    stamp_prescription(pdf, get_template('receta', clinic_config), patient_data, doctor_data, prescription_data)
+    return to_bytes(pdf)
+
+
+def render_invoice(payment_data, patient_data, clinic_config):
+    """Genera una factura en PDF"""
+    pdf = new_document()
+    stamp_invoice(pdf, get_template('factura', clinic_config), payment_data, patient_data)
+    return to_bytes(pdf)
+
+
+def _render_invoice_chunk(chunk, config_key):
+    """Renderiza un bloque de facturas en un proceso del pool (la plantilla se cachea por proceso)"""
+    template = _template('factura', config_key)
+    documents = []
+    for payment_data, patient_data in chunk:
+        pdf = new_document()
+        stamp_invoice(pdf, template, payment_data, patient_data)
+        documents.append((f"factura_{payment_data['id']}.pdf", to_bytes(pdf)))
+    return documents
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def render_invoices_zip(invoices, clinic_config, workers=None, chunk_size=BATCH_CHUNK_SIZE):
+    """Genera un ZIP con una factura por pago repartiendo el trabajo entre procesos.
+
+    ``invoices`` puede ser un generador: se consume por bloques de
+    ``chunk_size`` y cada PDF se escribe en el ZIP en cuanto llega, así que
+    ni los datos ni el resultado se tienen completos en memoria. Devuelve
+    ``(archivo, cantidad)``, con el archivo temporal ya posicionado al inicio.
+    """
+    config_key = _config_key(clinic_config)
+    workers = workers or os.cpu_count() or 1
+    output = tempfile.TemporaryFile()
+    count = 0
+
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        # spawn: un fork desde el servidor (con hilos y conexiones SQLite abiertas) puede quedar bloqueado
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            pending = []
+            for chunk in _chunks(invoices, chunk_size):
+                pending.append(executor.submit(_render_invoice_chunk, chunk, config_key))
+                # Limitar los bloques en vuelo para no acumular resultados
+                if len(pending) > workers * 2:
+                    count += _write_documents(archive, pending.pop(0).result())
+            for future in pending:
+                count += _write_documents(archive, future.result())
+
+    output.seek(0)
+    return output, count
+
+
+def _write_documents(archive, documents):
+    for filename, data in documents:
+        archive.writestr(filename, data)
+    return len(documents)
@@ -0,0 +1,149 @@
+import gc
+import json
+import threading
+from urllib.parse import urlparse
+
+import streamlit as st
+from database import sessions
+from database.db_manager import DatabaseManager
+
+# Cookie HttpOnly con el token de sesión persistente (el navegador la envía, JavaScript no puede leerla)
+SESSION_COOKIE = "clinica_sesion"
+ENDPOINT = "_clinica/sesion"
+
+# Versiones de Streamlit con las que se verificó el acceso a su aplicación Tornado
+# (``st.context.cookies`` existe desde 1.37); fuera de este rango no se recuerda la sesión
+SUPPORTED_STREAMLIT = ((1, 37), (2, 0))
+
+_install_lock = threading.Lock()
+_installed = None  # None: todavía no se intentó; True/False: resultado del único intento
+
+
+def endpoint_path():
+    """Ruta del endpoint de la cookie, respetando server.baseUrlPath"""
+    base = (st.get_option("server.baseUrlPath") or "").strip("/")
+    return "/" + "/".join(part for part in (base, ENDPOINT) if part)
+
+
+def _make_handler():
+    import tornado.web
+
+    class SessionCookieHandler(tornado.web.RequestHandler):
+        """Fija (POST) o borra (DELETE) la cookie de sesión.
+
+        Streamlit no puede escribir cookies HttpOnly desde Python, así que la
+        página envía el token una sola vez a este endpoint, en el cuerpo de
+        la petición y nunca en la URL.
+        """
+
+        def check_xsrf_cookie(self):
+            # Se exige en su lugar que la petición venga del mismo origen
+            pass
+
+        def _same_origin(self):
+            origin = self.request.headers.get("Origin")
+            return bool(origin) and urlparse(origin).netloc == self.request.host
+
+        def _secure(self):
+            proto = self.request.headers.get("X-Forwarded-Proto", self.request.protocol)
+            return proto.split(",")[0].strip() == "https"
+
+        def post(self):
+            token = self.request.body.decode("utf-8", "replace").strip()
+            if not self._same_origin() or DatabaseManager().validate_session(token) is None:
+                raise tornado.web.HTTPError(403)
+
+            self.set_cookie(
+                SESSION_COOKIE, token, path="/",
+                max_age=int(sessions.SESSION_TTL_HOURS * 3600),
+                httponly=True, secure=self._secure(), samesite="Strict"
+            )
+            self.set_status(204)
+
+        def delete(self):
+            if not self._same_origin():
+                raise tornado.web.HTTPError(403)
+            self.clear_cookie(SESSION_COOKIE, path="/")
+            self.set_status(204)
+
+    return SessionCookieHandler
+
+
+def _streamlit_supported():
+    try:
+        version = tuple(int(part) for part in st.__version__.split(".")[:2])
+    except (AttributeError, ValueError):
+        return False
+    low, high = SUPPORTED_STREAMLIT
+    return low <= version < high
+
+
+def _find_apps():
+    try:
+        import tornado.web
+    except ImportError:
+        return []
+    return [
+        obj for obj in gc.get_objects()
+        if isinstance(obj, tornado.web.Application) and hasattr(obj, "wildcard_router")
+    ]
+
+
+def install_endpoint():
+    """Registra el endpoint en el servidor Tornado de Streamlit (una vez por proceso).
+
+    Devuelve False si no hay un servidor en ejecución (por ejemplo, en scripts)
+    o si la versión de Streamlit no es compatible. El resultado se recuerda: el
+    recorrido del heap en busca del servidor se hace una sola vez.
+    """
+    global _installed
+    with _install_lock:
+        if _installed is not None:
+            return _installed
+
+        _installed = False
+        if not _streamlit_supported():
+            return False
+
+        apps = _find_apps()
+        if not apps:
+            return False
+
+        from tornado.routing import PathMatches, Rule
+        rule = Rule(PathMatches(endpoint_path() + "$"), _make_handler())
+        for app in apps:
+            # Delante de la ruta comodín de archivos estáticos de Streamlit
+            app.wildcard_router.rules.insert(0, rule)
+        _installed = True
+        return True
+
+
+def _send(method, body=None):
+    """Ejecuta la petición al endpoint desde el navegador (iframe invisible del mismo origen)"""
+    import streamlit.components.v1 as components
+
+    options = {"method": method, "credentials": "same-origin"}
+    if body is not None:
+        options["body"] = body
+    components.html(
+        f"<script>fetch({json.dumps(endpoint_path())}, {json.dumps(options)});</script>",
+        height=0
+    )
+
+
+def set_session_cookie(token):
+    """Guarda el token en la cookie HttpOnly"""
+    _send("POST", token)
+
+
+def clear_session_cookie():
+    """Borra la cookie de sesión"""
+    _send("DELETE")
+
+
+def get_session_cookie():
+    """Token de la cookie de la petición inicial, si existe"""
+    cookies = getattr(getattr(st, "context", None), "cookies", None)
+    if cookies:
+        return cookies.get(SESSION_COOKIE)
+    return None
@@ -0,0 +1,78 @@
+import os
+import sys
+
+# Permitir ejecutar este archivo directamente (python utils/user_provisioning.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.helpers import validate_email
+from utils.patient_import import read_rows
+
+REQUIRED_COLUMNS = ['username', 'email', 'password', 'rol', 'nombre_completo']
+ROLES = {'administrador', 'doctor', 'recepcionista', 'paciente'}
+
+
+def validate_user(raw):
+    """Normaliza y valida un usuario. Devuelve ``(datos, errores)``"""
+    data = {column: str(raw.get(column) or '').strip() for column in REQUIRED_COLUMNS + ['especialidad']}
+    data['especialidad'] = data['especialidad'] or None
+    data['rol'] = data['rol'].lower()
+    errors = []
+
+    for column in REQUIRED_COLUMNS:
+        if not data[column]:
+            errors.append(f"El campo {column} es obligatorio")
+
+    if data['email'] and not validate_email(data['email']):
+        errors.append("El formato del email no es válido")
+
+    if data['rol'] and data['rol'] not in ROLES:
+        errors.append(f"El rol debe ser uno de: {', '.join(sorted(ROLES))}")
+
+    if data['rol'] == 'doctor' and not data['especialidad']:
+        errors.append("Los doctores deben tener especialidad")
+
+    return data, errors
+
+
+def provision_users(db, data, filename, rounds=None, workers=None):
+    """Crea los usuarios de un CSV/XLSX en una sola transacción.
+
+    Devuelve ``(insertados, [(fila, username, mensaje), ...])``.
+    """
+    users = []
+    row_numbers = []
+    errors = []
+
+    for row_number, raw in read_rows(data, filename):
+        missing = [column for column in REQUIRED_COLUMNS if column not in raw]
+        if missing:
+            raise ValueError(f"Faltan columnas obligatorias: {', '.join(missing)}")
+
+        user, user_errors = validate_user(raw)
+        if user_errors:
+            errors.append((row_number, user['username'], '; '.join(user_errors)))
+        else:
+            users.append(user)
+            row_numbers.append(row_number)
+
+    inserted, rejected = db.bulk_create_users(users, rounds=rounds, workers=workers)
+    errors.extend((row_numbers[index], username, message) for index, username, message in rejected)
+    return inserted, sorted(errors)
+
+
+if __name__ == "__main__":
+    from database.db_manager import DatabaseManager
+
+    if len(sys.argv) < 2:
+        print("Uso: python utils/user_provisioning.py usuarios.csv|usuarios.xlsx [procesos]")
+        sys.exit(1)
+
+    path = sys.argv[1]
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    inserted, errors = provision_users(DatabaseManager(), content, os.path.basename(path), workers=workers)
+    for row_number, username, message in errors:
+        print(f"Fila {row_number} ({username or 'sin usuario'}): {message}")
+    print(f"{inserted} usuarios creados, {len(errors)} con errores")